@@ -1,9 +1,12 @@
 from __future__ import unicode_literals, print_function
 
-import json
+import sys
 import argparse
 import threading
 
+# The startup profiler is imported first so that it can time
+# importing the rest of the aws-shell.
+from awsshell.startup import PROFILER
 from awsshell import shellcomplete
 from awsshell import autocomplete
 from awsshell import app
@@ -13,16 +16,25 @@ from awsshell.index import completion
 from awsshell import utils
 
 
+PROFILER.record_since_start('imports')
 __version__ = '0.2.2'
 
 
 def determine_doc_index_filename():
-    import awscli
-    base = loaders.JSONIndexLoader.index_filename(
-        awscli.__version__)
+    base = loaders.JSONIndexLoader.index_filename(utils.AWSCLI_VERSION)
     return base + '.docs'
 
 
+def _write_doc_index_in_background(doc_db, on_write=None):
+    # makeindex imports docutils and the awscli driver, so it's only
+    # imported on the thread that builds the docs.
+    from awsshell.makeindex import write_doc_index, load_command_usage
+    # The docs of the commands the user runs most are rendered first.
+    command_usage = load_command_usage(utils.build_config_file_path('history'))
+    write_doc_index(db=doc_db, compress=True, on_write=on_write,
+                    command_usage=command_usage)
+
+
 def load_index(filename):
     load = loaders.JSONIndexLoader()
     return load.load_index(filename)
@@ -32,41 +44,86 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', '--profile', help='The profile name to use '
                         'when starting the AWS Shell.')
+    parser.add_argument('--startup-report', nargs='?', const='exit',
+                        choices=['exit', 'continue'],
+                        help='Time each phase of startup and print a report. '
+                        'The shell exits after printing the report unless '
+                        '"continue" is specified.')
+    parser.add_argument('--startup-report-format', default='text',
+                        choices=['text', 'json'],
+                        help='The format of the startup report.')
     args = parser.parse_args()
+    PROFILER.enabled = args.startup_report is not None
 
-    indexer = completion.CompletionIndex()
-    try:
-        index_str = indexer.load_index(utils.AWSCLI_VERSION)
-        index_data = json.loads(index_str)
-    except completion.IndexLoadError:
-        print("First run, creating autocomplete index...")
-        from awsshell.makeindex import write_index
-        # TODO: Using internal method, but this will eventually
-        # be moved into the CompletionIndex class anyways.
-        index_file = indexer._filename_for_version(utils.AWSCLI_VERSION)
-        write_index(index_file)
-        index_str = indexer.load_index(utils.AWSCLI_VERSION)
-        index_data = json.loads(index_str)
+    # The index is loaded once and shared by the completer and the lexer.
+    # It's loaded (or created) in the background after the shell is
+    # created so the prompt isn't held up waiting for it.
+    index_provider = completion.IndexProvider()
     doc_index_file = determine_doc_index_filename()
-    from awsshell.makeindex import write_doc_index
-    doc_data = docs.load_lazy_doc_index(doc_index_file)
-    # There's room for improvement here.  If the docs didn't finish
-    # generating, we regen the whole doc index.  Ideally we pick up
-    # from where we left off.
-    try:
-        docs.load_doc_db(doc_index_file)['__complete__']
-    except KeyError:
+
+    def on_docs_rendered(dot_cmds):
+        doc_data.invalidate(dot_cmds)
+        shell.refresh_docs()
+
+    with PROFILER.phase('doc_db_open'):
+        # If the docs didn't finish generating, the doc index build
+        # resumes from the last service it completed.  Any docs that
+        # were already generated are available in the meantime, and
+        # commands the build hasn't reached yet are rendered as soon
+        # as the help pane needs them.
+        # The doc db is shared by the help pane, the doc index build
+        # and the on demand doc renderer, each on their own thread.
+        doc_db = docs.load_doc_db(doc_index_file)
+        docs_complete = ('__complete__' in doc_db and
+                         docs.SEARCH_COMPLETE_KEY in doc_db)
+        render_missing = None
+        if not docs_complete:
+            render_missing = docs.DocRenderer(
+                doc_db, on_rendered=on_docs_rendered, compress=True).render
+        doc_data = docs.DocRetriever(doc_db, render_missing=render_missing)
+    if not docs_complete:
         print("Creating doc index in the background. "
               "It will be a few minutes before all documentation is "
               "available.")
-        t = threading.Thread(target=write_doc_index, args=(doc_index_file,))
+        # The help pane may have cached that a command has no docs,
+        # which is no longer true once the build writes them.
+        t = threading.Thread(target=_write_doc_index_in_background,
+                             args=(doc_db, doc_data.invalidate))
         t.daemon = True
         t.start()
-    model_completer = autocomplete.AWSCLIModelCompleter(index_data)
-    completer = shellcomplete.AWSShellCompleter(model_completer)
-    shell = app.create_aws_shell(completer, model_completer, doc_data)
+    model_completer = autocomplete.AWSCLIModelCompleter()
+    completer = shellcomplete.AWSShellCompleter(
+        model_completer, index_provider=index_provider)
+    shell_input, shell_output = None, None
+    if args.startup_report == 'exit' and not (
+            sys.stdin.isatty() and sys.stdout.isatty()):
+        # We won't be prompting, but the cli still needs a terminal
+        # to be constructed, e.g when the report is generated in CI.
+        from prompt_toolkit.input import PipeInput
+        from prompt_toolkit.output import DummyOutput
+        shell_input, shell_output = PipeInput(), DummyOutput()
+    shell = app.create_aws_shell(completer, model_completer, doc_data,
+                                 index_provider=index_provider,
+                                 input=shell_input, output=shell_output)
     if args.profile:
         shell.profile = args.profile
+    index_loader = index_provider.load_in_background(
+        on_status_change=shell.invalidate)
+    if PROFILER.enabled:
+        # The cli is normally created lazily by run(), create it
+        # up front so its construction is included in the report.
+        shell.cli
+        PROFILER.record_since_start('time_to_prompt')
+        if args.startup_report == 'exit':
+            # Include loading the index in the report.
+            index_loader.join()
+        PROFILER.enabled = False
+        print(PROFILER.format_report(
+            args.startup_report_format,
+            extra={'aws_shell_version': __version__,
+                   'awscli_version': utils.AWSCLI_VERSION}))
+        if args.startup_report == 'exit':
+            return
     shell.run()
 
 
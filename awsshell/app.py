@@ -24,6 +24,9 @@ from awsshell.config import Config
 from awsshell.keys import KeyManager
 from awsshell.style import StyleFactory
 from awsshell.toolbar import Toolbar
+from awsshell.lexer import DeferredLexer
+from awsshell.index.completion import IndexProvider
+from awsshell.startup import PROFILER
 from awsshell.utils import build_config_file_path, temporary_file
 from awsshell import compat
 
@@ -32,8 +35,10 @@ LOG = logging.getLogger(__name__)
 EXIT_REQUESTED = object()
 
 
-def create_aws_shell(completer, model_completer, docs):
-    return AWSShell(completer, model_completer, docs)
+def create_aws_shell(completer, model_completer, docs, index_provider=None,
+                     input=None, output=None):
+    return AWSShell(completer, model_completer, docs, input=input,
+                    output=output, index_provider=index_provider)
 
 
 class InputInterrupt(Exception):
@@ -146,6 +151,36 @@ class ProfileHandler(object):
             self._err.write("Usage:\n%s\n" % self.USAGE)
 
 
+class SearchHandler(object):
+    USAGE = (
+        '.search <terms>    # Search the docs for AWS CLI commands\n'
+    )
+    MAX_RESULTS = 10
+
+    def __init__(self, output=sys.stdout, err=sys.stderr):
+        self._output = output
+        self._err = err
+
+    def run(self, command, application):
+        """Print the commands whose docs best match the search terms.
+
+        Each command is printed with the part of its description that
+        matches the terms.
+        """
+        if len(command) < 2:
+            self._err.write("Usage:\n%s\n" % self.USAGE)
+            return
+        terms = command[1:]
+        results = application.docs.search(terms, limit=self.MAX_RESULTS)
+        if not results:
+            self._output.write("No commands found matching: %s\n" %
+                               ' '.join(terms))
+            return
+        for dot_cmd, snippet in results:
+            self._output.write("%s\n    %s\n" % (
+                ' '.join(dot_cmd.split('.')), ' '.join(snippet.split())))
+
+
 class ExitHandler(object):
     def run(self, command, application):
         return EXIT_REQUESTED
@@ -156,6 +191,7 @@ class DotCommandHandler(object):
         'edit': EditHandler,
         'profile': ProfileHandler,
         'cd': ChangeDirHandler,
+        'search': SearchHandler,
         'exit': ExitHandler,
         'quit': ExitHandler,
     }
@@ -222,14 +258,24 @@ class AWSShell(object):
     :type theme: str
     :param theme: The pygments theme.
 
+    :type index_provider: :class:`awsshell.index.completion.IndexProvider`
+    :param index_provider: Provides the completion index used for syntax
+        highlighting.  This should be the same provider used to create the
+        model completer so the index is only loaded once.
+
     """
 
     def __init__(self, completer, model_completer, docs,
-                 input=None, output=None, popen_cls=None):
+                 input=None, output=None, popen_cls=None,
+                 index_provider=None):
         self.completer = completer
         self.model_completer = model_completer
+        if index_provider is None:
+            index_provider = IndexProvider()
+        self._index_provider = index_provider
         self.history = InMemoryHistory()
-        self.file_history = FileHistory(build_config_file_path('history'))
+        with PROFILER.phase('history_load'):
+            self.file_history = FileHistory(build_config_file_path('history'))
         self._cli = None
         self._docs = docs
         self.current_docs = u''
@@ -258,7 +304,8 @@ class AWSShell(object):
     def load_config(self):
         """Load the config from the config file or template."""
         config = Config()
-        self.config_obj = config.load('awsshellrc')
+        with PROFILER.phase('config_load'):
+            self.config_obj = config.load('awsshellrc')
         self.config_section = self.config_obj['aws-shell']
         self.model_completer.match_fuzzy = self.config_section.as_bool(
             'match_fuzzy')
@@ -286,6 +333,10 @@ class AWSShell(object):
             self.refresh_cli = False
         return self._cli
 
+    @property
+    def docs(self):
+        return self._docs
+
     def run(self):
         while True:
             try:
@@ -334,10 +385,16 @@ class AWSShell(object):
         raise InputInterrupt
 
     def create_layout(self, display_completions_in_columns, toolbar):
-        from awsshell.lexer import ShellLexer
-        lexer = ShellLexer
         if self.config_section['theme'] == 'none':
             lexer = None
+        elif self._index_provider.is_loading():
+            # Don't wait for the index to load, start highlighting
+            # once the lexer has been created in the background.
+            provider = self._index_provider
+            lexer = DeferredLexer(
+                lambda: None if provider.is_loading() else provider.lexer())
+        else:
+            lexer = self._index_provider.lexer()
         return create_default_layout(
             self, u'aws> ', lexer=lexer, reserve_space_for_menu=True,
             display_completions_in_columns=display_completions_in_columns,
@@ -373,6 +430,8 @@ class AWSShell(object):
 
             """
             self.model_completer.match_fuzzy = match_fuzzy
+            if self.completer is not None:
+                self.completer.invalidate_cache()
 
         def set_enable_vi_bindings(enable_vi_bindings):
             """Setter for vi mode keybindings.
@@ -419,7 +478,8 @@ class AWSShell(object):
             lambda: self.model_completer.match_fuzzy,
             lambda: self.enable_vi_bindings,
             lambda: self.show_completion_columns,
-            lambda: self.show_help)
+            lambda: self.show_help,
+            lambda: self._index_provider.status)
         style_factory = StyleFactory(self.theme)
         buffers = {
             'clidocs': Buffer(read_only=True)
@@ -430,9 +490,12 @@ class AWSShell(object):
         else:
             editing_mode = EditingMode.EMACS
 
+        with PROFILER.phase('layout'):
+            layout = self.create_layout(display_completions_in_columns,
+                                        toolbar)
         return Application(
             editing_mode=editing_mode,
-            layout=self.create_layout(display_completions_in_columns, toolbar),
+            layout=layout,
             mouse_support=False,
             style=style_factory.style,
             buffers=buffers,
@@ -475,6 +538,21 @@ class AWSShell(object):
         )
         cli.request_redraw()
 
+    def invalidate(self):
+        """Redraw the cli, if it exists.  Safe to call from any thread."""
+        if self._cli is not None:
+            self._cli.invalidate()
+
+    def refresh_docs(self):
+        """Update the help pane, e.g once the docs it's missing are written.
+
+        Safe to call from any thread.
+        """
+        cli = self._cli
+        if cli is not None:
+            cli.eventloop.call_from_executor(
+                lambda: self.on_input_timeout(cli))
+
     def create_cli_interface(self, display_completions_in_columns):
         # A CommandLineInterface from prompt_toolkit
         # accepts two things: an application and an
@@ -483,8 +561,10 @@ class AWSShell(object):
         app = self.create_application(self.completer,
                                       self.file_history,
                                       display_completions_in_columns)
-        cli = CommandLineInterface(application=app, eventloop=loop,
-                                   input=self._input, output=self._output)
+        with PROFILER.phase('cli_construction'):
+            cli = CommandLineInterface(application=app, eventloop=loop,
+                                       input=self._input,
+                                       output=self._output)
         return cli
 
     @property
@@ -1,6 +1,37 @@
 from __future__ import print_function
-from awsshell.fuzzy import fuzzy_search
-from awsshell.substring import substring_search
+import re
+
+from awsshell.fuzzy import FuzzyCorpus, FuzzySession
+from awsshell.substring import PrefixIndex
+from awsshell.utils import LRUCache
+
+
+# A word of the command line and the whitespace that follows it.
+_WORD_REGEX = re.compile(r'(\S+)(\s*)', re.UNICODE)
+
+
+class _CompletionContext(object):
+    """The values completed for a command, computed once per command.
+
+    :type commands: list
+    :param commands: The subcommands of the command.
+
+    :type arguments: list
+    :param arguments: The arguments of the command followed by the
+        global options, in the order they're fuzzy searched.
+
+    """
+    def __init__(self, node, global_options):
+        self.commands = node['commands']
+        arguments = node['arguments']
+        if arguments != global_options:
+            arguments = arguments + global_options
+        self.arguments = arguments
+        self.command_index = PrefixIndex(self.commands)
+        self.argument_index = PrefixIndex(self.arguments)
+        # The sessions narrow the matches as a word is typed.
+        self.fuzzy_commands = FuzzySession(FuzzyCorpus(self.commands))
+        self.fuzzy_arguments = FuzzySession(FuzzyCorpus(self.arguments))
 
 
 class AWSCLIModelCompleter(object):
@@ -8,22 +39,46 @@ class AWSCLIModelCompleter(object):
 
     This class consumes indexed data based on the JSON models from
     AWS service (which we pull through botocore's data loaders).
+    The index data can either be the decoded JSON index or a
+    :class:`awsshell.index.packed.PackedIndex`, in which case
+    only the commands that are actually traversed are decoded.
+
+    If no index data is given, nothing is completed until an index
+    is provided with :meth:`load_index`.
+
+    The values completed for a command are computed the first time the
+    command is entered and cached, for at most ``context_cache_size``
+    commands.
 
     """
-    def __init__(self, index_data, match_fuzzy=True):
-        self._index = index_data
+    CONTEXT_CACHE_SIZE = 64
+
+    def __init__(self, index_data=None, match_fuzzy=True,
+                 context_cache_size=CONTEXT_CACHE_SIZE):
         self._root_name = 'aws'
+        self._current_line = ''
+        self._current_word = ''
+        self._completions = []
+        self.match_fuzzy = match_fuzzy
+        self._contexts = LRUCache(context_cache_size)
+        self.load_index(index_data)
+
+    def load_index(self, index_data):
+        """Replace the index data used for completions.
+
+        This also resets the completion state.
+        """
+        if index_data is None:
+            index_data = {self._root_name: {
+                'arguments': [], 'argument_metadata': {},
+                'commands': [], 'children': {}}}
+        self._index = index_data
         self._global_options = index_data[self._root_name]['arguments']
+        self._contexts.clear()
         # These values mutate as autocompletions occur.
         # They track state to improve the autocompletion speed.
-        self._current_name = 'aws'
-        self._current = index_data[self._root_name]
-        self._last_position = 0
-        self._current_line = ''
-        self.last_option = ''
-        # This will get populated as a command is completed.
-        self.cmd_path = [self._current_name]
-        self.match_fuzzy = match_fuzzy
+        # cmd_path will get populated as a command is completed.
+        self.reset()
 
     @property
     def global_arg_metadata(self):
@@ -42,9 +97,51 @@ class AWSCLIModelCompleter(object):
         self._last_position = 0
         self.last_option = ''
         self.cmd_path = [self._current_name]
+        self._context = None
+
+    def _enter_command(self, name, node):
+        self._current = node
+        self._current_name = name
+        self.cmd_path.append(name)
+        self._context = None
+
+    def _get_context(self):
+        # The context of the current command is looked up once when
+        # it's first needed and then kept until the command changes.
+        if self._context is None:
+            key = tuple(self.cmd_path)
+            context = self._contexts.get(key)
+            if context is None:
+                context = _CompletionContext(self._current,
+                                             self._global_options)
+                self._contexts.put(key, context)
+            self._context = context
+        return self._context
 
     def autocomplete(self, line):
         """Given a line, return a list of suggestions."""
+        self.parse(line)
+        return self.complete()
+
+    def parse(self, line):
+        """Update the completion state for a line without completing it.
+
+        The completions are only searched for when :meth:`complete` is
+        called, so callers that already have the completions of the
+        new state don't need to search for them again.
+        """
+        self._completions = self._update(line)
+
+    def complete(self):
+        """Return the suggestions for the last line parsed."""
+        if self._completions is None:
+            return self._search(self._current_word)
+        return self._completions
+
+    def _update(self, line):
+        # Updates the state for the line.  The completions are returned
+        # if they're known without searching, otherwise None is returned
+        # and self._current_word is the word to search for.
         current_length = len(line)
         self._current_line = line
         if current_length == 1 and self._last_position > 1:
@@ -88,9 +185,7 @@ class AWSCLIModelCompleter(object):
             if not last_word.startswith('-'):
                 next_command = self._current['children'].get(last_word)
                 if next_command is not None:
-                    self._current = next_command
-                    self._current_name = last_word
-                    self.cmd_path.append(self._current_name)
+                    self._enter_command(last_word, next_command)
             elif last_word in self.arg_metadata and \
                     self.arg_metadata[last_word]['example']:
                 # Then this is an arg with a shorthand example so we'll
@@ -100,42 +195,66 @@ class AWSCLIModelCompleter(object):
             # autocomplete all the commands for the current context
             # in either of the above two cases.
             return self._current['commands'][:]
-        elif last_word.startswith('-'):
-            # TODO: cache this for the duration of the current context.
-            # We don't need to recompute this until the args are
-            # different.
-            all_args = self._get_all_args()
+        self._current_word = last_word
+        return None
+
+    def _search(self, word):
+        context = self._get_context()
+        if word.startswith('-'):
             if self.match_fuzzy:
-                return fuzzy_search(last_word, all_args)
+                return context.fuzzy_arguments.search(word)
             else:
-                return substring_search(last_word, all_args)
+                return context.argument_index.search(word)
         if self.match_fuzzy:
-            return fuzzy_search(last_word, self._current['commands'])
+            return context.fuzzy_commands.search(word)
         else:
-            return substring_search(last_word, self._current['commands'])
-
-    def _get_all_args(self):
-        if self._current['arguments'] != self._global_options:
-            all_args = self._current['arguments'] + self._global_options
-        else:
-            all_args = self._current['arguments']
-        return all_args
+            return context.command_index.search(word)
 
     def _handle_backspace(self):
         return self._complete_from_full_parse()
 
     def _complete_from_full_parse(self):
         # We try to avoid calling this, but this is necessary
-        # sometimes.  In this scenario, we're resetting everything
-        # and starting from the very beginning and reparsing
-        # everything.
-        # This is a naive implementation for now.  This
-        # can be optimized.
+        # sometimes, e.g after a backspace or a paste.  In this
+        # scenario, we're resetting everything and reparsing the line
+        # from the beginning.  The state is rebuilt as if autocomplete()
+        # had been called with each prefix of the line in turn, but the
+        # words are only walked once, and only the full line is
+        # completed.
         self.reset()
         line = self._current_line
-        for i in range(1, len(self._current_line)):
-            self.autocomplete(line[:i])
-        return self.autocomplete(line)
+        self._parse(line[:-1])
+        self._last_position = max(len(line) - 1, 0)
+        return self._update(line)
+
+    def _parse(self, text):
+        max_option_length = self._max_option_length()
+        for match in _WORD_REGEX.finditer(text):
+            word, whitespace = match.groups()
+            # Typing a word character by character records any prefix
+            # of it that's an option, the longest one being recorded
+            # last.
+            for length in range(min(len(word), max_option_length), 0, -1):
+                if self._is_option(word[:length]):
+                    self.last_option = word[:length]
+                    break
+            # Then each whitespace character after the word checks
+            # the word again, and a space traverses into the command.
+            for char in whitespace:
+                if self._is_option(word):
+                    self.last_option = word
+                if char == ' ' and not word.startswith('-'):
+                    next_command = self._current['children'].get(word)
+                    if next_command is not None:
+                        self._enter_command(word, next_command)
+                        max_option_length = self._max_option_length()
+
+    def _is_option(self, word):
+        return word in self.arg_metadata or word in self._global_options
+
+    def _max_option_length(self):
+        return max([0] + [len(name) for name in self.arg_metadata] +
+                   [len(name) for name in self._global_options])
 
     def _autocomplete_options(self, last_word):
         global_args = []
@@ -1,4 +1,5 @@
 from __future__ import print_function
+import os
 import sys
 import platform
 
@@ -12,11 +13,17 @@ if PY3:
     text_type = str
     from io import StringIO
     import dbm
+    import queue
+    from collections.abc import Mapping
+    from urllib.request import pathname2url
 else:
     from HTMLParser import HTMLParser
     text_type = unicode
     from cStringIO import StringIO
     import anydbm as dbm
+    import Queue as queue
+    from collections import Mapping
+    from urllib import pathname2url
 
 
 if ON_WINDOWS:
@@ -25,3 +32,14 @@ if ON_WINDOWS:
 else:
     def default_editor():
         return 'vi'
+
+
+if PY3:
+    replace_file = os.replace
+else:
+    def replace_file(src, dst):
+        # os.rename() already replaces an existing file atomically,
+        # except on Windows.
+        if ON_WINDOWS and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
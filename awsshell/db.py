@@ -1,33 +1,223 @@
 from __future__ import unicode_literals
 import os
+import time
+import array
+import hashlib
+import logging
 import sqlite3
+import threading
+import contextlib
+
+from awsshell.compat import pathname2url
+
+
+LOG = logging.getLogger(__name__)
 
 
 class ConcurrentDBM(object):
+    """A key/value store backed by sqlite.
+
+    Besides the key/value pairs, values can be split into named sections
+    stored in a separate table keyed by ``(key, section)``, so a single
+    section can be looked up without reading the whole value.
+
+    Keys can also have a full text search entry, a command name and
+    description, when sqlite supports either the FTS5 or FTS4 module.
+
+    A db can be shared between threads, e.g the help pane reads docs
+    while the doc index build writes them.  Writes from every thread go
+    through a single writer connection, one transaction at a time.
+    Each thread reads with its own read-only connection, and since the
+    db is used in WAL mode, reads never wait for a write to finish.
+    The time writes spend waiting for the write lock, held either by
+    another thread or by another process writing the db, is returned
+    by :meth:`lock_stats`.
+
+    Since the db only contains data that can be regenerated,
+    ``synchronous`` is relaxed to ``NORMAL``, which only syncs to disk on
+    checkpoints rather than on every commit.
+
+    :type filename: str
+    :param filename: The filename of the db, so that other threads and
+        processes can open their own connections to it.
+
+    :type writer: sqlite3.Connection
+    :param writer: The connection used for writes, or ``None`` if the
+        db is read only.
+
+    :type batch_size: int
+    :param batch_size: The number of keys written per transaction
+        by :meth:`update`.
+
+    """
+    SYNCHRONOUS = 'NORMAL'
+    # How many seconds to wait for a lock held by another connection
+    # before giving up.
+    BUSY_TIMEOUT = 5.0
+    # Writes that wait longer than this many seconds are logged.
+    SLOW_LOCK_WAIT = 0.1
+    # The maximum number of bytes of the db file that sqlite will
+    # memory map for reads.
+    MMAP_SIZE = 256 * 1024 * 1024
+    BATCH_SIZE = 500
+
+    _CREATE_SECTIONS_TABLE = (
+        'CREATE TABLE IF NOT EXISTS docsections ('
+        'key TEXT, section TEXT, value TEXT, PRIMARY KEY (key, section))')
+    # The full text search modules to use, in order of preference.
+    SEARCH_MODULES = ('fts5', 'fts4')
+    _CREATE_SEARCH_TABLE = {
+        'fts5': ("CREATE VIRTUAL TABLE IF NOT EXISTS docsearch USING fts5("
+                 "key UNINDEXED, command, description, tokenize='porter')"),
+        'fts4': ("CREATE VIRTUAL TABLE IF NOT EXISTS docsearch USING fts4("
+                 "key, command, description, notindexed=key, "
+                 "tokenize=porter)"),
+    }
+    # How much a match in each column of the search table counts
+    # towards a key's rank.  The key itself isn't searched.
+    SEARCH_WEIGHTS = (0.0, 10.0, 1.0)
 
     @classmethod
-    def open(cls, filename, create=False):
+    def open(cls, filename, create=False, read_only=False):
+        if read_only:
+            return cls(filename, None)
         if create and not os.path.isfile(filename):
             return cls.create(filename)
         else:
-            db = sqlite3.connect(filename)
-            return cls(db)
+            writer = cls._connect_writer(filename)
+            # Databases created by older versions of the aws-shell
+            # don't have the sections or search tables.
+            writer.execute(cls._CREATE_SECTIONS_TABLE)
+            cls._create_search_table(writer)
+            return cls(filename, writer)
 
     @classmethod
     def create(cls, filename):
-        db = sqlite3.connect(filename)
-        with db:
-            db.execute(
-                'CREATE TABLE docindex (key TEXT PRIMARY KEY, value TEXT)')
-        return cls(db)
+        writer = cls._connect_writer(filename)
+        writer.execute(
+            'CREATE TABLE docindex (key TEXT PRIMARY KEY, value TEXT)')
+        writer.execute(cls._CREATE_SECTIONS_TABLE)
+        cls._create_search_table(writer)
+        return cls(filename, writer)
 
-    def __init__(self, db):
-        self._db = db
+    @classmethod
+    def _create_search_table(cls, writer):
+        for module in cls.SEARCH_MODULES:
+            try:
+                writer.execute(cls._CREATE_SEARCH_TABLE[module])
+            except sqlite3.OperationalError:
+                # sqlite wasn't compiled with this module.
+                continue
+            return
+
+    @classmethod
+    def _connect_writer(cls, filename):
+        # Transactions are managed explicitly, see _transaction().  The
+        # connection is shared by all threads, which take turns using it.
+        writer = sqlite3.connect(filename, timeout=cls.BUSY_TIMEOUT,
+                                 isolation_level=None,
+                                 check_same_thread=False)
+        writer.execute('PRAGMA journal_mode=WAL')
+        writer.execute('PRAGMA synchronous=%s' % cls.SYNCHRONOUS)
+        writer.execute('PRAGMA mmap_size=%d' % cls.MMAP_SIZE)
+        return writer
+
+    def _connect_reader(self):
+        try:
+            reader = sqlite3.connect(
+                'file:%s?mode=ro' % pathname2url(
+                    os.path.abspath(self.filename)),
+                uri=True, timeout=self.BUSY_TIMEOUT, isolation_level=None,
+                check_same_thread=False)
+        except TypeError:
+            # Python 2 doesn't support URI filenames, so reads
+            # use a regular connection.
+            reader = sqlite3.connect(
+                self.filename, timeout=self.BUSY_TIMEOUT,
+                isolation_level=None, check_same_thread=False)
+        reader.execute('PRAGMA mmap_size=%d' % self.MMAP_SIZE)
+        return reader
+
+    def __init__(self, filename, writer, batch_size=None, clock=time.time):
+        self.filename = filename
+        self._writer = writer
+        if batch_size is None:
+            batch_size = self.BATCH_SIZE
+        self.batch_size = batch_size
+        self._clock = clock
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        # Every thread's reader, so they can all be closed.
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._lock_stats = {
+            'writes': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+        }
+        self.search_module = self._find_search_module()
+
+    @property
+    def _reader(self):
+        # The calling thread's read-only connection.
+        reader = getattr(self._local, 'reader', None)
+        if reader is None:
+            reader = self._connect_reader()
+            self._local.reader = reader
+            with self._readers_lock:
+                self._readers.append(reader)
+        return reader
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        if self._writer is None:
+            raise sqlite3.OperationalError(
+                'attempt to write a readonly database')
+        start = self._clock()
+        with self._write_lock:
+            # BEGIN IMMEDIATE takes the db's write lock up front, so the
+            # time spent waiting for other processes is measured here.
+            try:
+                self._writer.execute('BEGIN IMMEDIATE')
+            finally:
+                self._record_lock_wait(self._clock() - start)
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer.execute('ROLLBACK')
+                raise
+            self._writer.execute('COMMIT')
+
+    def _record_lock_wait(self, seconds):
+        stats = self._lock_stats
+        stats['writes'] += 1
+        stats['wait_seconds'] += seconds
+        stats['max_wait_seconds'] = max(stats['max_wait_seconds'], seconds)
+        if seconds > self.SLOW_LOCK_WAIT:
+            LOG.debug("Waited %.3fs for the write lock of %s",
+                      seconds, self.filename)
+
+    def lock_stats(self):
+        """Return how long writes have waited for the write lock.
+
+        :rtype: dict
+        :return: The number of ``writes`` (transactions), and the total
+            ``wait_seconds`` and ``max_wait_seconds`` they waited.
+        """
+        return dict(self._lock_stats)
+
+    def _find_search_module(self):
+        row = self._reader.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'docsearch'"
+        ).fetchone()
+        if row is not None:
+            for module in self._CREATE_SEARCH_TABLE:
+                if 'using %s(' % module in row[0].lower():
+                    return module
+        return None
 
     def __getitem__(self, key):
         if isinstance(key, bytes):
             key = key.decode('utf-8')
-        cursor = self._db.cursor()
+        cursor = self._reader.cursor()
         cursor.execute(
             'SELECT value FROM docindex WHERE key = :key', {'key': key})
         result = cursor.fetchone()
@@ -35,12 +225,196 @@ class ConcurrentDBM(object):
             return result[0]
         raise KeyError(key)
 
+    def get_section(self, key, section):
+        """Return a single section of the value of ``key``.
+
+        :raises: :class:`KeyError` if the key or section doesn't exist.
+        """
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        cursor = self._reader.cursor()
+        cursor.execute(
+            'SELECT value FROM docsections '
+            'WHERE key = :key AND section = :section',
+            {'key': key, 'section': section})
+        result = cursor.fetchone()
+        if result is not None:
+            return result[0]
+        raise KeyError((key, section))
+
+    def keys(self):
+        cursor = self._reader.cursor()
+        cursor.execute('SELECT key FROM docindex')
+        return [row[0] for row in cursor.fetchall()]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
     def __setitem__(self, key, value):
-        with self._db:
-            self._db.execute(
+        with self._transaction() as writer:
+            writer.execute(
                 'INSERT OR REPLACE INTO docindex (key, value) '
                 'VALUES (:key, :value)',
                 {'key': key, 'value': value})
 
+    def setdefault(self, key, value):
+        """Write ``key`` only if it doesn't exist and return its value.
+
+        The check and the write are a single transaction, so when
+        several processes set the same key, they all get the value of
+        the first one.
+        """
+        with self._transaction() as writer:
+            writer.execute(
+                'INSERT OR IGNORE INTO docindex (key, value) '
+                'VALUES (:key, :value)',
+                {'key': key, 'value': value})
+            return writer.execute(
+                'SELECT value FROM docindex WHERE key = :key',
+                {'key': key}).fetchone()[0]
+
+    def update(self, items, batch_size=None):
+        """Write multiple keys, committing every ``batch_size`` keys.
+
+        This is much faster than setting each key individually, which
+        commits once per key.  If an error occurs, keys from earlier
+        batches remain committed.
+
+        :type items: dict or iterable
+        :param items: A mapping or an iterable of ``(key, value)`` pairs.
+
+        :type batch_size: int
+        :param batch_size: Overrides the :attr:`batch_size` of the db.
+        """
+        if hasattr(items, 'items'):
+            items = items.items()
+        self._write_batches(
+            'INSERT OR REPLACE INTO docindex (key, value) VALUES (?, ?)',
+            items, batch_size)
+
+    def update_sections(self, sections, batch_size=None):
+        """Write sections of values, committing every ``batch_size`` rows.
+
+        :type sections: iterable
+        :param sections: An iterable of ``(key, section, value)`` tuples.
+        """
+        self._write_batches(
+            'INSERT OR REPLACE INTO docsections (key, section, value) '
+            'VALUES (?, ?, ?)', sections, batch_size)
+
+    def update_search(self, entries, batch_size=None):
+        """Write full text search entries, committing every ``batch_size``.
+
+        Writing the entry of a key again replaces its previous entry.
+        If sqlite doesn't support full text search, nothing is written.
+
+        :type entries: iterable
+        :param entries: An iterable of ``(key, command, description)``
+            tuples.
+        """
+        if self.search_module is None:
+            return
+        self._write_batches(
+            'INSERT OR REPLACE INTO docsearch '
+            '(rowid, key, command, description) VALUES (?, ?, ?, ?)',
+            ((_search_rowid(key), key, command, description)
+             for key, command, description in entries), batch_size)
+
+    def keys_without_search_entries(self):
+        """Return the ``aws.*`` keys that have no search entry."""
+        if self.search_module is None:
+            return []
+        cursor = self._reader.execute(
+            "SELECT key FROM docindex WHERE key LIKE 'aws.%' "
+            "AND key NOT IN (SELECT key FROM docsearch)")
+        return [row[0] for row in cursor.fetchall()]
+
+    def search(self, query, limit=10):
+        """Return the keys whose search entries best match a query.
+
+        :type query: str
+        :param query: A full text search query, e.g ``"describe" "vpc"``.
+
+        :rtype: list
+        :return: ``(key, snippet)`` tuples, best match first.  The
+            snippet is the part of the description that best matches
+            the query, with the matching terms wrapped in ``[`` and ``]``.
+        """
+        try:
+            if self.search_module == 'fts5':
+                return self._search_fts5(query, limit)
+            elif self.search_module == 'fts4':
+                return self._search_fts4(query, limit)
+        except sqlite3.OperationalError:
+            # e.g the query only has punctuation.
+            pass
+        return []
+
+    def _search_fts5(self, query, limit):
+        cursor = self._reader.execute(
+            "SELECT key, snippet(docsearch, 2, '[', ']', '...', 12) "
+            "FROM docsearch WHERE docsearch MATCH ? "
+            "ORDER BY bm25(docsearch, %s) LIMIT ?" % ', '.join(
+                str(weight) for weight in self.SEARCH_WEIGHTS),
+            (query, limit))
+        return [(row[0], row[1]) for row in cursor.fetchall()]
+
+    def _search_fts4(self, query, limit):
+        # FTS4 doesn't have a ranking function, so the matches are
+        # ranked by the share of each term's hits that they have,
+        # weighted by column.
+        cursor = self._reader.execute(
+            "SELECT key, snippet(docsearch, '[', ']', '...', 2, 12), "
+            "matchinfo(docsearch, 'pcx') "
+            "FROM docsearch WHERE docsearch MATCH ?", (query,))
+        ranked = sorted(cursor.fetchall(),
+                        key=lambda row: -self._fts4_score(row[2]))
+        return [(row[0], row[1]) for row in ranked[:limit]]
+
+    def _fts4_score(self, matchinfo):
+        info = array.array('I', bytes(matchinfo))
+        num_phrases, num_columns = info[0], info[1]
+        score = 0.0
+        for phrase in range(num_phrases):
+            for column in range(num_columns):
+                offset = 2 + 3 * (phrase * num_columns + column)
+                hits, total_hits = info[offset], info[offset + 1]
+                if hits:
+                    score += (self.SEARCH_WEIGHTS[column] * hits /
+                              float(total_hits))
+        return score
+
+    def _write_batches(self, sql, rows, batch_size):
+        if batch_size is None:
+            batch_size = self.batch_size
+        batch = []
+        for row in rows:
+            batch.append(tuple(row))
+            if len(batch) >= batch_size:
+                self._write_batch(sql, batch)
+                batch = []
+        if batch:
+            self._write_batch(sql, batch)
+
+    def _write_batch(self, sql, batch):
+        with self._transaction() as writer:
+            writer.executemany(sql, batch)
+
     def close(self):
-        self._db.close()
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for reader in readers:
+            reader.close()
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _search_rowid(key):
+    # Full text search tables can't have a primary key, so the entry of
+    # a key is stored at a rowid derived from the key.  Writing the key
+    # again then replaces its entry rather than adding another one.
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:15], 16)
@@ -1,10 +1,43 @@
 from __future__ import unicode_literals
+import re
+import zlib
+import logging
+import threading
+from collections import Counter
+
 from awsshell import db
+from awsshell.compat import text_type, queue
+from awsshell.utils import LRUCache
+
+
+# The key of the zlib preset dictionary in a compressed doc index.
+DICTIONARY_KEY = '__zdict__'
+# zlib only uses the last 32KB of a preset dictionary.
+MAX_DICTIONARY_SIZE = 32 * 1024
+# The sections of a command's docs other than its options.
+DESCRIPTION_SECTION = 'description'
+SYNOPSIS_SECTION = 'synopsis'
+# The global options are the same for every command, so their
+# sections are only stored once, under this key.
+GLOBAL_OPTIONS_KEY = 'aws'
+# Marks that every command in the doc index has a search entry.  Doc
+# indexes created before search was added don't have it.
+SEARCH_COMPLETE_KEY = '__search_complete__'
+# The section titles of the rendered docs.
+_SECTION_TITLES = frozenset([
+    'DESCRIPTION', 'SYNOPSIS', 'OPTIONS', 'GLOBAL OPTIONS', 'EXAMPLES',
+    'OUTPUT', 'AVAILABLE COMMANDS',
+])
+_OPTION_SECTIONS = frozenset(['OPTIONS', 'GLOBAL OPTIONS'])
+# e.g "--dry-run | --no-dry-run (boolean)"
+_OPTION_HEADER_REGEX = re.compile(r'^(--[\w-]+(?: \| --[\w-]+)*)(?: \(|$)')
 
+LOG = logging.getLogger(__name__)
 
-def load_lazy_doc_index(filename):
+
+def load_lazy_doc_index(filename, render_missing=None):
     d = load_doc_db(filename)
-    return DocRetriever(d)
+    return DocRetriever(d, render_missing=render_missing)
 
 
 def load_doc_db(filename):
@@ -12,31 +45,414 @@ def load_doc_db(filename):
     return d
 
 
+def split_sections(docs):
+    """Split the rendered docs of a command into sections.
+
+    The sections are the description, the synopsis and one section
+    per option, named after the option.  An option with an alternate
+    name, e.g ``--dry-run | --no-dry-run``, has a section for each name.
+
+    :rtype: tuple
+    :return: A list of ``(section_name, text)`` tuples for the command
+        and a list of ``(section_name, text)`` tuples for the global
+        options.
+    """
+    sections = [(DESCRIPTION_SECTION, _extract_description(docs))]
+    global_sections = []
+    seen = set([DESCRIPTION_SECTION])
+    current = sections
+    section_title = None
+    names = []
+    lines = []
+    for line in docs.splitlines(True):
+        stripped = line.rstrip('\n')
+        if stripped in _SECTION_TITLES:
+            _add_section(current, seen, names, lines)
+            section_title = stripped
+            if stripped == 'GLOBAL OPTIONS':
+                current = global_sections
+                seen = set()
+            else:
+                current = sections
+            names = [SYNOPSIS_SECTION] if stripped == 'SYNOPSIS' else []
+            lines = []
+            continue
+        if section_title in _OPTION_SECTIONS:
+            match = _OPTION_HEADER_REGEX.match(stripped)
+            if match is not None:
+                _add_section(current, seen, names, lines)
+                names = match.group(1).split(' | ')
+                lines = []
+        lines.append(line)
+    _add_section(current, seen, names, lines)
+    return sections, global_sections
+
+
+def search_entry(dotted_name, docs):
+    """Return the full text search entry of a command.
+
+    :rtype: tuple
+    :return: The ``(dotted_name, command, description)`` of the command,
+        where the command is e.g ``ec2 describe-instances``.
+    """
+    command = ' '.join(dotted_name.split('.')[1:])
+    return dotted_name, command, _extract_description(docs)
+
+
+def _add_section(sections, seen, names, lines):
+    text = ''.join(lines)
+    for name in names:
+        if name not in seen:
+            seen.add(name)
+            sections.append((name, text))
+
+
+def _extract_description(docs):
+    index = docs.find('SYNOPSIS')
+    if index > 0:
+        docs = docs[:index]
+    return docs
+
+
+def train_dictionary(samples, size=MAX_DICTIONARY_SIZE):
+    """Build a zlib preset dictionary from a sample of rendered docs.
+
+    The rendered docs repeat a lot of boilerplate, such as the global
+    options and the descriptions of common parameters.  Lines that
+    appear in more than one sample are added to the dictionary, with
+    the lines that save the most bytes at the end where zlib can
+    reference them most cheaply.
+
+    :type samples: list
+    :param samples: A list of rendered docs.
+
+    :rtype: bytes
+    :return: The preset dictionary.
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(sample.splitlines(True)))
+    scored = sorted(
+        ((count * len(line), line) for line, count in counts.items()
+         if count > 1 and line.strip()), reverse=True)
+    lines = []
+    remaining = size
+    for _, line in scored:
+        encoded = line.encode('utf-8')
+        if len(encoded) > remaining:
+            continue
+        lines.append(encoded)
+        remaining -= len(encoded)
+    lines.reverse()
+    return b''.join(lines)
+
+
+class DocCompressor(object):
+    """Compress and decompress docs stored in the doc index.
+
+    Compressed docs are stored as blobs while uncompressed docs are
+    stored as text, so docs from an uncompressed doc index are
+    returned as is.
+
+    :type zdict: bytes
+    :param zdict: A preset dictionary created by :func:`train_dictionary`.
+
+    """
+    def __init__(self, zdict=None, level=9):
+        self._zdict = zdict
+        self._level = level
+
+    def compress(self, text):
+        if self._zdict:
+            compressor = zlib.compressobj(self._level, zlib.DEFLATED,
+                                          zlib.MAX_WBITS, 9,
+                                          zlib.Z_DEFAULT_STRATEGY,
+                                          self._zdict)
+        else:
+            compressor = zlib.compressobj(self._level)
+        return compressor.compress(text.encode('utf-8')) + compressor.flush()
+
+    def decompress(self, value):
+        if isinstance(value, text_type):
+            return value
+        if self._zdict:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS, self._zdict)
+        else:
+            decompressor = zlib.decompressobj()
+        return (decompressor.decompress(bytes(value)) +
+                decompressor.flush()).decode('utf-8')
+
+
 class DocRetriever(object):
-    """Retrieve documentation for the AWS CLI."""
-    def __init__(self, doc_index):
+    """Retrieve documentation for the AWS CLI.
+
+    Docs are looked up by section when the doc index has them, so only
+    the requested section is read.  Otherwise, e.g for doc indexes
+    created by older versions of the aws-shell, the section is found in
+    the full docs of the command.
+
+    Extracted docs are kept in an LRU cache, bounded by the size of the
+    cached docs in bytes.  Commands that are written to the doc index
+    after they're cached must be removed from the cache with
+    :meth:`invalidate`.
+
+    :type cache_size: int
+    :param cache_size: The maximum number of bytes of docs to cache.
+
+    :type render_missing: callable
+    :param render_missing: Called with the dotted name of a command
+        that has no docs in the doc index, e.g :meth:`DocRenderer.render`.
+
+    """
+    CACHE_SIZE = 1024 * 1024
+
+    def __init__(self, doc_index, cache_size=None, render_missing=None):
         # Internally, most of the speedup comes from
         # the fact that this data is pre-rendered and
         # indexed.
         self._doc_index = doc_index
-        self._cache = {}
+        if cache_size is None:
+            cache_size = self.CACHE_SIZE
+        self.cache = LRUCache(
+            cache_size, get_size=lambda docs: len(docs.encode('utf-8')))
+        self._compressor = None
+        self._render_missing = render_missing
+        # Docs looked up before an invalidation may be out of date, so
+        # they're only cached if no invalidation ran during the lookup.
+        self._invalidation_lock = threading.Lock()
+        self._invalidations = 0
+
+    def invalidate(self, dot_cmds):
+        """Remove the cached docs of commands that have been rewritten.
+
+        :type dot_cmds: list
+        :param dot_cmds: The dotted names of the commands,
+            e.g ``aws.ec2.describe-instances``.
+        """
+        dot_cmds = set(dot_cmds)
+        with self._invalidation_lock:
+            self._invalidations += 1
+            self.cache.remove_if(lambda key: key[0] in dot_cmds)
+
+    def _cached(self, dot_cmd, param_name, extract):
+        if isinstance(dot_cmd, bytes):
+            dot_cmd = dot_cmd.decode('utf-8')
+        key = (dot_cmd, param_name)
+        docs = self.cache.get(key)
+        if docs is None:
+            invalidations = self._invalidations
+            missing = False
+            try:
+                docs = extract(dot_cmd)
+            except KeyError:
+                # Missing docs are cached too, they're removed
+                # from the cache once the doc index has them.
+                docs = u''
+                missing = True
+            with self._invalidation_lock:
+                if self._invalidations == invalidations:
+                    self.cache.put(key, docs)
+            # The missing docs are cached before they're rendered so
+            # the invalidation after they're written removes them.
+            if missing and self._render_missing is not None:
+                self._render_missing(dot_cmd)
+        return docs
+
+    def search(self, terms, limit=10):
+        """Search the docs for the commands that best match all the terms.
+
+        Terms also match other forms of the same word, e.g ``snapshot``
+        matches ``snapshots``.
+
+        :type terms: list
+        :param terms: The words to search for.
+
+        :rtype: list
+        :return: ``(dot_cmd, snippet)`` tuples, best match first.
+        """
+        if not terms or not hasattr(self._doc_index, 'search'):
+            return []
+        query = ' '.join('"%s"' % term.replace('"', '""') for term in terms)
+        return self._doc_index.search(query, limit)
+
+    def _decompress(self, value):
+        if isinstance(value, text_type):
+            return value
+        if self._compressor is None:
+            # The dictionary is written before any docs compressed
+            # with it, so it's loaded the first time it's needed.
+            try:
+                zdict = self._doc_index[DICTIONARY_KEY]
+            except KeyError:
+                zdict = None
+            else:
+                zdict = bytes(zdict)
+            self._compressor = DocCompressor(zdict)
+        try:
+            return self._compressor.decompress(value)
+        except zlib.error:
+            # Docs compressed with another dictionary, e.g by an older
+            # aws-shell that replaced it, are treated as missing.
+            LOG.debug("Unable to decompress docs", exc_info=True)
+            raise KeyError('Unable to decompress docs')
+
+    def _get_docs(self, dot_cmd):
+        return self._decompress(self._doc_index[dot_cmd])
+
+    def _get_section(self, dot_cmd, section):
+        return self._decompress(
+            self._doc_index.get_section(dot_cmd, section))
 
     def extract_description(self, dot_cmd):
+        return self._cached(dot_cmd, None, self._extract_description)
+
+    def extract_param(self, dot_cmd, param_name):
+        return self._cached(
+            dot_cmd, param_name,
+            lambda dot_cmd: self._extract_param(dot_cmd, param_name))
+
+    def _extract_description(self, dot_cmd):
         try:
-            docs = self._doc_index[dot_cmd]
+            return self._get_section(dot_cmd, DESCRIPTION_SECTION)
         except KeyError:
-            return u''
-        index = docs.find('SYNOPSIS')
-        if index > 0:
-            docs = docs[:index]
-        return docs
+            pass
+        return _extract_description(self._get_docs(dot_cmd))
 
-    def extract_param(self, dot_cmd, param_name):
+    def _extract_param(self, dot_cmd, param_name):
+        try:
+            return self._get_section(dot_cmd, param_name)
+        except KeyError:
+            pass
         try:
-            docs = self._doc_index[dot_cmd]
+            self._doc_index.get_section(dot_cmd, DESCRIPTION_SECTION)
         except KeyError:
-            return u''
+            pass
+        else:
+            # The command's docs are sectioned, so the param is either
+            # a global option or isn't documented.
+            try:
+                return self._get_section(GLOBAL_OPTIONS_KEY, param_name)
+            except KeyError:
+                return u''
+        docs = self._get_docs(dot_cmd)
         index = docs.find('OPTIONS')
         param_start_index = docs.find(param_name, index)
         param_end_index = docs.find('--', param_start_index + 1)
         return docs[param_start_index:param_end_index]
+
+
+class DocRenderer(object):
+    """Render the docs of individual commands on demand.
+
+    While the doc index is being built, commands the build hasn't
+    reached yet have no docs.  Rather than waiting for the build,
+    commands passed to :meth:`render` are rendered in a worker process
+    and written to the doc index from a background thread, so the shell
+    stays responsive.  The most recently requested command is rendered
+    first.
+
+    :type doc_index: awsshell.db.ConcurrentDBM
+    :param doc_index: The doc index, which may be shared with other
+        threads.
+
+    :type on_rendered: callable
+    :param on_rendered: Called from the background thread with the list
+        of dotted command names whose docs were written.
+
+    :type compress: bool
+    :param compress: Compress the docs with the doc index's dictionary.
+
+    :type render_docs: callable
+    :param render_docs: Called with the dotted name of a command and
+        returns its rendered docs, or ``None`` if the command doesn't
+        exist.  Defaults to rendering the docs in a worker process.
+
+    """
+    def __init__(self, doc_index, on_rendered=None, compress=False,
+                 render_docs=None):
+        self._doc_index = doc_index
+        self._on_rendered = on_rendered
+        self._compress = compress
+        if render_docs is None:
+            render_docs = self._render_in_worker
+        self._render_docs = render_docs
+        self._requests = queue.LifoQueue()
+        self._requested = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+
+    def render(self, dot_cmd):
+        """Render and write the docs of a command in the background.
+
+        Each command is only rendered once.
+
+        :type dot_cmd: str
+        :param dot_cmd: The dotted name of the command,
+            e.g ``aws.ec2.describe-instances``.
+        """
+        # The docs of the aws command itself aren't in the doc index.
+        if '.' not in dot_cmd:
+            return
+        with self._lock:
+            if dot_cmd in self._requested:
+                return
+            self._requested.add(dot_cmd)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        self._requests.put(dot_cmd)
+
+    def close(self):
+        """Render any queued commands and stop the background thread."""
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            self._requests.put(None)
+            thread.join()
+
+    def _run(self):
+        # makeindex imports docutils and the awscli driver, so it's only
+        # imported once docs need to be rendered.
+        from awsshell.makeindex import DocIndexWriter
+        writer = DocIndexWriter(self._doc_index, compress=self._compress,
+                                on_write=self._on_rendered)
+        closing = False
+        try:
+            while True:
+                try:
+                    dot_cmd = self._requests.get(block=not closing)
+                except queue.Empty:
+                    break
+                if dot_cmd is None:
+                    # Requests queued before close() may still be
+                    # behind it in the queue.
+                    closing = True
+                    continue
+                # The doc index build may have gotten to it first.  The
+                # docs may have been looked up before they were written
+                # though, so the callback still needs to know they're
+                # available.
+                if dot_cmd in writer.db:
+                    if self._on_rendered is not None:
+                        self._on_rendered([dot_cmd])
+                    continue
+                try:
+                    docs = self._render_docs(dot_cmd)
+                except Exception:
+                    LOG.debug("Unable to render docs for %s", dot_cmd,
+                              exc_info=True)
+                    continue
+                if docs is not None:
+                    writer.write_command(dot_cmd, docs)
+        finally:
+            if self._pool is not None:
+                self._pool.terminate()
+
+    def _render_in_worker(self, dot_cmd):
+        from awsshell import makeindex
+        if self._pool is None:
+            self._pool = makeindex.create_worker_pool(processes=1)
+        return self._pool.apply(makeindex.render_command_docs,
+                                (dot_cmd.split('.')[1:],))
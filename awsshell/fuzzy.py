@@ -38,11 +38,42 @@ possible score, it would represent an exact match,
 and 0 is the lowest meaning these is no possible chance
 for the word to be a match.
 
+Searching a Corpus
+==================
+
+When the same words are searched over and over, e.g. the
+commands and options of the command being completed, a
+``FuzzyCorpus`` can be created for them once.  It stores
+what can be computed from each word ahead of time, so most
+words that can't match are rejected without scoring them,
+and the rest are scored without copying the word.
+
+A ``FuzzySession`` searches words as the search string is
+typed.  Typing another character can only remove matches, so
+only the words that matched the last search are searched
+again, starting from where they matched.
+
+For a large number of words, e.g. server side completions,
+``create_batch_corpus()`` creates a ``BatchFuzzyCorpus`` if
+NumPy is installed.  It scores every word at once with array
+operations, and falls back to searching in pure Python if
+NumPy isn't installed.
+
 """
 from __future__ import print_function
+import heapq
+from operator import itemgetter
+
+
+# Below this many words, create_batch_corpus() doesn't use NumPy
+# since scoring the words in pure Python is as fast.
+BATCH_MIN_WORDS = 200
+_numpy = None
 
 
 def fuzzy_search(user_input, corpus):
+    if isinstance(corpus, (FuzzyCorpus, BatchFuzzyCorpus)):
+        return corpus.search(user_input)
     candidates = []
     for word in corpus:
         current_score = calculate_score(user_input, word)
@@ -82,3 +113,336 @@ def calculate_score(search_string, word):
     completion_scale = 1 - (len(word) / float(len(original_word)))
     score *= completion_scale
     return score
+
+
+# Each ASCII character has its own bit in a word's character mask,
+# and all the other characters share one.
+_CHAR_BITS = dict((chr(i), 1 << i) for i in range(128))
+_OTHER_CHAR_BIT = 1 << 128
+
+
+def _char_mask(text):
+    mask = 0
+    for char in set(text):
+        mask |= _CHAR_BITS.get(char, _OTHER_CHAR_BIT)
+    return mask
+
+
+class _PythonCorpus(object):
+    # Matches are lists of (word, length, start, score) tuples: the
+    # word, its length, the position after its last matched character
+    # and its score so far.
+    def _continue_matches(self, matches, search_chars, input_length):
+        return list(_continue_matches(matches, search_chars, input_length))
+
+    def _rank(self, matches, limit):
+        return _rank(matches, limit)
+
+
+class _WordList(_PythonCorpus):
+    # A collection of words searched without precomputing anything.
+    def __init__(self, words):
+        self._words = words
+
+    def _matches(self, user_input):
+        return self._continue_matches(
+            ((word, len(word), 0, 1) for word in self._words),
+            user_input, len(user_input))
+
+
+class FuzzyCorpus(_PythonCorpus):
+    """A collection of words that's fuzzy searched repeatedly.
+
+    The words are searched with the same scores as
+    :func:`calculate_score`, in the same order as
+    :func:`fuzzy_search`.
+
+    :type corpus: collection, usually a list
+    :param corpus: The words to search.
+    """
+    def __init__(self, corpus):
+        self._words = []
+        for word in corpus:
+            # The positions right after a "-" start a new sub word.
+            boundaries = frozenset(
+                i + 1 for i, char in enumerate(word) if char == '-')
+            self._words.append((word, len(word), _char_mask(word),
+                                boundaries))
+
+    def __len__(self):
+        return len(self._words)
+
+    def search(self, user_input, limit=None):
+        """Find the words that match the user input, best match first.
+
+        :type user_input: str
+        :param user_input: The search string.
+
+        :type limit: int
+        :param limit: The maximum number of words to return.  If not
+            given, every match is returned.
+
+        :rtype: list of strings
+        :return: The matching words, ordered by their score.
+        """
+        return self._rank(self._matches(user_input), limit)
+
+    def _matches(self, user_input):
+        input_length = len(user_input)
+        input_mask = _char_mask(user_input)
+        matches = []
+        for word, length, mask, boundaries in self._words:
+            # Words that are too short or missing any of the characters
+            # can't match.
+            if input_length > length or input_mask & mask != input_mask:
+                continue
+            # This is calculate_score() with the part of the word that's
+            # left to search tracked by its start position, rather than
+            # by slicing the word after every matched character.
+            score = 1
+            start = 0
+            for search_char in user_input:
+                i = word.find(search_char, start)
+                if i < 0:
+                    break
+                if i > start and i in boundaries:
+                    score *= 0.95
+                else:
+                    score *= 1 - ((i - start) / float(length - start))
+                start = i + 1
+            else:
+                matches.append((word, length, start, score))
+        return matches
+
+
+def _load_numpy():
+    # NumPy is optional, and slow to import, so it's only imported
+    # when it's first needed.
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def create_batch_corpus(corpus):
+    """Create a corpus for fuzzy searching a large number of words.
+
+    If NumPy is installed and there are at least ``BATCH_MIN_WORDS``
+    words, a :class:`BatchFuzzyCorpus` is returned.  Otherwise the
+    words are returned as they are, and are searched in pure Python.
+
+    :type corpus: list
+    :param corpus: The words to search.
+    """
+    if len(corpus) < BATCH_MIN_WORDS or _load_numpy() is None:
+        return corpus
+    return BatchFuzzyCorpus(corpus)
+
+
+class BatchFuzzyCorpus(object):
+    """A large collection of words that's fuzzy searched with NumPy.
+
+    The words are encoded once into a matrix with a row of character
+    codes for each word, padded to the length of the longest word.
+    Each search then scores all of the rows with array operations, with
+    the same scores as :func:`calculate_score`, in the same order as
+    :func:`fuzzy_search`.
+
+    NumPy must be installed to create a ``BatchFuzzyCorpus``, see
+    :func:`create_batch_corpus`.
+
+    :type corpus: collection, usually a list
+    :param corpus: The words to search.
+    """
+    def __init__(self, corpus):
+        numpy = _load_numpy()
+        if numpy is None:
+            raise RuntimeError("NumPy is required to create a "
+                               "BatchFuzzyCorpus.")
+        self._numpy = numpy
+        self._words = list(corpus)
+        self._lengths = numpy.array([len(word) for word in self._words],
+                                    dtype=numpy.intp)
+        width = max([1] + self._lengths.tolist())
+        text = u''.join(word + u'\0' * (width - len(word))
+                        for word in self._words)
+        codes = numpy.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+        codes = codes.reshape(len(self._words), width)
+        self._columns = numpy.arange(width)
+        padding = self._columns >= self._lengths[:, None]
+        self._max_code = int(codes[~padding].max()) if codes.size and \
+            not padding.all() else -1
+        if self._max_code < 0xff:
+            codes = codes.astype(numpy.uint8)
+        else:
+            codes = codes.copy()
+        # The padding is set to a code higher than any word's
+        # characters so it's never matched.
+        codes[padding] = numpy.iinfo(codes.dtype).max
+        self._codes = codes
+
+    def __len__(self):
+        return len(self._words)
+
+    def search(self, user_input, limit=None):
+        """Find the words that match the user input, best match first.
+
+        :type user_input: str
+        :param user_input: The search string.
+
+        :type limit: int
+        :param limit: The maximum number of words to return.  If not
+            given, every match is returned.
+
+        :rtype: list of strings
+        :return: The matching words, ordered by their score.
+        """
+        return self._rank(self._matches(user_input), limit)
+
+    def _matches(self, user_input):
+        # Matches are arrays of the matching rows, the positions after
+        # their last matched character and their scores so far.
+        numpy = self._numpy
+        rows = numpy.flatnonzero(self._lengths >= max(len(user_input), 1))
+        starts = numpy.zeros(len(rows), dtype=numpy.intp)
+        scores = numpy.ones(len(rows))
+        return self._continue_matches((rows, starts, scores), user_input,
+                                      len(user_input))
+
+    def _continue_matches(self, matches, search_chars, input_length):
+        numpy = self._numpy
+        rows, starts, scores = matches
+        too_short = self._lengths[rows] < input_length
+        if too_short.any():
+            rows, starts, scores = (rows[~too_short], starts[~too_short],
+                                    scores[~too_short])
+        for search_char in search_chars:
+            code = ord(search_char)
+            if code > self._max_code:
+                # None of the words have the character.
+                rows = rows[:0]
+                starts = starts[:0]
+                scores = scores[:0]
+                break
+            codes = self._codes[rows]
+            # The first position of the character from the start of
+            # the part of the word that's left to search.
+            hits = codes == code
+            hits &= self._columns >= starts[:, None]
+            i = hits.argmax(axis=1)
+            found = hits[numpy.arange(len(rows)), i]
+            rows, starts, scores, i = (rows[found], starts[found],
+                                       scores[found], i[found])
+            lengths = self._lengths[rows]
+            on_boundary = (i > starts) & (
+                self._codes[rows, i - 1] == ord('-'))
+            scale = numpy.where(
+                on_boundary, 0.95,
+                1 - ((i - starts) / (lengths - starts).astype(float)))
+            scores = scores * scale
+            starts = i + 1
+        return rows, starts, scores
+
+    def _rank(self, matches, limit):
+        numpy = self._numpy
+        rows, starts, scores = matches
+        lengths = self._lengths[rows]
+        scores = scores * (1 - ((lengths - starts) / lengths.astype(float)))
+        matched = scores > 0
+        rows, scores = rows[matched], scores[matched]
+        # A stable sort keeps the words with the same score in
+        # corpus order, like fuzzy_search().
+        order = numpy.argsort(-scores, kind='stable')
+        if limit is not None:
+            order = order[:limit]
+        words = self._words
+        return [words[row] for row in rows[order].tolist()]
+
+
+class FuzzySession(object):
+    """Fuzzy search a collection of words as the search string is typed.
+
+    The words that matched the last search are kept, along with where
+    they matched.  When the next search string starts with the last
+    one, e.g. when another character is typed, only those words are
+    searched, and only for the new characters.  Any other search, e.g.
+    after a backspace, searches every word again.
+
+    The results are the same as :func:`fuzzy_search`.
+
+    :type corpus: collection, usually a list, a FuzzyCorpus or a
+        BatchFuzzyCorpus
+    :param corpus: The words to search.
+    """
+    def __init__(self, corpus):
+        if not isinstance(corpus, (FuzzyCorpus, BatchFuzzyCorpus)):
+            corpus = _WordList(corpus)
+        self._corpus = corpus
+        self._last_input = None
+        self._last_matches = None
+
+    def search(self, user_input, limit=None):
+        """Find the words that match the user input, best match first.
+
+        :type user_input: str
+        :param user_input: The search string.
+
+        :type limit: int
+        :param limit: The maximum number of words to return.  If not
+            given, every match is returned.
+
+        :rtype: list of strings
+        :return: The matching words, ordered by their score.
+        """
+        if self._last_input is not None and \
+                user_input.startswith(self._last_input):
+            matches = self._corpus._continue_matches(
+                self._last_matches, user_input[len(self._last_input):],
+                len(user_input))
+        else:
+            matches = self._corpus._matches(user_input)
+        self._last_matches = matches
+        self._last_input = user_input
+        return self._corpus._rank(matches, limit)
+
+
+def _continue_matches(matches, search_chars, input_length):
+    # Each match is a word, its length, the position after the last
+    # matched character and the score so far.  The matches are
+    # continued with more characters of the search string the same way
+    # calculate_score() matches them.
+    for word, length, start, score in matches:
+        if input_length > length:
+            continue
+        for search_char in search_chars:
+            i = word.find(search_char, start)
+            if i < 0:
+                break
+            if i > start and word[i - 1] == '-':
+                score *= 0.95
+            else:
+                score *= 1 - ((i - start) / float(length - start))
+            start = i + 1
+        else:
+            yield word, length, start, score
+
+
+def _scores(matches):
+    # The more characters that matched the word, the better
+    # so prefer more complete matches.
+    for word, length, start, score in matches:
+        yield word, score * (1 - ((length - start) / float(length)))
+
+
+def _rank(matches, limit):
+    candidates = [candidate for candidate in _scores(matches)
+                  if candidate[1] > 0]
+    if limit is None:
+        candidates.sort(key=itemgetter(1), reverse=True)
+    else:
+        candidates = heapq.nlargest(limit, candidates, key=itemgetter(1))
+    return [candidate[0] for candidate in candidates]
@@ -35,6 +35,10 @@ documentation based on what CLI version you have installed.
 * Command completion and documentation are automatically generated based
 on demand. If we notice you don't have an index available for the particular
 CLI version, we automatically generate the data.
+* The command completion index is stored in a packed binary format (see
+``awsshell.index.packed``) that is memory mapped on startup.  Nodes are only
+decoded as they're visited, so startup time doesn't depend on the number of
+services in the index.
 * The total amount of documentation for every command for every service is
 large.  We want to avoid loading the entire docset into memory, so we're not
 using JSON.  Instead we're using a DBM interface (via ``shelve``).  May
@@ -9,16 +9,28 @@ a higher level overview.
 
 """
 import os
-import json
+import re
+import logging
+import threading
 
 from awsshell.utils import FSLayer, FileReadError, build_config_file_path
+from awsshell.index import packed
+from awsshell.startup import PROFILER
 from awsshell import utils
 
 
+LOG = logging.getLogger(__name__)
+
+
 class IndexLoadError(Exception):
     """Raised when an index could not be loaded."""
 
 
+def _version_key(version_string):
+    return [int(part) if part.isdigit() else -1
+            for part in version_string.split('.')]
+
+
 class CompletionIndex(object):
     """Handles working with the local commmand completion index.
 
@@ -39,6 +51,7 @@ class CompletionIndex(object):
     # so that it doesn't have to recompute the completion cache
     # every time the CLI starts up.
     DEFAULT_CACHE_DIR = build_config_file_path('cache')
+    _PACKED_FILENAME_REGEX = re.compile(r'^completions-(.+)\.idx$')
 
     def __init__(self, cache_dir=DEFAULT_CACHE_DIR, fslayer=None):
         self._cache_dir = cache_dir
@@ -65,11 +78,61 @@ class CompletionIndex(object):
             raise IndexLoadError(str(e))
         return contents
 
+    def load_packed_index(self, version_string):
+        """Load the packed completion index for a given CLI version.
+
+        The index file is memory mapped, nodes are only decoded
+        as they're accessed.
+
+        :type version_string: str
+        :param version_string: The AWS CLI version, e.g "1.9.2".
+
+        :rtype: :class:`awsshell.index.packed.PackedIndex`
+
+        :raises: :class:`IndexLoadError <exceptions.IndexLoadError>`
+        """
+        filename = self._packed_filename_for_version(version_string)
+        try:
+            with PROFILER.phase('index_read'):
+                data = self._fslayer.map_file(filename)
+            with PROFILER.phase('index_parse'):
+                return packed.PackedIndex(data)
+        except (FileReadError, packed.InvalidIndexError) as e:
+            raise IndexLoadError(str(e))
+
+    def load_previous_packed_index(self, version_string):
+        """Load the newest packed index for a CLI version other than this one.
+
+        This is used to seed an incremental rebuild of the index
+        when the AWS CLI is upgraded.
+
+        :type version_string: str
+        :param version_string: The current AWS CLI version, e.g "1.9.2".
+
+        :rtype: :class:`awsshell.index.packed.PackedIndex`
+        :return: The previous index, or None if no usable index exists.
+        """
+        versions = []
+        for filename in self._fslayer.list_files(self._cache_dir):
+            match = self._PACKED_FILENAME_REGEX.match(filename)
+            if match is not None and match.group(1) != version_string:
+                versions.append(match.group(1))
+        for version in sorted(versions, key=_version_key, reverse=True):
+            try:
+                return self.load_packed_index(version)
+            except IndexLoadError:
+                continue
+        return None
+
     def _filename_for_version(self, version_string):
         return os.path.join(
             self._cache_dir, 'completions-%s.json' % version_string)
 
-    def load_completions(self):
+    def _packed_filename_for_version(self, version_string):
+        return os.path.join(
+            self._cache_dir, 'completions-%s.idx' % version_string)
+
+    def load_completions(self, index_data=None):
         """Load completions from the completion index.
 
         Updates the following attributes:
@@ -77,26 +140,207 @@ class CompletionIndex(object):
             * subcommands
             * global_opts
             * args_opts
+
+        :type index_data: :class:`awsshell.index.packed.PackedIndex`
+        :param index_data: An already loaded index to use.  If not
+            provided, the index for the current CLI version is loaded.
         """
-        try:
-            index_str = self.load_index(utils.AWSCLI_VERSION)
-        except IndexLoadError:
-            return
-        index_str = self.load_index(utils.AWSCLI_VERSION)
-        index_data = json.loads(index_str)
+        if index_data is None:
+            try:
+                index_data = self.load_packed_index(utils.AWSCLI_VERSION)
+            except IndexLoadError:
+                return
         index_root = index_data['aws']
         # ec2, s3, elb...
         self.commands = index_root['commands']
         # --profile, --region, --output...
         self.global_opts = index_root['arguments']
-        for command in self.commands:
-            # ec2: start-instances, stop-instances, terminate-instances...
-            subcommands_current = index_root['children'] \
-                .get(command)['commands']
-            self.subcommands.extend(subcommands_current)
-            for subcommand_current in subcommands_current:
-                # start-instances: --instance-ids, --dry-run...
-                args_opts_current = index_root['children'] \
-                    .get(command)['children'] \
-                    .get(subcommand_current)['arguments']
-                self.args_opts.update(args_opts_current)
+        # These are stored separately in the index so we don't have
+        # to decode every service and operation to get them.
+        # start-instances, stop-instances, terminate-instances...
+        self.subcommands.extend(index_data.subcommands)
+        # --instance-ids, --dry-run...
+        self.args_opts.update(index_data.operation_arguments)
+
+
+class IndexProvider(object):
+    """Share a single loaded completion index across the aws-shell.
+
+    The index file is loaded at most once.  The model completer, the
+    word lists of :class:`CompletionIndex` and the syntax highlighting
+    lexer are all derived from that one copy.
+
+    The index can also be loaded (and created if needed) on a background
+    thread with :meth:`load_in_background` so the prompt can be shown
+    before the index is ready.
+
+    :type completion_index: :class:`CompletionIndex`
+    :param completion_index: Used to load the index from disk.
+
+    :type version_string: str
+    :param version_string: The AWS CLI version of the index to load.
+        Defaults to the installed version.
+
+    :type status: str
+    :param status: A short description of what the background load
+        is currently doing, e.g ``'Indexing services 10/200...'``.  This is
+        empty when nothing is being loaded.
+
+    """
+    def __init__(self, completion_index=None, version_string=None):
+        if completion_index is None:
+            completion_index = CompletionIndex()
+        if version_string is None:
+            version_string = utils.AWSCLI_VERSION
+        self._completion_index = completion_index
+        self._version_string = version_string
+        self._index_data = None
+        self._completions = None
+        self._lexer = None
+        # The index may be loaded on a background thread while the
+        # completer and layout ask for it.
+        self._lock = threading.RLock()
+        self._loading = False
+        self._load_error = None
+        self._on_status_change = None
+        self.status = u''
+
+    def load_index(self):
+        """Return the completion index data.
+
+        :rtype: :class:`awsshell.index.packed.PackedIndex`
+
+        :raises: :class:`IndexLoadError <exceptions.IndexLoadError>`
+            Also raised if :meth:`load_in_background` failed, even if
+            the index data itself was loaded.
+        """
+        with self._lock:
+            if self._load_error is not None:
+                raise IndexLoadError(self._load_error)
+            if self._index_data is None:
+                self._index_data = self._completion_index.load_packed_index(
+                    self._version_string)
+            return self._index_data
+
+    def completions(self):
+        """Return a :class:`CompletionIndex` with its completions loaded.
+
+        If the index can't be loaded, the returned object has
+        empty completions.
+        """
+        with self._lock:
+            if self._completions is None:
+                completions = CompletionIndex()
+                try:
+                    completions.load_completions(self.load_index())
+                except IndexLoadError:
+                    return completions
+                self._completions = completions
+            return self._completions
+
+    def lexer(self):
+        """Return the syntax highlighting lexer class for the index.
+
+        The lexer is only created the first time it's requested,
+        which is also when pygments compiles its rules.
+        """
+        with self._lock:
+            if self._lexer is None:
+                from awsshell.lexer import create_lexer
+                self._lexer = create_lexer(self.completions())
+            return self._lexer
+
+    def create_index(self):
+        """Generate the index for the installed AWS CLI version.
+
+        If there's an index from a previous CLI version, only the
+        services whose models changed are indexed again.
+        """
+        previous_index = self._completion_index.load_previous_packed_index(
+            self._version_string)
+        if previous_index is None:
+            self._set_status(u'Creating autocomplete index...')
+        else:
+            self._set_status(u'Updating autocomplete index...')
+
+        def report_progress(num_indexed, total):
+            self._set_status(
+                u'Indexing services %s/%s...' % (num_indexed, total))
+
+        # makeindex imports the AWS CLI, so it's only imported
+        # when an index actually needs to be created.
+        from awsshell.makeindex import write_index
+        index_file = self._completion_index._packed_filename_for_version(
+            self._version_string)
+        try:
+            with PROFILER.phase('index_build'):
+                write_index(index_file, previous_index=previous_index,
+                            progress_callback=report_progress)
+        finally:
+            if previous_index is not None:
+                previous_index.close()
+
+    def load_or_create_index(self):
+        """Return the completion index data, creating the index if needed.
+
+        :rtype: :class:`awsshell.index.packed.PackedIndex`
+
+        :raises: :class:`IndexLoadError <exceptions.IndexLoadError>`
+        """
+        try:
+            return self.load_index()
+        except IndexLoadError:
+            self.create_index()
+        return self.load_index()
+
+    def is_loading(self):
+        """Return True while :meth:`load_in_background` is running."""
+        return self._loading
+
+    def load_in_background(self, on_status_change=None):
+        """Load the index and lexer on a background thread.
+
+        The index is created first if it doesn't exist.  While this is
+        running, :meth:`is_loading` returns True and :attr:`status`
+        describes the progress.
+
+        :type on_status_change: callable
+        :param on_status_change: Called with no arguments, from the
+            background thread, whenever :attr:`status` changes and once
+            loading has finished.
+
+        :rtype: :class:`threading.Thread`
+        :return: The thread loading the index.
+        """
+        self._loading = True
+        self._on_status_change = on_status_change
+        self._set_status(u'Loading autocomplete index...')
+        thread = threading.Thread(target=self._load_in_background)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _load_in_background(self):
+        status = u''
+        try:
+            self.load_or_create_index()
+            self._set_status(u'Loading syntax highlighting...')
+            with PROFILER.phase('lexer_compile'):
+                # Pygments compiles a lexer's rules the first
+                # time it's instantiated.
+                self.lexer()()
+        except Exception as e:
+            LOG.debug("Unable to load the completion index.", exc_info=True)
+            status = u'Autocomplete unavailable'
+            # The index may have been loaded before the failure, but
+            # it's not handed out since it may not be usable.
+            with self._lock:
+                self._load_error = str(e)
+        finally:
+            self._loading = False
+            self._set_status(status)
+
+    def _set_status(self, status):
+        self.status = status
+        if self._on_status_change is not None:
+            self._on_status_change()
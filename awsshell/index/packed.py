@@ -0,0 +1,410 @@
+"""Packed binary format for the completion index.
+
+The JSON completion index has to be read and parsed in its entirety
+before the first prompt is shown, even though a typical session only
+ever looks at a handful of services.  This module provides a compact
+binary encoding of the same command tree that can be memory mapped and
+decoded on demand: opening the file is close to free and only the nodes
+a user actually visits are ever turned into python objects.
+
+File layout (all integers are little endian unsigned 32 bit values)::
+
+    header:   magic (8 bytes), format version, string table offset,
+              string count, root node offset, fingerprint table offset,
+              vocabulary offset
+    nodes:    one record per command, children are written before
+              their parents
+    prints:   num_prints, num_prints * (command name, fingerprint)
+    vocab:    num_subcommands, num_subcommands * name,
+              num_arguments, num_arguments * name
+    strings:  (string count + 1) offsets into the blob, followed by
+              the utf-8 encoded blob
+
+Each node record is::
+
+    num_args, num_args * (name, flags, type_name, minidoc,
+                          example, api_name)
+    num_cmds, num_cmds * (name, child_offset)
+
+where every name/type_name/etc. is an index into the string table.  A
+``child_offset`` of 0 means the command has no child node in the index.
+
+The fingerprint table records, for each top level command, a
+fingerprint of the model it was generated from.  This lets a new index
+reuse subtrees from a previous index when their models haven't changed.
+
+The vocabulary section lists every operation name and every operation
+argument in the index.  These are needed up front (e.g for syntax
+highlighting), and storing them separately means they can be read
+without decoding every service in the index.
+
+Nodes are exposed through the same mapping interface as the
+JSON index (``node['commands']``, ``node['children'].get(name)``, ...)
+so anything that consumes the JSON index data can consume a
+:class:`PackedIndex` instead.
+
+"""
+import struct
+
+from awsshell.compat import Mapping
+
+
+MAGIC = b'AWSSHIDX'
+FORMAT_VERSION = 3
+
+_HEADER = struct.Struct('<8sIIIIII')
+_UINT32 = struct.Struct('<I')
+_ARGUMENT = struct.Struct('<IIIIII')
+_COMMAND = struct.Struct('<II')
+
+# Argument flags.
+_HAS_METADATA = 0x1
+_REQUIRED = 0x2
+# The argument only has metadata, it's not part of the
+# node's 'arguments' list.
+_METADATA_ONLY = 0x4
+
+_METADATA_FIELDS = ('type_name', 'minidoc', 'example', 'api_name')
+
+
+class InvalidIndexError(Exception):
+    """Raised when data is not a valid packed completion index."""
+
+
+def dumps(index_data, fingerprints=None):
+    """Encode JSON style completion index data as packed bytes.
+
+    :type index_data: dict
+    :param index_data: The completion index, e.g ``{'aws': {...}}``.
+        Nodes can also be :class:`PackedNode` objects from another
+        index, which lets unchanged subtrees be copied across.
+
+    :type fingerprints: dict
+    :param fingerprints: Optional mapping of top level command name
+        to the fingerprint of the model it was indexed from.
+
+    :rtype: bytes
+    :return: The packed representation of ``index_data``.
+
+    """
+    return _PackedIndexWriter().write(index_data, fingerprints or {})
+
+
+class _PackedIndexWriter(object):
+    def __init__(self):
+        self._strings = {}
+        self._string_list = []
+        self._body = bytearray()
+
+    def write(self, index_data, fingerprints):
+        self._body = bytearray(_HEADER.size)
+        root_offset = self._write_node(index_data['aws'])
+        fingerprints_offset = len(self._body)
+        self._write_fingerprints(fingerprints)
+        vocabulary_offset = len(self._body)
+        self._write_vocabulary(index_data['aws'])
+        string_table_offset = len(self._body)
+        self._write_string_table()
+        _HEADER.pack_into(self._body, 0, MAGIC, FORMAT_VERSION,
+                          string_table_offset, len(self._string_list),
+                          root_offset, fingerprints_offset,
+                          vocabulary_offset)
+        return bytes(self._body)
+
+    def _intern(self, value):
+        string_id = self._strings.get(value)
+        if string_id is None:
+            string_id = len(self._string_list)
+            self._strings[value] = string_id
+            self._string_list.append(value)
+        return string_id
+
+    def _write_node(self, node):
+        # Children are written first so we know their offsets
+        # by the time we write the parent record.
+        children = node.get('children', {})
+        child_offsets = {}
+        for name in node.get('commands', []):
+            if name in children:
+                child_offsets[name] = self._write_node(children[name])
+        offset = len(self._body)
+        arguments = self._argument_records(node)
+        self._body += _UINT32.pack(len(arguments))
+        for record in arguments:
+            self._body += _ARGUMENT.pack(*record)
+        commands = node.get('commands', [])
+        self._body += _UINT32.pack(len(commands))
+        for name in commands:
+            self._body += _COMMAND.pack(self._intern(name),
+                                        child_offsets.get(name, 0))
+        return offset
+
+    def _argument_records(self, node):
+        metadata = node.get('argument_metadata', {})
+        arguments = list(node.get('arguments', []))
+        names = arguments + [name for name in metadata
+                             if name not in arguments]
+        records = []
+        for i, name in enumerate(names):
+            flags = 0
+            fields = [''] * len(_METADATA_FIELDS)
+            if i >= len(arguments):
+                flags |= _METADATA_ONLY
+            if name in metadata:
+                flags |= _HAS_METADATA
+                arg_metadata = metadata[name]
+                if arg_metadata.get('required'):
+                    flags |= _REQUIRED
+                fields = [arg_metadata.get(field, '') or ''
+                          for field in _METADATA_FIELDS]
+            records.append([self._intern(name), flags] +
+                           [self._intern(field) for field in fields])
+        return records
+
+    def _write_fingerprints(self, fingerprints):
+        self._body += _UINT32.pack(len(fingerprints))
+        for name in sorted(fingerprints):
+            self._body += _COMMAND.pack(self._intern(name),
+                                        self._intern(fingerprints[name]))
+
+    def _write_vocabulary(self, root):
+        subcommands = []
+        seen = set()
+        arguments = set()
+        children = root.get('children', {})
+        for command in root.get('commands', []):
+            child = children.get(command)
+            if child is None:
+                continue
+            grandchildren = child.get('children', {})
+            for subcommand in child.get('commands', []):
+                if subcommand not in seen:
+                    seen.add(subcommand)
+                    subcommands.append(subcommand)
+                grandchild = grandchildren.get(subcommand)
+                if grandchild is not None:
+                    arguments.update(grandchild.get('arguments', []))
+        for names in (subcommands, sorted(arguments)):
+            self._body += _UINT32.pack(len(names))
+            for name in names:
+                self._body += _UINT32.pack(self._intern(name))
+
+    def _write_string_table(self):
+        encoded = [s.encode('utf-8') for s in self._string_list]
+        position = 0
+        for value in encoded:
+            self._body += _UINT32.pack(position)
+            position += len(value)
+        self._body += _UINT32.pack(position)
+        for value in encoded:
+            self._body += value
+
+
+class PackedIndex(Mapping):
+    """Read only view over a packed completion index.
+
+    This behaves like the JSON index data, a mapping of ``'aws'`` to
+    the root node, but nodes are only decoded as they're accessed.
+
+    :type data: bytes or mmap.mmap
+    :param data: The packed index data, typically a memory mapped file.
+
+    """
+    def __init__(self, data):
+        self._data = data
+        if len(data) < _HEADER.size:
+            raise InvalidIndexError("Index data is truncated.")
+        magic, version = _HEADER.unpack_from(data, 0)[:2]
+        if magic != MAGIC:
+            raise InvalidIndexError("Not a packed completion index.")
+        if version != FORMAT_VERSION:
+            raise InvalidIndexError(
+                "Unsupported index format version: %s" % version)
+        string_table_offset, string_count, root_offset, \
+            fingerprints_offset, vocabulary_offset = \
+            _HEADER.unpack_from(data, 0)[2:]
+        # The string table is written last, so a file that's been cut
+        # short is missing the end of the string table.
+        string_blob_start = (
+            string_table_offset + (string_count + 1) * _UINT32.size)
+        if any(offset < _HEADER.size or offset >= string_table_offset
+               for offset in (root_offset, fingerprints_offset,
+                              vocabulary_offset)) or \
+                string_blob_start > len(data):
+            raise InvalidIndexError("Index data is truncated.")
+        string_blob_size = _UINT32.unpack_from(
+            data, string_blob_start - _UINT32.size)[0]
+        if string_blob_start + string_blob_size > len(data):
+            raise InvalidIndexError("Index data is truncated.")
+        self._fingerprints_offset = fingerprints_offset
+        self._fingerprints = None
+        self._vocabulary_offset = vocabulary_offset
+        self._vocabulary = None
+        self._string_offsets_start = string_table_offset
+        self._string_blob_start = string_blob_start
+        self._string_cache = {}
+        self._root = PackedNode(self, root_offset)
+
+    def __getitem__(self, key):
+        if key == 'aws':
+            return self._root
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(['aws'])
+
+    def __len__(self):
+        return 1
+
+    @property
+    def fingerprints(self):
+        """Mapping of top level command name to its model fingerprint."""
+        if self._fingerprints is None:
+            offset = self._fingerprints_offset
+            count = _UINT32.unpack_from(self._data, offset)[0]
+            offset += _UINT32.size
+            fingerprints = {}
+            for _ in range(count):
+                name_id, fingerprint_id = _COMMAND.unpack_from(
+                    self._data, offset)
+                offset += _COMMAND.size
+                fingerprints[self.string(name_id)] = self.string(
+                    fingerprint_id)
+            self._fingerprints = fingerprints
+        return self._fingerprints
+
+    @property
+    def subcommands(self):
+        """Every unique operation name, e.g ``describe-instances``."""
+        return self._read_vocabulary()[0]
+
+    @property
+    def operation_arguments(self):
+        """Every unique operation argument name, e.g ``--instance-ids``."""
+        return self._read_vocabulary()[1]
+
+    def _read_vocabulary(self):
+        if self._vocabulary is None:
+            offset = self._vocabulary_offset
+            vocabulary = []
+            for _ in range(2):
+                count = _UINT32.unpack_from(self._data, offset)[0]
+                offset += _UINT32.size
+                string_ids = struct.unpack_from(
+                    '<%dI' % count, self._data, offset)
+                offset += count * _UINT32.size
+                vocabulary.append([self.string(i) for i in string_ids])
+            self._vocabulary = vocabulary
+        return self._vocabulary
+
+    def string(self, string_id):
+        """Return the string for the given string table index."""
+        try:
+            return self._string_cache[string_id]
+        except KeyError:
+            pass
+        offset = self._string_offsets_start + string_id * _UINT32.size
+        start = _UINT32.unpack_from(self._data, offset)[0]
+        end = _UINT32.unpack_from(self._data, offset + _UINT32.size)[0]
+        value = self._data[self._string_blob_start + start:
+                           self._string_blob_start + end].decode('utf-8')
+        self._string_cache[string_id] = value
+        return value
+
+    def unpack_from(self, struct_obj, offset):
+        return struct_obj.unpack_from(self._data, offset)
+
+    def close(self):
+        if hasattr(self._data, 'close'):
+            self._data.close()
+
+
+class PackedNode(Mapping):
+    """A single command in a :class:`PackedIndex`.
+
+    The node record is decoded the first time any of its keys are
+    accessed.  Child nodes are not decoded until they're looked up.
+
+    """
+    _KEYS = ('arguments', 'argument_metadata', 'commands', 'children')
+
+    def __init__(self, index, offset):
+        self._index = index
+        self._offset = offset
+        self._decoded = None
+
+    def __getitem__(self, key):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        if self._decoded is None:
+            self._decoded = self._decode()
+        return self._decoded[key]
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def _decode(self):
+        index = self._index
+        string = index.string
+        offset = self._offset
+        num_args = index.unpack_from(_UINT32, offset)[0]
+        offset += _UINT32.size
+        arguments = []
+        argument_metadata = {}
+        for _ in range(num_args):
+            record = index.unpack_from(_ARGUMENT, offset)
+            offset += _ARGUMENT.size
+            name = string(record[0])
+            flags = record[1]
+            if not flags & _METADATA_ONLY:
+                arguments.append(name)
+            if flags & _HAS_METADATA:
+                metadata = {'required': bool(flags & _REQUIRED)}
+                for field, string_id in zip(_METADATA_FIELDS, record[2:]):
+                    metadata[field] = string(string_id)
+                argument_metadata[name] = metadata
+        num_cmds = index.unpack_from(_UINT32, offset)[0]
+        offset += _UINT32.size
+        commands = []
+        child_offsets = {}
+        for _ in range(num_cmds):
+            name_id, child_offset = index.unpack_from(_COMMAND, offset)
+            offset += _COMMAND.size
+            name = string(name_id)
+            commands.append(name)
+            if child_offset:
+                child_offsets[name] = child_offset
+        return {
+            'arguments': arguments,
+            'argument_metadata': argument_metadata,
+            'commands': commands,
+            'children': PackedChildren(index, child_offsets),
+        }
+
+
+class PackedChildren(Mapping):
+    """Mapping of command name to its lazily decoded :class:`PackedNode`."""
+    def __init__(self, index, offsets):
+        self._index = index
+        self._offsets = offsets
+        self._nodes = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._nodes[key]
+        except KeyError:
+            node = PackedNode(self._index, self._offsets[key])
+            self._nodes[key] = node
+            return node
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, key):
+        return key in self._offsets
@@ -10,53 +10,96 @@
 # distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
+from prompt_toolkit.layout.lexers import Lexer, PygmentsLexer, SimpleLexer
 from pygments.lexer import RegexLexer
 from pygments.lexer import words
 from pygments.token import Keyword, Literal, Name, Operator, Text
 
-from awsshell.index.completion import CompletionIndex
-
 
 class ShellLexer(RegexLexer):
     """Provides highlighting for commands, subcommands, arguments, and options.
 
-    :type completion_index: :class:`CompletionIndex`
-    :param completion_index: Completion index used to determine commands,
-        subcommands, arguments, and options for highlighting.
+    This base class doesn't highlight anything, use :func:`create_lexer`
+    to create a lexer for a given completion index.
 
     :type tokens: dict
     :param tokens: A dict of (`pygments.lexer`, `pygments.token`) used for
         pygments highlighting.
     """
-    completion_index = CompletionIndex()
-    completion_index.load_completions()
     tokens = {
         'root': [
-            # ec2, s3, elb...
-            (words(
-                tuple(completion_index.commands),
-                prefix=r'\b',
-                suffix=r'\b'),
-             Literal.String),
-            # describe-instances
-            (words(
-                tuple(completion_index.subcommands),
-                prefix=r'\b',
-                suffix=r'\b'),
-             Name.Class),
-            # --instance-ids
-            (words(
-                tuple(list(completion_index.args_opts)),
-                prefix=r'',
-                suffix=r'\b'),
-             Keyword.Declaration),
-            # --profile
-            (words(
-                tuple(completion_index.global_opts),
-                prefix=r'',
-                suffix=r'\b'),
-             Operator.Word),
-            # Everything else
             (r'.*\n', Text),
         ]
     }
+
+
+def create_lexer(completion_index):
+    """Create a :class:`ShellLexer` subclass for a completion index.
+
+    Building the token rules is deferred until this is called so that
+    importing this module doesn't require loading the completion index.
+
+    :type completion_index: :class:`CompletionIndex`
+    :param completion_index: Completion index used to determine commands,
+        subcommands, arguments, and options for highlighting.  Its
+        completions are expected to already be loaded.
+
+    :rtype: type
+    :return: A :class:`ShellLexer` subclass.
+    """
+    class IndexShellLexer(ShellLexer):
+        tokens = {
+            'root': [
+                # ec2, s3, elb...
+                (words(
+                    tuple(completion_index.commands),
+                    prefix=r'\b',
+                    suffix=r'\b'),
+                 Literal.String),
+                # describe-instances
+                (words(
+                    tuple(completion_index.subcommands),
+                    prefix=r'\b',
+                    suffix=r'\b'),
+                 Name.Class),
+                # --instance-ids
+                (words(
+                    tuple(list(completion_index.args_opts)),
+                    prefix=r'',
+                    suffix=r'\b'),
+                 Keyword.Declaration),
+                # --profile
+                (words(
+                    tuple(completion_index.global_opts),
+                    prefix=r'',
+                    suffix=r'\b'),
+                 Operator.Word),
+                # Everything else
+                (r'.*\n', Text),
+            ]
+        }
+    return IndexShellLexer
+
+
+class DeferredLexer(Lexer):
+    """A prompt_toolkit lexer for a pygments lexer that isn't ready yet.
+
+    Input isn't highlighted until ``get_lexer`` returns a lexer class,
+    after which all highlighting is delegated to it.
+
+    :type get_lexer: callable
+    :param get_lexer: Returns the pygments lexer class, or None if it
+        isn't available yet.
+    """
+    def __init__(self, get_lexer):
+        self._get_lexer = get_lexer
+        self._lexer = None
+        self._fallback = SimpleLexer()
+
+    def lex_document(self, cli, document):
+        if self._lexer is None:
+            lexer_cls = self._get_lexer()
+            if lexer_cls is None:
+                return self._fallback.lex_document(cli, document)
+            self._lexer = PygmentsLexer(lexer_cls)
+        return self._lexer.lex_document(cli, document)
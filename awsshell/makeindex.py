@@ -1,23 +1,39 @@
 """Module for building the autocompletion indices."""
 from __future__ import print_function
 import os
-import json
+import heapq
+import hashlib
+import argparse
+import tempfile
+import itertools
+import multiprocessing
+from collections import Counter
 
 from six import BytesIO
 from docutils.core import publish_string
 import awscli.clidriver
 from awscli.argprocess import ParamShorthandDocGen
+from botocore.exceptions import DataNotFoundError
+from prompt_toolkit.history import FileHistory
 try:
     from botocore.docs.bcdoc import textwriter
 except ImportError:
     from awscli.bcdoc import textwriter
 
 from awsshell import determine_doc_index_filename
-from awsshell.utils import remove_html
+from awsshell.db import ConcurrentDBM
+from awsshell.utils import remove_html, AWSCLI_VERSION
+from awsshell.index import completion
+from awsshell.index import packed
 from awsshell import docs
+from awsshell import compat
 
 
 SHORTHAND_DOC = ParamShorthandDocGen()
+# The models that contribute to the generated commands and arguments
+# of a service, e.g paginators add --max-items and waiters add a
+# "wait" command.
+FINGERPRINT_MODEL_TYPES = ('service-2', 'paginators-1', 'waiters-2')
 
 
 def new_index():
@@ -25,7 +41,24 @@ def new_index():
             'commands': [], 'children': {}}
 
 
-def index_command(index_dict, help_command):
+def index_command(index_dict, help_command, existing_children=None):
+    if existing_children is None:
+        existing_children = {}
+    index_arguments(index_dict, help_command)
+    for cmd in help_command.command_table:
+        index_dict['commands'].append(cmd)
+        if cmd in existing_children:
+            index_dict['children'][cmd] = existing_children[cmd]
+            continue
+        # Each sub command will trigger a recurse.
+        child = new_index()
+        index_dict['children'][cmd] = child
+        sub_command = help_command.command_table[cmd]
+        sub_help_command = sub_command.create_help_command()
+        index_command(child, sub_help_command)
+
+
+def index_arguments(index_dict, help_command):
     arg_table = help_command.arg_table
     for arg in arg_table:
         arg_obj = arg_table[arg]
@@ -52,31 +85,269 @@ def index_command(index_dict, help_command):
 
         index_dict['arguments'].append('--%s' % arg)
         index_dict['argument_metadata']['--%s' % arg] = metadata
-    for cmd in help_command.command_table:
+
+
+def index_command_parallel(index_dict, help_command, max_workers=None,
+                           existing_children=None, progress_callback=None):
+    """Index a command, fanning out its sub commands to a process pool.
+
+    Each sub command (typically a service) is indexed in a separate
+    worker process and the resulting subtrees are merged back in
+    ``help_command.command_table`` order, so the result is
+    identical to calling :func:`index_command`.
+
+    :type max_workers: int
+    :param max_workers: The number of worker processes to use.
+        Defaults to the number of CPUs on the machine.
+
+    :type existing_children: dict
+    :param existing_children: Already indexed subtrees keyed by
+        sub command name.  These are copied into the index instead
+        of being indexed again.
+
+    :type progress_callback: callable
+    :param progress_callback: Called with ``(num_indexed, total)``
+        each time a sub command finishes indexing.
+
+    """
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    if existing_children is None:
+        existing_children = {}
+    index_arguments(index_dict, help_command)
+    command_table = help_command.command_table
+    to_index = [cmd for cmd in command_table if cmd not in existing_children]
+    lineages = [command_table[cmd].lineage_names for cmd in to_index]
+    pool = create_worker_pool(max_workers)
+    try:
+        # imap() lets workers pick up commands as soon as they're free
+        # while still giving us the results back in submission order.
+        indexed = {}
+        results = pool.imap(_index_lineage, lineages, chunksize=1)
+        for cmd, child in zip(to_index, results):
+            indexed[cmd] = child
+            if progress_callback is not None:
+                progress_callback(len(indexed), len(to_index))
+    finally:
+        pool.close()
+        pool.join()
+    for cmd in command_table:
         index_dict['commands'].append(cmd)
-        # Each sub command will trigger a recurse.
-        child = new_index()
-        index_dict['children'][cmd] = child
-        sub_command = help_command.command_table[cmd]
-        sub_help_command = sub_command.create_help_command()
-        index_command(child, sub_help_command)
+        if cmd in existing_children:
+            index_dict['children'][cmd] = existing_children[cmd]
+        else:
+            index_dict['children'][cmd] = indexed[cmd]
+
+
+# The root help command for an index worker process.  Help commands
+# can't be pickled so each worker creates its own clidriver.
+_WORKER_HELP_COMMAND = None
+# A worker's connection to the doc db, used to check for docs that
+# were rendered after the worker was handed its service.
+_WORKER_DOC_DB = None
+
 
+def create_worker_pool(processes=None):
+    """Create a pool of processes that can index and render commands."""
+    return multiprocessing.Pool(processes=processes,
+                                initializer=_init_index_worker)
 
-def write_index(output_filename=None):
+
+def _init_index_worker():
+    global _WORKER_HELP_COMMAND
+    driver = awscli.clidriver.create_clidriver()
+    _WORKER_HELP_COMMAND = driver.create_help_command()
+
+
+def _help_command_for_lineage(lineage_names):
+    help_command = _WORKER_HELP_COMMAND
+    for name in lineage_names:
+        help_command = help_command.command_table[name].create_help_command()
+    return help_command
+
+
+def render_command_docs(lineage_names):
+    """Render the docs of a single command in a worker process.
+
+    :type lineage_names: list
+    :param lineage_names: The names of the command and its parent
+        commands, e.g ``['ec2', 'describe-instances']``.
+
+    :return: The rendered docs, or ``None`` if the command doesn't exist.
+    """
+    try:
+        help_command = _help_command_for_lineage(lineage_names)
+    except KeyError:
+        return None
+    return render_docs_for_cmd(help_command)
+
+
+def _index_lineage(lineage_names):
+    help_command = _help_command_for_lineage(lineage_names)
+    child = new_index()
+    index_command(child, help_command)
+    return child
+
+
+def service_fingerprint(service_name, loader):
+    """Fingerprint the botocore models a service is generated from.
+
+    The fingerprint is the latest API version of the service
+    along with a hash of its model files.  If any model that affects
+    the service's commands or arguments changes, so does the
+    fingerprint.
+
+    :type loader: :class:`botocore.loaders.Loader`
+    :param loader: The data loader used to locate the model files.
+
+    :rtype: str
+    :return: The fingerprint, or None if the model can't be found.
+
+    """
+    try:
+        api_version = loader.determine_latest_version(
+            service_name, 'service-2')
+    except DataNotFoundError:
+        return None
+    digest = hashlib.sha1()
+    for type_name in FINGERPRINT_MODEL_TYPES:
+        filename = _find_model_file(
+            loader, service_name, api_version, type_name)
+        if filename is not None:
+            with open(filename, 'rb') as f:
+                digest.update(f.read())
+    return '%s:%s' % (api_version, digest.hexdigest())
+
+
+def _find_model_file(loader, service_name, api_version, type_name):
+    # Mirrors the search order of the botocore loader, the first
+    # search path with the model wins.
+    for search_path in loader.search_paths:
+        for extension in ('.json', '.json.gz'):
+            filename = os.path.join(search_path, service_name, api_version,
+                                    type_name + extension)
+            if os.path.isfile(filename):
+                return filename
+    return None
+
+
+def command_fingerprints(help_command, loader):
+    """Return the model fingerprint of each top level command.
+
+    Commands that aren't generated from a service model (CLI
+    customizations such as ``s3`` or ``configure``) have no
+    fingerprint and are always indexed.
+
+    """
+    fingerprints = {}
+    for cmd in help_command.command_table:
+        # The botocore service name, which can differ from the
+        # command name (e.g "s3api" -> "s3").
+        service_name = getattr(
+            help_command.command_table[cmd], '_service_name', None)
+        if service_name is None:
+            continue
+        fingerprint = service_fingerprint(service_name, loader)
+        if fingerprint is not None:
+            fingerprints[cmd] = fingerprint
+    return fingerprints
+
+
+def write_index(output_filename=None, max_workers=None, previous_index=None,
+                progress_callback=None):
+    """Generate the completion index and write it to ``output_filename``.
+
+    :type max_workers: int
+    :param max_workers: The number of processes used to build the
+        index.  Defaults to the number of CPUs on the machine.  A value
+        of 1 builds the index serially in the current process.
+
+    :type previous_index: :class:`awsshell.index.packed.PackedIndex`
+    :param previous_index: An index generated by another version of the
+        AWS CLI.  Services whose model fingerprint hasn't changed are
+        copied from this index instead of being indexed again.
+
+    :type progress_callback: callable
+    :param progress_callback: Called with ``(num_indexed, total)`` as
+        services finish indexing.  Services copied from
+        ``previous_index`` aren't counted.
+
+    """
+    if output_filename is None:
+        output_filename = completion.CompletionIndex()\
+            ._packed_filename_for_version(AWSCLI_VERSION)
     driver = awscli.clidriver.create_clidriver()
     help_command = driver.create_help_command()
+    fingerprints = command_fingerprints(
+        help_command, driver.session.get_component('data_loader'))
+    existing_children = {}
+    if previous_index is not None:
+        previous_fingerprints = previous_index.fingerprints
+        previous_children = previous_index['aws']['children']
+        for cmd, fingerprint in fingerprints.items():
+            if previous_fingerprints.get(cmd) == fingerprint and \
+                    cmd in previous_children:
+                existing_children[cmd] = previous_children[cmd]
     index = {'aws': new_index()}
     current = index['aws']
-    index_command(current, help_command)
+    if max_workers == 1:
+        index_command(current, help_command, existing_children)
+    else:
+        index_command_parallel(current, help_command, max_workers,
+                               existing_children, progress_callback)
 
-    result = json.dumps(index)
+    result = packed.dumps(index, fingerprints)
     if not os.path.isdir(os.path.dirname(output_filename)):
         os.makedirs(os.path.dirname(output_filename))
-    with open(output_filename, 'w') as f:
-        f.write(result)
+    write_file_atomically(output_filename, result)
+
+
+def write_file_atomically(filename, contents):
+    """Replace the contents of a file without modifying it in place.
 
+    The contents are written to a temporary file in the same directory
+    which is then moved over the file.  Any process that has the old
+    file open or memory mapped keeps reading the old contents, and the
+    file is never left partially written.
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    f = tempfile.NamedTemporaryFile(dir=dirname, delete=False,
+                                    prefix=os.path.basename(filename),
+                                    suffix='.tmp')
+    try:
+        with f:
+            f.write(contents)
+        compat.replace_file(f.name, filename)
+    except Exception:
+        if os.path.exists(f.name):
+            os.remove(f.name)
+        raise
+
+
+def write_doc_index(output_filename=None, db=None, help_command=None,
+                    max_workers=None, compress=False, on_write=None,
+                    command_usage=None):
+    """Render the docs for every command and write them to the doc db.
+
+    :type max_workers: int
+    :param max_workers: The number of processes used to render the
+        docs.  Defaults to the number of CPUs on the machine.  A value
+        of 1 renders the docs serially in the current process.
+
+    :type compress: bool
+    :param compress: Compress the docs with zlib, using a preset
+        dictionary trained on the docs being written.
+
+    :type on_write: callable
+    :param on_write: Called with the list of dotted command names
+        whose docs were written, each time a service is written.
+
+    :type command_usage: dict
+    :param command_usage: How often each service and operation has been
+        used, as returned by :func:`load_command_usage`.  The docs the
+        user is most likely to look at are rendered first.
 
-def write_doc_index(output_filename=None, db=None, help_command=None):
+    """
     if output_filename is None:
         output_filename = determine_doc_index_filename()
     user_provided_db = True
@@ -88,13 +359,25 @@ def write_doc_index(output_filename=None, db=None, help_command=None):
         help_command = driver.create_help_command()
 
     should_close = not user_provided_db
-    do_write_doc_index(db, help_command, close_db_on_finish=should_close)
+    do_write_doc_index(db, help_command, close_db_on_finish=should_close,
+                       max_workers=max_workers, compress=compress,
+                       on_write=on_write, command_usage=command_usage)
 
 
-def do_write_doc_index(db, help_command, close_db_on_finish):
+def do_write_doc_index(db, help_command, close_db_on_finish,
+                       max_workers=None, compress=False, on_write=None,
+                       command_usage=None):
     try:
-        _index_docs(db, help_command)
+        writer = DocIndexWriter(db, compress=compress, on_write=on_write)
+        writer.index_existing_docs()
+        if max_workers == 1:
+            _index_docs(writer, help_command, command_usage)
+        else:
+            _index_docs_parallel(writer, help_command, max_workers,
+                                 command_usage)
+        writer.flush()
         db['__complete__'] = 'true'
+        db[docs.SEARCH_COMPLETE_KEY] = 'true'
     finally:
         if close_db_on_finish:
             # If the user provided their own db object,
@@ -104,14 +387,334 @@ def do_write_doc_index(db, help_command, close_db_on_finish):
             db.close()
 
 
-def _index_docs(db, help_command):
+def service_complete_key(dotted_name):
+    """Return the doc db key marking a service's docs as complete."""
+    return '__complete__:%s' % dotted_name
+
+
+def load_command_usage(history_filename):
+    """Count the services and operations used in the aws-shell history.
+
+    :type history_filename: str
+    :param history_filename: The aws-shell's history file.
+
+    :rtype: collections.Counter
+    :return: The number of commands that used each service, keyed by
+        e.g ``('ec2',)``, and each operation, keyed by
+        e.g ``('ec2', 'describe-instances')``.
+    """
+    usage = Counter()
+    for text in FileHistory(history_filename):
+        # Dot commands and shell commands aren't AWS CLI commands.
+        if text.startswith(('.', '!')):
+            continue
+        words = text.split()
+        if words and words[0] == 'aws':
+            words = words[1:]
+        if not words or words[0].startswith('-'):
+            continue
+        usage[(words[0],)] += 1
+        if len(words) > 1 and not words[1].startswith('-'):
+            usage[(words[0], words[1])] += 1
+    return usage
+
+
+class DocIndexWriter(object):
+    """Write the rendered docs of each service to the doc db.
+
+    Besides the full docs, the sections of each command's docs are
+    written so they can be looked up individually.
+
+    When compressing, the zlib preset dictionary is trained on the
+    docs of the services written first, so services are held back
+    until ``TRAINING_SAMPLE_SIZE`` docs have been written.  Docs of
+    individual commands are written right away, uncompressed until
+    there's a dictionary.  If a compressed doc index is being resumed,
+    its existing dictionary is used.
+
+    :type on_write: callable
+    :param on_write: Called with the list of dotted command names
+        whose docs were written, each time a service is written.
+
+    """
+    TRAINING_SAMPLE_SIZE = 200
+
+    def __init__(self, db, compress=False, on_write=None):
+        self.db = db
+        self._on_write = on_write
+        self._compress = compress
+        self._compressor = None
+        self._pending = []
+        self._num_pending_docs = 0
+        self._wrote_global_options = False
+        if compress:
+            self._load_dictionary()
+
+    def _load_dictionary(self):
+        try:
+            zdict = self.db[docs.DICTIONARY_KEY]
+        except KeyError:
+            pass
+        else:
+            self._compressor = docs.DocCompressor(bytes(zdict))
+
+    def write_command(self, dotted_name, text):
+        """Write the docs of a single command right away.
+
+        This is used to write docs rendered on demand, so the command's
+        service isn't marked complete.
+        """
+        self.write_commands([(dotted_name, text)])
+
+    def write_service(self, dotted_name, service_docs):
+        """Write the docs of a service and mark the service complete.
+
+        :type service_docs: list
+        :param service_docs: A list of ``(dotted_name, text)`` tuples.
+        """
+        self._pending.append((dotted_name, service_docs))
+        self._num_pending_docs += len(service_docs)
+        if not self._compress or self._compressor is not None or \
+                self._num_pending_docs >= self.TRAINING_SAMPLE_SIZE:
+            self.flush()
+
+    def write_commands(self, command_docs):
+        """Write the docs of commands right away.
+
+        The commands' services aren't marked complete.  These are the
+        docs that are needed first, so if the dictionary hasn't been
+        trained yet they're written uncompressed instead of being held
+        back.
+
+        :type command_docs: list
+        :param command_docs: A list of ``(dotted_name, text)`` tuples.
+        """
+        if self._compress and self._compressor is None:
+            # Another writer may have trained it since.
+            self._load_dictionary()
+        self._write_docs(None, command_docs)
+
+    def flush(self):
+        """Write any docs that are being held back."""
+        if self._compress and self._compressor is None:
+            zdict = b''
+            if compat.PY3:
+                # zlib only supports preset dictionaries on python 3.
+                zdict = docs.train_dictionary(
+                    [text for _, service_docs in self._pending
+                     for _, text in service_docs])
+            # The dictionary is committed before any docs that need it.
+            # Another shell may be building the same doc index, so the
+            # dictionary is only written if it doesn't exist yet and
+            # the docs are compressed with whichever one is stored.
+            zdict = self.db.setdefault(docs.DICTIONARY_KEY, zdict)
+            self._compressor = docs.DocCompressor(bytes(zdict))
+        for dotted_name, service_docs in self._pending:
+            self._write_docs(dotted_name, service_docs)
+        self._pending = []
+        self._num_pending_docs = 0
+
+    def _write_docs(self, dotted_name, service_docs):
+        # The help pane looks up docs by section, so each command's
+        # docs are also stored split up into sections.  These are
+        # written first so they exist once a service is complete.
+        # Plain mappings (as used in tests) only get the full docs.
+        # The full text search entries are written alongside them.
+        if hasattr(self.db, 'update_sections'):
+            self.db.update_sections(self._iter_sections(service_docs))
+            self.db.update_search(docs.search_entry(key, text)
+                                  for key, text in service_docs)
+        written = [key for key, _ in service_docs]
+        service_docs = [(key, self._encode(text))
+                        for key, text in service_docs]
+        # Writing the docs with a single update() commits them in
+        # batches instead of once per key.  The completion marker
+        # comes last, so it's only committed once the rest of the
+        # service's docs are.
+        if dotted_name is not None:
+            service_docs.append(
+                (service_complete_key(dotted_name), 'true'))
+        self.db.update(service_docs)
+        if self._on_write is not None:
+            self._on_write(written)
+
+    def index_existing_docs(self):
+        """Write search entries for docs that were written without them.
+
+        Doc indexes created before search was added are complete except
+        for their search entries, which are added from the existing docs.
+        """
+        if not hasattr(self.db, 'keys_without_search_entries'):
+            return
+        keys = self.db.keys_without_search_entries()
+        if not keys:
+            return
+        try:
+            zdict = bytes(self.db[docs.DICTIONARY_KEY])
+        except KeyError:
+            zdict = None
+        compressor = docs.DocCompressor(zdict)
+        self.db.update_search(
+            docs.search_entry(key, compressor.decompress(self.db[key]))
+            for key in keys)
+
+    def _iter_sections(self, service_docs):
+        for key, docs_text in service_docs:
+            sections, global_sections = docs.split_sections(docs_text)
+            for name, text in sections:
+                yield key, name, self._encode(text)
+            if global_sections and not self._wrote_global_options:
+                self._wrote_global_options = True
+                for name, text in global_sections:
+                    yield docs.GLOBAL_OPTIONS_KEY, name, self._encode(text)
+
+    def _encode(self, text):
+        if self._compressor is None:
+            return text
+        return self._compressor.compress(text)
+
+
+def _index_docs(writer, help_command, command_usage=None):
+    for command, rendered in _docs_to_render(writer.db, help_command,
+                                             command_usage):
+        dotted_name = '.'.join(['aws'] + command.lineage_names)
+        if rendered is None:
+            writer.write_commands([(dotted_name, render_docs_for_cmd(
+                command.create_help_command()))])
+            continue
+        service_docs = []
+        _render_command_docs(command.create_help_command(), dotted_name,
+                             _RenderedDocs(rendered, writer.db),
+                             service_docs)
+        writer.write_service(dotted_name, service_docs)
+
+
+def _index_docs_parallel(writer, help_command, max_workers=None,
+                         command_usage=None):
+    # Rendering is CPU bound pure python (docutils), so each service is
+    # rendered in a worker process and this process only writes the
+    # results to the db.  When the docs are built from the shell, none
+    # of the rendering happens in the shell's process.
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    doc_index_file = getattr(writer.db, 'filename', None)
+    to_render = []
+    # The service of each operation that's rendered on its own.
+    operation_services = {}
+    for command, rendered in _docs_to_render(writer.db, help_command,
+                                             command_usage):
+        to_render.append((command.lineage_names, rendered, doc_index_file))
+        if rendered is None:
+            operation_services['.'.join(['aws'] + command.lineage_names)] = \
+                'aws.' + command.lineage_names[0]
+    if not to_render:
+        return
+    # A service is only marked complete once the operations that were
+    # rendered on their own have been written, so its results are held
+    # back until then.
+    outstanding = Counter(operation_services.values())
+    held = {}
+    pool = create_worker_pool(max_workers)
+    try:
+        for dotted_name, service_docs in pool.imap_unordered(
+                _render_lineage_docs, to_render, chunksize=1):
+            service = operation_services.get(dotted_name)
+            if service is not None:
+                writer.write_commands(service_docs)
+                outstanding[service] -= 1
+                if not outstanding[service] and service in held:
+                    writer.write_service(service, held.pop(service))
+            elif outstanding[dotted_name]:
+                held[dotted_name] = service_docs
+            else:
+                writer.write_service(dotted_name, service_docs)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _docs_to_render(db, help_command, command_usage=None):
+    # The doc index is built in a daemon thread, so it's often
+    # interrupted when the shell exits.  Services are marked complete
+    # once all of their docs are written, and docs that are already in
+    # the db aren't rendered again, so the next build picks up where
+    # the last one left off.
+    #
+    # The docs the user is most likely to look at are rendered first.
+    # Operations the user has used are rendered on their own, most used
+    # first, and are yielded with ``None`` in place of the rendered
+    # docs.  Then come the services the user has used, most used first,
+    # and finally the rest of the services in command table order.
+    if command_usage is None:
+        command_usage = {}
+    existing_keys = set(db.keys())
+    queue = []
+    sequence = itertools.count()
     for command_name in help_command.command_table:
         command = help_command.command_table[command_name]
-        sub_help_command = command.create_help_command()
-        text_docs = render_docs_for_cmd(sub_help_command)
         dotted_name = '.'.join(['aws'] + command.lineage_names)
-        db[dotted_name] = text_docs
-        _index_docs(db, sub_help_command)
+        if service_complete_key(dotted_name) in existing_keys:
+            continue
+        prefix = dotted_name + '.'
+        rendered = set(key for key in existing_keys
+                       if key == dotted_name or key.startswith(prefix))
+        service_usage = command_usage.get((command_name,), 0)
+        if service_usage:
+            operations = command.create_help_command().command_table
+            for operation_name in operations:
+                usage = command_usage.get((command_name, operation_name), 0)
+                operation_key = prefix + operation_name
+                if usage and operation_key not in rendered:
+                    rendered.add(operation_key)
+                    heapq.heappush(queue, (0, -usage, next(sequence),
+                                           operations[operation_name], None))
+        heapq.heappush(queue, (1, -service_usage, next(sequence),
+                               command, rendered))
+    while queue:
+        command, rendered = heapq.heappop(queue)[3:]
+        yield command, rendered
+
+
+class _RenderedDocs(object):
+    # The docs that don't need to be rendered.  Besides the docs that
+    # existed when the build started, the db is checked for docs that
+    # were rendered on demand since, e.g by the shell's help pane.
+    def __init__(self, rendered, db=None):
+        self._rendered = rendered
+        self._db = db
+
+    def __contains__(self, dotted_name):
+        if dotted_name in self._rendered:
+            return True
+        return self._db is not None and dotted_name in self._db
+
+
+def _render_lineage_docs(args):
+    global _WORKER_DOC_DB
+    lineage_names, rendered, doc_index_file = args
+    if doc_index_file is not None and _WORKER_DOC_DB is None:
+        _WORKER_DOC_DB = ConcurrentDBM.open(doc_index_file, read_only=True)
+    help_command = _help_command_for_lineage(lineage_names)
+    dotted_name = '.'.join(['aws'] + lineage_names)
+    if rendered is None:
+        # An operation that's rendered ahead of the rest of its service.
+        return dotted_name, [(dotted_name, render_docs_for_cmd(help_command))]
+    service_docs = []
+    _render_command_docs(help_command, dotted_name,
+                         _RenderedDocs(rendered, _WORKER_DOC_DB),
+                         service_docs)
+    return dotted_name, service_docs
+
+
+def _render_command_docs(help_command, dotted_name, rendered, service_docs):
+    if dotted_name not in rendered:
+        service_docs.append(
+            (dotted_name, render_docs_for_cmd(help_command)))
+    for command_name in help_command.command_table:
+        command = help_command.command_table[command_name]
+        _render_command_docs(command.create_help_command(),
+                             '.'.join(['aws'] + command.lineage_names),
+                             rendered, service_docs)
 
 
 def render_docs_for_cmd(help_command):
@@ -187,3 +790,20 @@ class BasicTextTranslator(textwriter.TextTranslator):
 
     def depart_literal(self, node):
         pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate the aws-shell completion index.')
+    parser.add_argument('-o', '--output', help='The file to write the '
+                        'completion index to.  Defaults to the aws-shell '
+                        'cache directory.')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='Number of processes used to build the index. '
+                        'Defaults to the number of CPUs.')
+    args = parser.parse_args()
+    write_index(args.output, max_workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,10 +12,12 @@ logic, see awsshell.autocomplete.
 import os
 import logging
 
-import botocore.session
 from prompt_toolkit.completion import Completer, Completion
 
 from awsshell import fuzzy
+from awsshell.index.completion import IndexLoadError
+from awsshell.startup import PROFILER
+from awsshell.utils import LRUCache
 
 
 LOG = logging.getLogger(__name__)
@@ -28,17 +30,48 @@ class AWSShellCompleter(Completer):
     Not to be confused with the AWSCLIModelCompleter, which is more
     low level, and can be reused in contexts other than the
     aws shell.
+
+    If an ``index_provider`` is given, the model completer's index is
+    taken from it.  While the provider is loading the index in the
+    background, no completions are returned.
+
+    The completions of each completion state are cached, for at most
+    ``cache_size`` completions in total, so going back to a state, e.g.
+    with a backspace, doesn't search and convert them again.
     """
-    def __init__(self, completer, server_side_completer=None):
+    CACHE_SIZE = 10000
+
+    def __init__(self, completer, server_side_completer=None,
+                 index_provider=None, cache_size=CACHE_SIZE):
         self._completer = completer
-        if server_side_completer is None:
-            server_side_completer = self._create_server_side_completer()
+        self._index_provider = index_provider
+        # Empty lists of completions still take up an entry.
+        self._cache = LRUCache(cache_size,
+                               get_size=lambda value: len(value) + 1)
+        # Server side completion needs botocore, which is expensive to
+        # import and set up.  If a server side completer isn't provided,
+        # one is created the first time we need a server side completion.
         self._server_side_completer = server_side_completer
+        self._profile_name = None
+        # The server side results are fuzzy searched with a session
+        # while they stay the same, e.g. while a resource id is typed.
+        self._server_side_results = None
+        self._server_side_search = None
+
+    @property
+    def server_side_completer(self):
+        if self._server_side_completer is None:
+            self._server_side_completer = \
+                self._create_server_side_completer()
+        return self._server_side_completer
 
     def _create_server_side_completer(self, session=None):
+        import botocore.session
         from awsshell.resource import index
         if session is None:
-            session = botocore.session.Session()
+            with PROFILER.phase('botocore_session'):
+                session = botocore.session.Session(
+                    profile=self._profile_name)
         loader = session.get_component('data_loader')
         completions_path = os.path.join(
             os.path.dirname(os.path.abspath(__file__)),
@@ -52,8 +85,10 @@ class AWSShellCompleter(Completer):
 
     def change_profile(self, profile_name):
         """Change the profile used for server side completions."""
-        self._server_side_completer = self._create_server_side_completer(
-            session=botocore.session.Session(profile=profile_name))
+        self._profile_name = profile_name
+        # The server side completer for the new profile
+        # is created the next time it's needed.
+        self._server_side_completer = None
 
     @property
     def completer(self):
@@ -62,6 +97,24 @@ class AWSShellCompleter(Completer):
     @completer.setter
     def completer(self, value):
         self._completer = value
+        self.invalidate_cache()
+
+    def invalidate_cache(self):
+        """Discard the cached completions.
+
+        This needs to be called when the completions of a completion
+        state change, e.g. when fuzzy matching is turned on or off.
+        """
+        self._cache.clear()
+
+    def cache_stats(self):
+        """Return the number of cache hits and misses.
+
+        :rtype: dict
+        :return: The number of completions looked up in the cache that
+            were found (``hits``) and weren't found (``misses``).
+        """
+        return {'hits': self._cache.hits, 'misses': self._cache.misses}
 
     @property
     def last_option(self):
@@ -105,11 +158,56 @@ class AWSShellCompleter(Completer):
             yield Completion(completion, location,
                              display=display_text, display_meta=display_meta)
 
+    def _index_ready(self):
+        provider = self._index_provider
+        if provider is None:
+            return True
+        if provider.is_loading():
+            return False
+        # The index is handed over to the model completer here, rather
+        # than from the loading thread, so it never changes in the
+        # middle of an autocomplete() call.
+        self._index_provider = None
+        try:
+            self._completer.load_index(provider.load_index())
+        except IndexLoadError:
+            LOG.debug("Completion index unavailable.", exc_info=True)
+        self.invalidate_cache()
+        return True
+
+    def _get_prompt_completions(self, text_before_cursor):
+        completer = self._completer
+        words = text_before_cursor.split()
+        if not words:
+            return list(self._convert_to_prompt_completions(
+                completer.autocomplete(text_before_cursor),
+                text_before_cursor))
+        # The completions only depend on the command being completed,
+        # the word being completed and whether it's been completed with
+        # a space, so a state that's been seen before only needs the
+        # line to be parsed.
+        completer.parse(text_before_cursor)
+        key = (tuple(completer.cmd_path), words[-1], completer.match_fuzzy,
+               text_before_cursor[-1] == ' ')
+        prompt_completions = self._cache.get(key)
+        if prompt_completions is None:
+            prompt_completions = list(self._convert_to_prompt_completions(
+                completer.complete(), text_before_cursor))
+            self._cache.put(key, prompt_completions)
+        return prompt_completions
+
+    def _search_server_side_results(self, word, results):
+        if results != self._server_side_results:
+            self._server_side_results = results
+            self._server_side_search = fuzzy.FuzzySession(
+                fuzzy.create_batch_corpus(results))
+        return self._server_side_search.search(word)
+
     def get_completions(self, document, complete_event):
+        if not self._index_ready():
+            return
         text_before_cursor = document.text_before_cursor
-        completions = self._completer.autocomplete(text_before_cursor)
-        prompt_completions = list(self._convert_to_prompt_completions(
-            completions, text_before_cursor))
+        prompt_completions = self._get_prompt_completions(text_before_cursor)
         if (not prompt_completions and self._completer.last_option and
                 len(self._completer.cmd_path) == 3):
             # If we couldn't complete anything from the JSON model
@@ -131,7 +229,7 @@ class AWSShellCompleter(Completer):
             if param is not None:
                 LOG.debug("Trying to retrieve autcompletion for: "
                           "%s, %s, %s", service, operation, param)
-                results = self._server_side_completer\
+                results = self.server_side_completer\
                     .retrieve_candidate_values(service, operation, param)
                 LOG.debug("Results for %s, %s, %s: %s",
                           service, operation, param, results)
@@ -141,7 +239,8 @@ class AWSShellCompleter(Completer):
                         word_before_cursor and results:
                     # Filter the results down by fuzzy searching what
                     # the user has provided.
-                    results = fuzzy.fuzzy_search(word_before_cursor, results)
+                    results = self._search_server_side_results(
+                        word_before_cursor, results)
                     location = -len(word_before_cursor)
                 if results is not None:
                     for result in results:
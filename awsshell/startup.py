@@ -0,0 +1,111 @@
+"""Startup instrumentation for the AWS Shell.
+
+Running ``aws-shell --startup-report`` times each phase of startup
+(imports, loading the completion index, opening the doc db, etc.)
+and prints a report before the first prompt is shown.  The report can
+also be generated as JSON so startup regressions can be tracked across
+releases.
+
+Code that runs during startup marks its phases with::
+
+    from awsshell.startup import PROFILER
+
+    with PROFILER.phase('config_load'):
+        ...
+
+When the profiler isn't enabled, ``phase()`` does nothing.
+
+"""
+import json
+import time
+import threading
+import contextlib
+
+
+class StartupProfiler(object):
+    """Accumulates the time spent in each named startup phase.
+
+    Phases are reported in the order they first ran.  If a phase runs
+    more than once, the durations are summed.  Phases may be recorded
+    from any thread, e.g when the completion index is loaded in the
+    background.
+
+    """
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._start_time = clock()
+        self.enabled = False
+        self._phase_names = []
+        self._durations = {}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.record(name, self._clock() - start)
+
+    def record(self, name, duration):
+        """Record ``duration`` seconds spent in the phase ``name``."""
+        with self._lock:
+            if name not in self._durations:
+                self._phase_names.append(name)
+                self._durations[name] = 0.0
+                self._calls[name] = 0
+            self._durations[name] += duration
+            self._calls[name] += 1
+
+    def record_since_start(self, name):
+        """Record the time from profiler creation until now as ``name``."""
+        self.record(name, self._clock() - self._start_time)
+
+    def report(self):
+        """Return the phase timings.
+
+        :rtype: dict
+        :return: The phases, in the order they first ran, and the total
+            time since the profiler was created.
+        """
+        phases = []
+        with self._lock:
+            for name in self._phase_names:
+                phases.append({
+                    'name': name,
+                    'seconds': self._durations[name],
+                    'calls': self._calls[name],
+                })
+        return {
+            'phases': phases,
+            'total_seconds': self._clock() - self._start_time,
+        }
+
+    def format_report(self, format_name='text', extra=None):
+        """Format the phase timings as either 'text' or 'json'.
+
+        :type extra: dict
+        :param extra: Additional key/values to include in the report,
+            e.g the aws-shell and AWS CLI version.
+        """
+        report = self.report()
+        if extra:
+            report.update(extra)
+        if format_name == 'json':
+            return json.dumps(report, indent=2, sort_keys=True)
+        lines = ['%-28s %10s %6s' % ('Phase', 'Time (ms)', 'Calls')]
+        for phase in report['phases']:
+            lines.append('%-28s %10.1f %6d' % (
+                phase['name'], phase['seconds'] * 1000, phase['calls']))
+        lines.append('%-28s %10.1f' % (
+            'total', report['total_seconds'] * 1000))
+        return '\n'.join(lines)
+
+
+# The profiler is created as soon as the awsshell package starts
+# importing, so the import time of the aws-shell is included.
+PROFILER = StartupProfiler()
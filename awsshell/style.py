@@ -57,6 +57,7 @@ class StyleFactory(object):
             t.Toolbar: 'bg:#222222 #cccccc',
             t.Toolbar.Off: 'bg:#222222 #696969',
             t.Toolbar.On: 'bg:#222222 #ffffff',
+            t.Toolbar.Loading: 'bg:#222222 #ffd700',
             t.Toolbar.Search: 'noinherit bold',
             t.Toolbar.Search.Text: 'nobold',
             t.Toolbar.System: 'noinherit bold',
@@ -12,6 +12,9 @@
 # language governing permissions and limitations under the License.
 
 
+from bisect import bisect_left
+
+
 def substring_search(word, collection):
     """Find all matches in the `collection` for the specified `word`.
 
@@ -20,10 +23,41 @@ def substring_search(word, collection):
     :type word: str
     :param word: The substring to search for.
 
-    :type collection: collection, usually a list
+    :type collection: collection, usually a list, or a PrefixIndex
     :param collection: A collection of words to match.
 
     :rtype: list of strings
     :return: A sorted list of matching words from collection.
     """
-    return [item for item in sorted(collection) if item.startswith(word)]
+    if not isinstance(collection, PrefixIndex):
+        collection = PrefixIndex(collection)
+    return collection.search(word)
+
+
+class PrefixIndex(object):
+    """A collection of words indexed for finding the words with a prefix.
+
+    Building the index sorts the words once, after which each search
+    is a binary search for the first match followed by the matches.
+
+    :type collection: collection, usually a list
+    :param collection: A collection of words to index.
+    """
+    def __init__(self, collection):
+        self._words = sorted(collection)
+
+    def __len__(self):
+        return len(self._words)
+
+    def search(self, prefix):
+        """Find all the words that start with `prefix`.
+
+        :rtype: list of strings
+        :return: A sorted list of the matching words.
+        """
+        words = self._words
+        start = end = bisect_left(words, prefix)
+        # The words with the prefix are sorted right after it.
+        while end < len(words) and words[end].startswith(prefix):
+            end += 1
+        return words[start:end]
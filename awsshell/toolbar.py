@@ -22,13 +22,15 @@ class Toolbar(object):
     """
 
     def __init__(self, get_match_fuzzy, get_enable_vi_bindings,
-                 get_show_completion_columns, get_show_help):
+                 get_show_completion_columns, get_show_help,
+                 get_index_status=None):
         self.handler = self._create_toolbar_handler(
             get_match_fuzzy, get_enable_vi_bindings,
-            get_show_completion_columns, get_show_help)
+            get_show_completion_columns, get_show_help, get_index_status)
 
     def _create_toolbar_handler(self, get_match_fuzzy, get_enable_vi_bindings,
-                                get_show_completion_columns, get_show_help):
+                                get_show_completion_columns, get_show_help,
+                                get_index_status=None):
         """Create the toolbar handler.
 
         :type get_fuzzy_match: callable
@@ -45,6 +47,11 @@ class Toolbar(object):
         :type get_show_help: callable
         :param get_show_help: Gets the show help pane config.
 
+        :type get_index_status: callable
+        :param get_index_status: Gets the progress of loading the
+            completion index.  Nothing is shown if this returns an
+            empty string.
+
         :rtype: callable
         :returns: get_toolbar_items.
 
@@ -53,6 +60,7 @@ class Toolbar(object):
         assert callable(get_enable_vi_bindings)
         assert callable(get_show_completion_columns)
         assert callable(get_show_help)
+        assert get_index_status is None or callable(get_index_status)
 
         def get_toolbar_items(cli):
             """Return the toolbar items.
@@ -91,7 +99,7 @@ class Toolbar(object):
                 show_buffer_name = 'cli'
             else:
                 show_buffer_name = 'doc'
-            return [
+            items = [
                 (match_fuzzy_token,
                  ' [F2] Fuzzy: {0} '.format(match_fuzzy_cfg)),
                 (enable_vi_bindings_token,
@@ -105,5 +113,11 @@ class Toolbar(object):
                 (Token.Toolbar,
                  ' [F10] Exit ')
             ]
+            if get_index_status is not None:
+                index_status = get_index_status()
+                if index_status:
+                    items.append((Token.Toolbar.Loading,
+                                  ' {0} '.format(index_status)))
+            return items
 
         return get_toolbar_items
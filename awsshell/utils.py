@@ -1,9 +1,12 @@
 """Utility module for misc aws shell functions."""
 from __future__ import print_function
 import os
+import mmap
 import contextlib
 import tempfile
+import threading
 import uuid
+from collections import OrderedDict
 
 import awscli
 
@@ -86,6 +89,21 @@ class FSLayer(object):
         except (OSError, IOError) as e:
             raise FileReadError(str(e))
 
+    def map_file(self, filename):
+        """Return a read only memory map of the file contents.
+
+        The returned object supports the buffer interface, so it
+        can be sliced or passed to ``struct.unpack_from`` without
+        reading the whole file into memory.
+
+        """
+        try:
+            with open(filename, 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, IOError, ValueError) as e:
+            # ValueError is raised when trying to map an empty file.
+            raise FileReadError(str(e))
+
     def file_exists(self, filename):
         """Check if a file exists.
 
@@ -97,6 +115,19 @@ class FSLayer(object):
         """
         return os.path.isfile(filename)
 
+    def list_files(self, dirname):
+        """Return the names of the files in a directory.
+
+        An empty list is returned if the directory does not exist.
+
+        """
+        try:
+            names = os.listdir(dirname)
+        except OSError:
+            return []
+        return [name for name in names
+                if os.path.isfile(os.path.join(dirname, name))]
+
 
 class InMemoryFSLayer(object):
     """Same interface as FSLayer with an in memory implementation."""
@@ -116,5 +147,95 @@ class InMemoryFSLayer(object):
             contents = contents.encode('utf-8')
         return contents
 
+    def map_file(self, filename):
+        try:
+            contents = self._file_mapping[filename]
+        except KeyError:
+            raise FileReadError(filename)
+        if not isinstance(contents, bytes):
+            contents = contents.encode('utf-8')
+        return contents
+
     def file_exists(self, filename):
         return filename in self._file_mapping
+
+    def list_files(self, dirname):
+        return [os.path.basename(filename) for filename in self._file_mapping
+                if os.path.dirname(filename) == dirname]
+
+
+class LRUCache(object):
+    """A thread safe least recently used cache.
+
+    The cache is bounded by the total size of its values rather than
+    the number of entries.  Each value's size is determined by
+    ``get_size``, which defaults to counting every value as 1.
+
+    :type max_size: int
+    :param max_size: The maximum total size of the cached values.
+
+    :type hits: int
+    :param hits: The number of lookups that were found in the cache.
+
+    :type misses: int
+    :param misses: The number of lookups that weren't in the cache.
+
+    """
+    def __init__(self, max_size, get_size=None):
+        if get_size is None:
+            get_size = lambda value: 1
+        self.max_size = max_size
+        self._get_size = get_size
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # Reinserting the entry marks it as the most recently used.
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self._get_size(value)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_size:
+                return
+            self._entries[key] = value
+            self._sizes[key] = size
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def remove_if(self, predicate):
+        """Remove every entry whose key matches ``predicate``."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        if key in self._entries:
+            del self._entries[key]
+            self.size -= self._sizes.pop(key)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,6 +1,12 @@
-from awsshell import db
+import time
+import sqlite3
+import threading
+
+import mock
 import pytest
 
+from awsshell import db
+
 
 @pytest.fixture
 def shell_db(tmpdir):
@@ -53,3 +59,214 @@ def test_can_create_and_open_db(tmpdir):
     # Should be able to reopen the database and look up 'foo'.
     d = db.ConcurrentDBM.open(filename)
     assert d['foo'] == 'bar'
+
+
+def test_contains(shell_db):
+    shell_db['foo'] = 'bar'
+    assert 'foo' in shell_db
+    assert 'baz' not in shell_db
+
+
+def test_db_uses_wal_mode(tmpdir):
+    filename = tmpdir.join('foo.db').strpath
+    db.ConcurrentDBM.create(filename).close()
+    d = db.ConcurrentDBM.open(filename)
+    mode = d._writer.execute('PRAGMA journal_mode').fetchone()[0]
+    assert mode.lower() == 'wal'
+
+
+def test_can_update_multiple_keys(shell_db):
+    shell_db.update([('foo', 'bar'), ('baz', 'qux')])
+    shell_db.update({'foo': 'new'})
+    assert shell_db['foo'] == 'new'
+    assert shell_db['baz'] == 'qux'
+    assert sorted(shell_db.keys()) == ['baz', 'foo']
+
+
+def test_setdefault_only_writes_missing_keys(tmpdir):
+    filename = tmpdir.join('foo.db').strpath
+    first = db.ConcurrentDBM.create(filename)
+    second = db.ConcurrentDBM.open(filename)
+    assert first.setdefault('foo', 'bar') == 'bar'
+    assert second.setdefault('foo', 'baz') == 'bar'
+    assert first['foo'] == 'bar'
+
+
+def test_update_commits_in_batches(tmpdir):
+    filename = tmpdir.join('foo.db').strpath
+    writer = db.ConcurrentDBM.create(filename)
+    reader = db.ConcurrentDBM.open(filename)
+
+    def items():
+        for i in range(5):
+            yield 'key%s' % i, 'value'
+        raise RuntimeError('interrupted')
+
+    with pytest.raises(RuntimeError):
+        writer.update(items(), batch_size=2)
+    # The first two batches were committed and are visible to
+    # other connections, the incomplete batch isn't.
+    assert sorted(reader.keys()) == ['key0', 'key1', 'key2', 'key3']
+
+
+def test_can_get_and_set_sections(shell_db):
+    shell_db.update_sections([('foo', 'a', 'one'), ('foo', 'b', 'two')])
+    assert shell_db.get_section('foo', 'a') == 'one'
+    assert shell_db.get_section(b'foo', 'b') == 'two'
+    with pytest.raises(KeyError):
+        shell_db.get_section('foo', 'c')
+
+
+def test_open_adds_sections_to_existing_db(tmpdir):
+    filename = tmpdir.join('foo.db').strpath
+    conn = sqlite3.connect(filename)
+    with conn:
+        conn.execute(
+            'CREATE TABLE docindex (key TEXT PRIMARY KEY, value TEXT)')
+    conn.close()
+    d = db.ConcurrentDBM.open(filename)
+    d.update_sections([('foo', 'a', 'one')])
+    assert d.get_section('foo', 'a') == 'one'
+
+
+SEARCH_ENTRIES = [
+    ('aws.ec2.copy-snapshot', 'ec2 copy-snapshot',
+     'Copies a point-in-time snapshot of an EBS volume.'),
+    ('aws.ec2.create-snapshot', 'ec2 create-snapshot',
+     'Creates a snapshot of an EBS volume.'),
+    ('aws.s3api.list-buckets', 's3api list-buckets',
+     'Returns a list of all buckets owned by the sender.'),
+]
+
+
+@pytest.mark.parametrize('module', ['fts5', 'fts4'])
+def test_can_search(tmpdir, module):
+    with mock.patch.object(db.ConcurrentDBM, 'SEARCH_MODULES', (module,)):
+        d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    assert d.search_module == module
+    d.update_search(SEARCH_ENTRIES)
+    results = d.search('"snapshot"')
+    assert sorted(key for key, _ in results) == [
+        'aws.ec2.copy-snapshot', 'aws.ec2.create-snapshot']
+    assert '[snapshot]' in results[0][1]
+    # The command name counts more than the description.
+    assert d.search('"copy"', limit=1)[0][0] == 'aws.ec2.copy-snapshot'
+    assert d.search('"buckets"')[0][0] == 'aws.s3api.list-buckets'
+    assert d.search('"lambda"') == []
+
+
+def test_search_entries_are_replaced(shell_db):
+    shell_db.update_search(SEARCH_ENTRIES)
+    shell_db.update_search([('aws.ec2.copy-snapshot', 'ec2 copy-snapshot',
+                             'Copies an image.')])
+    assert sorted(key for key, _ in shell_db.search('"snapshot"')) == [
+        'aws.ec2.copy-snapshot', 'aws.ec2.create-snapshot']
+    assert [key for key, _ in shell_db.search('"image"')] == [
+        'aws.ec2.copy-snapshot']
+
+
+def test_search_without_full_text_search(tmpdir):
+    with mock.patch.object(db.ConcurrentDBM, 'SEARCH_MODULES', ()):
+        d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    assert d.search_module is None
+    d['aws.ec2.copy-snapshot'] = 'docs'
+    d.update_search(SEARCH_ENTRIES)
+    assert d.search('"snapshot"') == []
+    assert d.keys_without_search_entries() == []
+
+
+def test_search_ignores_invalid_queries(shell_db):
+    shell_db.update_search(SEARCH_ENTRIES)
+    assert shell_db.search('"') == []
+
+
+def test_keys_without_search_entries(shell_db):
+    shell_db.update([('aws.ec2.copy-snapshot', 'docs'),
+                     ('aws.ec2.run-instances', 'docs'),
+                     ('__complete__', 'true')])
+    shell_db.update_search(SEARCH_ENTRIES)
+    assert shell_db.keys_without_search_entries() == ['aws.ec2.run-instances']
+
+
+def test_open_adds_search_to_existing_db(tmpdir):
+    filename = tmpdir.join('foo.db').strpath
+    conn = sqlite3.connect(filename)
+    with conn:
+        conn.execute(
+            'CREATE TABLE docindex (key TEXT PRIMARY KEY, value TEXT)')
+    conn.close()
+    d = db.ConcurrentDBM.open(filename)
+    d.update_search(SEARCH_ENTRIES)
+    assert d.search('"buckets"')[0][0] == 'aws.s3api.list-buckets'
+
+
+def test_db_can_be_shared_between_threads(shell_db):
+    shell_db['foo'] = 'main'
+    results = []
+
+    def write_and_read():
+        shell_db['bar'] = 'thread'
+        results.append(shell_db['foo'])
+    thread = threading.Thread(target=write_and_read)
+    thread.start()
+    thread.join()
+    assert results == ['main']
+    assert shell_db['bar'] == 'thread'
+
+
+def test_reads_use_read_only_connections(shell_db):
+    with pytest.raises(sqlite3.OperationalError):
+        shell_db._reader.execute(
+            "INSERT INTO docindex (key, value) VALUES ('foo', 'bar')")
+
+
+def test_reads_are_not_blocked_by_writes(tmpdir):
+    filename = tmpdir.join('foo.db').strpath
+    d = db.ConcurrentDBM.create(filename)
+    d['foo'] = 'committed'
+    other = sqlite3.connect(filename, isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    other.execute("UPDATE docindex SET value = 'uncommitted'")
+    start = time.time()
+    assert d['foo'] == 'committed'
+    assert time.time() - start < 1
+    other.execute('COMMIT')
+    assert d['foo'] == 'uncommitted'
+
+
+def test_read_only_db(tmpdir):
+    filename = tmpdir.join('foo.db').strpath
+    db.ConcurrentDBM.create(filename)['foo'] = 'bar'
+    d = db.ConcurrentDBM.open(filename, read_only=True)
+    assert d['foo'] == 'bar'
+    with pytest.raises(sqlite3.OperationalError):
+        d['foo'] = 'baz'
+
+
+def test_lock_wait_is_measured(tmpdir):
+    filename = tmpdir.join('foo.db').strpath
+    d = db.ConcurrentDBM.create(filename)
+    d['foo'] = 'bar'
+    assert d.lock_stats()['writes'] == 1
+    # Another process is writing the db.
+    other = sqlite3.connect(filename, isolation_level=None,
+                            check_same_thread=False)
+    other.execute('BEGIN IMMEDIATE')
+    timer = threading.Timer(0.2, other.execute, args=('COMMIT',))
+    timer.start()
+    d['foo'] = 'baz'
+    timer.join()
+    stats = d.lock_stats()
+    assert stats['writes'] == 2
+    assert stats['max_wait_seconds'] >= 0.15
+    assert stats['wait_seconds'] >= stats['max_wait_seconds']
+    assert d['foo'] == 'baz'
+
+
+def test_failed_writes_are_rolled_back(shell_db):
+    with pytest.raises(sqlite3.Error):
+        shell_db.update_sections([('foo', 'a', 'one'), ('foo', 'b')])
+    with pytest.raises(KeyError):
+        shell_db.get_section('foo', 'a')
+    shell_db['foo'] = 'bar'
+    assert shell_db['foo'] == 'bar'
@@ -42,6 +42,11 @@ class KeysTest(unittest.TestCase):
         self.feed_key(Keys.F2)
         assert match_fuzzy != self.aws_shell.model_completer.match_fuzzy
 
+    def test_F2_invalidates_cached_completions(self):
+        self.aws_shell.completer = mock.Mock()
+        self.feed_key(Keys.F2)
+        self.aws_shell.completer.invalidate_cache.assert_called_with()
+
     def test_F3(self):
         enable_vi_bindings = self.aws_shell.enable_vi_bindings
         with self.assertRaises(InputInterrupt):
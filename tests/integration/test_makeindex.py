@@ -1,5 +1,7 @@
+import mock
 import awscli.clidriver
 from awsshell import makeindex
+from awsshell import docs
 
 import pytest
 
@@ -47,3 +49,102 @@ def test_can_index_a_command(cloudformation_command):
     help_command = cloudformation_command.create_help_command()
     index = makeindex.new_index()
     makeindex.index_command(index, help_command)
+
+
+def test_parallel_index_matches_serial_index(cloudformation_command):
+    help_command = cloudformation_command.create_help_command()
+    serial = makeindex.new_index()
+    makeindex.index_command(serial, help_command)
+    parallel = makeindex.new_index()
+    makeindex.index_command_parallel(parallel, help_command, max_workers=2)
+    assert parallel == serial
+    assert list(parallel['children']) == list(serial['children'])
+
+
+def test_index_command_reuses_existing_children(cloudformation_command):
+    help_command = cloudformation_command.create_help_command()
+    existing = {'create-stack': makeindex.new_index()}
+    index = makeindex.new_index()
+    makeindex.index_command(index, help_command, existing)
+    assert index['children']['create-stack'] is existing['create-stack']
+    assert '--stack-name' in index['children']['delete-stack']['arguments']
+
+
+def test_command_fingerprints_track_service_models():
+    driver = awscli.clidriver.create_clidriver()
+    help_command = driver.create_help_command()
+    loader = driver.session.get_component('data_loader')
+    fingerprints = makeindex.command_fingerprints(help_command, loader)
+    api_version = loader.determine_latest_version(
+        'cloudformation', 'service-2')
+    assert fingerprints['cloudformation'].startswith(api_version + ':')
+    # CLI customizations aren't backed by a single model.
+    assert 'configure' not in fingerprints
+
+
+def test_parallel_doc_index_matches_serial_doc_index():
+    driver = awscli.clidriver.create_clidriver()
+    command_table = driver.create_help_command().command_table
+    # Only document a couple of small services.
+    help_command = mock.Mock(command_table={
+        'sts': command_table['sts'],
+        'sso': command_table['sso'],
+    })
+    serial = {}
+    makeindex.write_doc_index(db=serial, help_command=help_command,
+                              max_workers=1)
+    parallel = {}
+    makeindex.write_doc_index(db=parallel, help_command=help_command,
+                              max_workers=2)
+    assert parallel == serial
+    assert 'aws.sts.get-caller-identity' in parallel
+
+
+def test_parallel_doc_index_skips_rendered_docs():
+    driver = awscli.clidriver.create_clidriver()
+    command_table = driver.create_help_command().command_table
+    help_command = mock.Mock(command_table={'sts': command_table['sts']})
+    db = {'aws.sts.get-caller-identity': 'already rendered'}
+    makeindex.write_doc_index(db=db, help_command=help_command,
+                              max_workers=2)
+    assert db['aws.sts.get-caller-identity'] == 'already rendered'
+    assert 'SYNOPSIS' in db['aws.sts.assume-role']
+    assert makeindex.service_complete_key('aws.sts') in db
+
+
+def test_parallel_doc_index_renders_used_operations_first():
+    driver = awscli.clidriver.create_clidriver()
+    command_table = driver.create_help_command().command_table
+    help_command = mock.Mock(command_table={
+        'sts': command_table['sts'],
+        'sso': command_table['sso'],
+    })
+    usage = {('sso',): 1, ('sso', 'list-accounts'): 1}
+    serial = {}
+    makeindex.write_doc_index(db=serial, help_command=help_command,
+                              max_workers=1, command_usage=usage)
+    parallel = {}
+    written = []
+    makeindex.write_doc_index(db=parallel, help_command=help_command,
+                              max_workers=2, command_usage=usage,
+                              on_write=written.append)
+    assert parallel == serial
+    # The service is only written, and marked complete, after the
+    # operation that was rendered ahead of it.
+    sso_writes = [keys for keys in written if keys[0].startswith('aws.sso')]
+    assert sso_writes[0] == ['aws.sso.list-accounts']
+    assert 'aws.sso.list-accounts' not in sso_writes[1]
+    assert makeindex.service_complete_key('aws.sso') in parallel
+
+
+def test_doc_renderer_renders_in_worker(tmpdir):
+    doc_db = docs.load_doc_db(tmpdir.join('docs.db').strpath)
+    written = []
+    renderer = docs.DocRenderer(doc_db, on_rendered=written.extend)
+    renderer.render('aws.sts.get-caller-identity')
+    renderer.render('aws.sts.unknown-command')
+    renderer.close()
+    assert written == ['aws.sts.get-caller-identity']
+    retriever = docs.DocRetriever(doc_db)
+    assert 'Returns details about the IAM user or role' in \
+        retriever.extract_description('aws.sts.get-caller-identity')
@@ -1,6 +1,10 @@
+import mock
+from pygments.token import Token
+
 from tests import unittest
 
 from awsshell.index import completion
+from awsshell.index import packed
 from awsshell.utils import InMemoryFSLayer
 
 
@@ -25,3 +29,154 @@ class TestCompletionIndex(unittest.TestCase):
                                        fslayer=self.fslayer)
         with self.assertRaises(completion.IndexLoadError):
             c.load_index('1.9.1')
+
+    def test_can_load_packed_index(self):
+        c = completion.CompletionIndex(cache_dir='/tmp/cache',
+                                       fslayer=self.fslayer)
+        self.files['/tmp/cache/completions-1.9.1.idx'] = packed.dumps(
+            {'aws': {'commands': ['ec2'], 'arguments': ['--debug']}})
+        index = c.load_packed_index('1.9.1')
+        self.assertEqual(index['aws']['commands'], ['ec2'])
+        self.assertEqual(index['aws']['arguments'], ['--debug'])
+
+    def test_packed_index_does_not_exist_raises_error(self):
+        c = completion.CompletionIndex(cache_dir='/tmp/cache',
+                                       fslayer=self.fslayer)
+        with self.assertRaises(completion.IndexLoadError):
+            c.load_packed_index('1.9.1')
+
+    def test_invalid_packed_index_raises_error(self):
+        c = completion.CompletionIndex(cache_dir='/tmp/cache',
+                                       fslayer=self.fslayer)
+        self.files['/tmp/cache/completions-1.9.1.idx'] = '{}'
+        with self.assertRaises(completion.IndexLoadError):
+            c.load_packed_index('1.9.1')
+
+    def test_load_previous_packed_index_picks_newest_version(self):
+        c = completion.CompletionIndex(cache_dir='/tmp/cache',
+                                       fslayer=self.fslayer)
+        for version in ['1.9.1', '1.10.0', '1.9.10', '1.11.0']:
+            self.files['/tmp/cache/completions-%s.idx' % version] = \
+                packed.dumps({'aws': {'commands': [version]}})
+        index = c.load_previous_packed_index('1.11.0')
+        self.assertEqual(index['aws']['commands'], ['1.10.0'])
+
+    def test_load_previous_packed_index_skips_invalid_indices(self):
+        c = completion.CompletionIndex(cache_dir='/tmp/cache',
+                                       fslayer=self.fslayer)
+        self.files['/tmp/cache/completions-1.9.1.idx'] = packed.dumps(
+            {'aws': {'commands': ['1.9.1']}})
+        self.files['/tmp/cache/completions-1.9.2.idx'] = '{}'
+        index = c.load_previous_packed_index('1.9.3')
+        self.assertEqual(index['aws']['commands'], ['1.9.1'])
+
+    def test_no_previous_packed_index(self):
+        c = completion.CompletionIndex(cache_dir='/tmp/cache',
+                                       fslayer=self.fslayer)
+        self.files['/tmp/cache/completions-1.9.1.idx'] = packed.dumps(
+            {'aws': {'commands': []}})
+        self.assertIsNone(c.load_previous_packed_index('1.9.1'))
+
+
+class TestIndexProvider(unittest.TestCase):
+    def setUp(self):
+        self.files = {
+            '/tmp/cache/completions-1.9.1.idx': packed.dumps({'aws': {
+                'commands': ['ec2'],
+                'arguments': ['--debug'],
+                'children': {'ec2': {
+                    'commands': ['describe-instances'],
+                    'children': {'describe-instances': {
+                        'arguments': ['--instance-ids']}},
+                }},
+            }}),
+        }
+        self.fslayer = InMemoryFSLayer(self.files)
+        self.completion_index = completion.CompletionIndex(
+            cache_dir='/tmp/cache', fslayer=self.fslayer)
+        self.provider = completion.IndexProvider(
+            self.completion_index, version_string='1.9.1')
+
+    def test_index_is_only_loaded_once(self):
+        self.fslayer.map_file = mock.Mock(wraps=self.fslayer.map_file)
+        index = self.provider.load_index()
+        self.assertIs(self.provider.load_index(), index)
+        self.provider.completions()
+        self.provider.lexer()
+        self.assertEqual(self.fslayer.map_file.call_count, 1)
+
+    def test_completions_are_derived_from_index(self):
+        completions = self.provider.completions()
+        self.assertEqual(completions.commands, ['ec2'])
+        self.assertEqual(completions.subcommands, ['describe-instances'])
+        self.assertEqual(completions.global_opts, ['--debug'])
+        self.assertEqual(completions.args_opts, set(['--instance-ids']))
+        self.assertIs(self.provider.completions(), completions)
+
+    def test_missing_index_has_empty_completions(self):
+        provider = completion.IndexProvider(
+            self.completion_index, version_string='1.0.0')
+        self.assertEqual(provider.completions().commands, [])
+
+    def test_lexer_highlights_index_words(self):
+        lexer = self.provider.lexer()
+        self.assertIs(self.provider.lexer(), lexer)
+        expected = [
+            ('ec2', Token.Literal.String),
+            ('describe-instances', Token.Name.Class),
+            ('--instance-ids', Token.Keyword.Declaration),
+            ('--debug', Token.Operator.Word),
+        ]
+        for word, token_type in expected:
+            tokens = list(lexer().get_tokens(word))
+            self.assertEqual(tokens[0], (token_type, word))
+
+    def test_load_in_background(self):
+        statuses = []
+        thread = self.provider.load_in_background(
+            on_status_change=lambda: statuses.append(self.provider.status))
+        thread.join()
+        self.assertFalse(self.provider.is_loading())
+        self.assertEqual(self.provider.status, '')
+        self.assertEqual(statuses[0], 'Loading autocomplete index...')
+        self.assertEqual(statuses[-1], '')
+        self.assertEqual(self.provider.load_index()['aws']['commands'],
+                         ['ec2'])
+        self.assertIsNotNone(self.provider._lexer)
+
+    def test_load_in_background_creates_missing_index(self):
+        provider = completion.IndexProvider(
+            self.completion_index, version_string='1.10.0')
+        statuses = []
+
+        def write_index(filename, previous_index, progress_callback):
+            self.assertEqual(filename, '/tmp/cache/completions-1.10.0.idx')
+            self.assertEqual(previous_index['aws']['commands'], ['ec2'])
+            progress_callback(1, 1)
+            self.files[filename] = packed.dumps(
+                {'aws': {'commands': ['s3']}})
+
+        with mock.patch('awsshell.makeindex.write_index', write_index):
+            provider.load_in_background(
+                on_status_change=lambda: statuses.append(provider.status)
+            ).join()
+        self.assertIn('Updating autocomplete index...', statuses)
+        self.assertIn('Indexing services 1/1...', statuses)
+        self.assertEqual(provider.load_index()['aws']['commands'], ['s3'])
+
+    def test_load_in_background_failure_is_reported(self):
+        provider = completion.IndexProvider(
+            self.completion_index, version_string='1.10.0')
+        write_index = mock.Mock(side_effect=RuntimeError('build failed'))
+        with mock.patch('awsshell.makeindex.write_index', write_index):
+            provider.load_in_background().join()
+        self.assertFalse(provider.is_loading())
+        self.assertEqual(provider.status, 'Autocomplete unavailable')
+
+    def test_index_unavailable_after_load_in_background_fails(self):
+        # The index loads, but decoding it fails.
+        self.provider.lexer = mock.Mock(side_effect=ValueError('bad index'))
+        self.provider.load_in_background().join()
+        self.assertEqual(self.provider.status, 'Autocomplete unavailable')
+        with self.assertRaises(completion.IndexLoadError):
+            self.provider.load_index()
@@ -0,0 +1,150 @@
+import pytest
+
+from awsshell.index import packed
+from awsshell.autocomplete import AWSCLIModelCompleter
+
+
+@pytest.fixture
+def index_data():
+    return {
+        'aws': {
+            'arguments': ['--debug', '--region'],
+            'argument_metadata': {
+                '--debug': {'required': False, 'type_name': 'boolean',
+                            'minidoc': 'Turn on debug logging.',
+                            'example': '', 'api_name': ''},
+                '--region': {'required': False, 'type_name': 'string',
+                             'minidoc': u'The region ✓',
+                             'example': '', 'api_name': ''},
+            },
+            'commands': ['ec2', 's3'],
+            'children': {
+                'ec2': {
+                    'arguments': [],
+                    'argument_metadata': {},
+                    'commands': ['create-tags'],
+                    'children': {
+                        'create-tags': {
+                            'arguments': ['--resources', '--tags'],
+                            'argument_metadata': {
+                                '--resources': {
+                                    'required': True, 'type_name': 'list',
+                                    'minidoc': 'The resources',
+                                    'example': '', 'api_name': 'Resources'},
+                                '--tags': {
+                                    'required': True, 'type_name': 'list',
+                                    'minidoc': 'The tags',
+                                    'example': 'Key=string,Value=string',
+                                    'api_name': 'Tags'},
+                            },
+                            'commands': [],
+                            'children': {},
+                        },
+                    },
+                },
+                's3': {
+                    'arguments': [],
+                    'argument_metadata': {},
+                    'commands': [],
+                    'children': {},
+                },
+            },
+        }
+    }
+
+
+def test_round_trips_index_data(index_data):
+    index = packed.PackedIndex(packed.dumps(index_data))
+    assert index == index_data
+
+
+def test_children_are_only_decoded_on_access(index_data):
+    index = packed.PackedIndex(packed.dumps(index_data))
+    children = index['aws']['children']
+    assert children._nodes == {}
+    assert children.get('ec2')['commands'] == ['create-tags']
+    assert list(children._nodes) == ['ec2']
+
+
+def test_missing_child_nodes_are_not_in_children():
+    index = packed.PackedIndex(packed.dumps(
+        {'aws': {'commands': ['ec2'], 'arguments': []}}))
+    assert index['aws']['commands'] == ['ec2']
+    assert index['aws']['children'].get('ec2') is None
+
+
+def test_metadata_only_arguments_are_preserved():
+    index = packed.PackedIndex(packed.dumps(
+        {'aws': {'arguments': [],
+                 'argument_metadata': {'--global1': {'minidoc': 'foo'}}}}))
+    assert index['aws']['arguments'] == []
+    assert index['aws']['argument_metadata']['--global1']['minidoc'] == 'foo'
+
+
+def test_invalid_data_raises_error():
+    with pytest.raises(packed.InvalidIndexError):
+        packed.PackedIndex(b'{"aws": {"commands": []}}')
+
+
+def test_model_completer_can_use_packed_index(index_data):
+    index = packed.PackedIndex(packed.dumps(index_data))
+    completer = AWSCLIModelCompleter(index)
+    completer.autocomplete('ec2 create-tags --tags ')
+    assert completer.cmd_path == ['aws', 'ec2', 'create-tags']
+    assert completer.last_option == '--tags'
+    assert completer.arg_metadata['--tags']['required']
+    assert completer.autocomplete('ec2 create-tags --reso') == ['--resources']
+
+
+def test_round_trips_fingerprints(index_data):
+    fingerprints = {'ec2': '2016-11-15:abcd', 's3': '2006-03-01:1234'}
+    index = packed.PackedIndex(packed.dumps(index_data, fingerprints))
+    assert index.fingerprints == fingerprints
+
+
+def test_can_copy_nodes_from_another_packed_index(index_data):
+    previous = packed.PackedIndex(packed.dumps(index_data))
+    new_data = {'aws': {
+        'arguments': [],
+        'commands': ['ec2'],
+        'children': {'ec2': previous['aws']['children']['ec2']},
+    }}
+    index = packed.PackedIndex(packed.dumps(new_data))
+    assert index['aws']['children']['ec2'] == \
+        index_data['aws']['children']['ec2']
+
+
+def test_vocabulary_does_not_decode_services(index_data):
+    index = packed.PackedIndex(packed.dumps(index_data))
+    assert index.subcommands == ['create-tags']
+    assert index.operation_arguments == ['--resources', '--tags']
+    assert index['aws']['children']._nodes == {}
+
+
+def test_completer_only_decodes_services_it_enters(index_data):
+    index = packed.PackedIndex(packed.dumps(index_data))
+    completer = AWSCLIModelCompleter(index)
+    completer.autocomplete('e')
+    completer.autocomplete('ec')
+    completer.autocomplete('ec2')
+    assert index['aws']['children']._nodes == {}
+    completer.autocomplete('ec2 ')
+    assert list(index['aws']['children']._nodes) == ['ec2']
+
+
+@pytest.mark.parametrize('fraction', [0.1, 0.5, 0.9, 0.999])
+def test_truncated_data_raises_error(index_data, fraction):
+    data = packed.dumps(index_data)
+    with pytest.raises(packed.InvalidIndexError):
+        packed.PackedIndex(data[:int(len(data) * fraction)])
+
+
+def test_offsets_outside_data_raise_error(index_data):
+    data = bytearray(packed.dumps(index_data))
+    # Point the root node past the string table.
+    packed._HEADER.pack_into(
+        data, 0, packed.MAGIC, packed.FORMAT_VERSION,
+        *(list(packed._HEADER.unpack_from(data, 0)[2:4]) + [len(data)] +
+          list(packed._HEADER.unpack_from(data, 0)[5:])))
+    with pytest.raises(packed.InvalidIndexError):
+        packed.PackedIndex(bytes(data))
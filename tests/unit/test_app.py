@@ -92,6 +92,40 @@ def test_profile_handler_when_no_profile_configured():
     )
 
 
+def test_search_handler_prints_matching_commands():
+    shell = mock.Mock(spec=app.AWSShell)
+    shell.docs.search.return_value = [
+        ('aws.ec2.copy-snapshot', '\n\nCopies a [snapshot]\nof a volume.'),
+        ('aws.ec2.create-snapshot', 'Creates a [snapshot].'),
+    ]
+    stdout = compat.StringIO()
+    handler = app.SearchHandler(stdout)
+    handler.run(['.search', 'snapshot'], shell)
+    shell.docs.search.assert_called_with(
+        ['snapshot'], limit=app.SearchHandler.MAX_RESULTS)
+    assert stdout.getvalue() == (
+        'aws ec2 copy-snapshot\n'
+        '    Copies a [snapshot] of a volume.\n'
+        'aws ec2 create-snapshot\n'
+        '    Creates a [snapshot].\n'
+    )
+
+
+def test_search_handler_when_nothing_matches():
+    shell = mock.Mock(spec=app.AWSShell)
+    shell.docs.search.return_value = []
+    stdout = compat.StringIO()
+    handler = app.SearchHandler(stdout)
+    handler.run(['.search', 'foo', 'bar'], shell)
+    assert stdout.getvalue() == 'No commands found matching: foo bar\n'
+
+
+def test_search_handler_requires_terms(errstream):
+    handler = app.SearchHandler(err=errstream)
+    handler.run(['.search'], mock.Mock(spec=app.AWSShell))
+    assert 'Usage' in errstream.getvalue()
+
+
 def test_profile_command_changes_profile():
     shell = mock.Mock(spec=app.AWSShell)
     shell.profile = 'myprofile'
@@ -1,5 +1,6 @@
 import pytest
 from awsshell.autocomplete import AWSCLIModelCompleter
+from awsshell.fuzzy import fuzzy_search
 
 @pytest.fixture
 def index_data():
@@ -380,3 +381,141 @@ def test_global_arg_metadata_property(index_data):
     }
     completer = AWSCLIModelCompleter(index_data)
     assert '--global1' in completer.global_arg_metadata
+
+
+def test_no_completions_until_index_loaded(index_data):
+    index_data['aws']['commands'] = ['first', 'second']
+    completer = AWSCLIModelCompleter()
+    assert completer.autocomplete('fi') == []
+    completer.load_index(index_data)
+    assert completer.autocomplete('fi') == ['first']
+
+
+class ReplayCompleter(AWSCLIModelCompleter):
+    # The original full parse, which replays every prefix of the line.
+    def _complete_from_full_parse(self):
+        self.reset()
+        line = self._current_line
+        for i in range(1, len(self._current_line)):
+            self.autocomplete(line[:i])
+        return self.autocomplete(line)
+
+
+@pytest.fixture
+def nested_index_data():
+    arg_metadata = {
+        '--dry-run': {'example': ''},
+        '--filter': {'example': ''},
+        '--filters': {'example': 'Name=string,Values=string'},
+    }
+    return {
+        'aws': {
+            'argument_metadata': {'--debug': {}, '--output': {}},
+            'arguments': ['--debug', '--output'],
+            'commands': ['ec2', 'ecs'],
+            'children': {
+                'ec2': {
+                    'argument_metadata': {},
+                    'arguments': [],
+                    'commands': ['describe-instances', 'ec2', 'wait'],
+                    'children': {
+                        'describe-instances': {
+                            'argument_metadata': arg_metadata,
+                            'arguments': sorted(arg_metadata),
+                            'commands': [],
+                            'children': {},
+                        },
+                        # A sub command with the same name as its parent.
+                        'ec2': {
+                            'arguments': ['--dry-run'],
+                            'commands': ['run'],
+                            'children': {},
+                        },
+                        'wait': {
+                            'arguments': [],
+                            'commands': ['instance-running'],
+                            'children': {},
+                        },
+                    },
+                },
+                'ecs': {'arguments': [], 'commands': [], 'children': {}},
+            },
+        }
+    }
+
+
+@pytest.mark.parametrize('line', [
+    'ec2 describe-instances --filters Name=foo --dry',
+    'ec2 describe-instances --filter',
+    'ec2 describe-instances --filtersfoo ',
+    'ec2 describe-instances --filters',
+    'ec2 describe-instances --filters ',
+    'ec2  describe-instances  --output',
+    'ec2  ec2 ',
+    'ec2 ec2  r',
+    '  ec2\tdescribe-instances ',
+    'ec2\ndescribe-instances --',
+    'ec2 wait instance',
+    'ec2 --debug wait ',
+    'ecs ec2 ',
+    'e',
+    ' ',
+    'ec2 describe-instances --filters ' + 'Name=tag,Values=x ' * 20 + '--d',
+])
+def test_full_parse_matches_replaying_each_prefix(nested_index_data, line):
+    completer = AWSCLIModelCompleter(nested_index_data)
+    replay = ReplayCompleter(nested_index_data)
+    for c in [completer, replay]:
+        # Start from a different command, as if the line was pasted
+        # or recalled from history.
+        c.autocomplete('e')
+        c.autocomplete('ec')
+    assert completer.autocomplete(line) == replay.autocomplete(line)
+    for attr in ['cmd_path', 'last_option', '_current_name',
+                 '_last_position']:
+        assert getattr(completer, attr) == getattr(replay, attr), attr
+    assert completer._current is replay._current
+    # The state is also the same for the next character typed.
+    assert completer.autocomplete(line + '-') == replay.autocomplete(line + '-')
+    assert completer.last_option == replay.last_option
+
+
+def test_context_computed_once_per_command(nested_index_data):
+    completer = AWSCLIModelCompleter(nested_index_data)
+    c = completer.autocomplete
+    assert c('ec2 describe-instances --f') == ['--filter', '--filters']
+    assert c('ec2 describe-instances --fi') == ['--filter', '--filters']
+    assert completer._contexts.misses == 1
+    # Leaving and re-entering the command reuses its context.
+    c('ecs')
+    assert c('ec2 describe-instances --d') == ['--debug', '--dry-run']
+    assert completer._contexts.misses == 2
+    assert completer._contexts.hits == 1
+
+
+def test_context_merges_global_options_in_order(nested_index_data):
+    completer = AWSCLIModelCompleter(nested_index_data, match_fuzzy=False)
+    assert completer.autocomplete('ec2 ec2 --') == [
+        '--debug', '--dry-run', '--output']
+    completer.match_fuzzy = True
+    # Fuzzy search ranks the command's arguments followed by the
+    # global options, so ties keep that order.
+    assert completer.autocomplete('ec2 ec2 --') == fuzzy_search(
+        '--', ['--dry-run', '--debug', '--output'])
+
+
+def test_context_cache_is_bounded(nested_index_data):
+    completer = AWSCLIModelCompleter(nested_index_data,
+                                     context_cache_size=2)
+    for line in ['ec2 -', 'ec2 wait -', 'ec2 ec2 -', 'ec2 describe-instances -']:
+        completer.autocomplete(line)
+    assert completer._contexts.size == 2
+
+
+def test_context_cache_cleared_on_load_index(nested_index_data):
+    completer = AWSCLIModelCompleter(nested_index_data)
+    assert completer.autocomplete('ec2 ec2 r') == ['run']
+    nested_index_data['aws']['children']['ec2']['children']['ec2'][
+        'commands'] = ['reboot']
+    completer.load_index(nested_index_data)
+    assert completer.autocomplete('ec2 ec2 r') == ['reboot']
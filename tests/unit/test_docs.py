@@ -12,3 +12,277 @@ def test_load_doc_db(tmpdir):
     filename = tmpdir.join("foo.db").strpath
     d = docs.load_doc_db(filename)
     assert isinstance(d, db.ConcurrentDBM)
+
+
+DOCS = [
+    'Describes the instances.\n\nSYNOPSIS\n\nOPTIONS\n\n'
+    '--instance-ids (list)\n'
+    '  The instance IDs.\n\n--dry-run (boolean)\n'
+    '  Checks whether you have the required permissions.\n',
+    'Describes the volumes.\n\nSYNOPSIS\n\nOPTIONS\n\n'
+    '--volume-ids (list)\n'
+    '  The volume IDs.\n\n--dry-run (boolean)\n'
+    '  Checks whether you have the required permissions.\n',
+]
+
+
+def test_train_dictionary_uses_shared_lines():
+    zdict = docs.train_dictionary(DOCS)
+    assert b'  Checks whether you have the required permissions.\n' in zdict
+    assert b'Describes the instances' not in zdict
+
+
+def test_train_dictionary_respects_size():
+    zdict = docs.train_dictionary(DOCS, size=20)
+    assert len(zdict) <= 20
+
+
+def test_compressor_round_trips():
+    for zdict in (None, docs.train_dictionary(DOCS)):
+        compressor = docs.DocCompressor(zdict)
+        compressed = compressor.compress(DOCS[0] + u'✓')
+        assert isinstance(compressed, bytes)
+        assert compressor.decompress(compressed) == DOCS[0] + u'✓'
+
+
+def test_compressor_returns_uncompressed_docs_unchanged():
+    compressor = docs.DocCompressor(docs.train_dictionary(DOCS))
+    assert compressor.decompress(DOCS[0]) == DOCS[0]
+
+
+def test_doc_retriever_reads_compressed_and_uncompressed_docs(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    zdict = docs.train_dictionary(DOCS)
+    compressor = docs.DocCompressor(zdict)
+    d[docs.DICTIONARY_KEY] = zdict
+    d['aws.ec2.describe-instances'] = compressor.compress(DOCS[0])
+    # Docs written by older versions of the aws-shell are plain text.
+    d['aws.ec2.describe-volumes'] = DOCS[1]
+    retriever = docs.DocRetriever(d)
+    assert retriever.extract_description('aws.ec2.describe-instances') == \
+        'Describes the instances.\n\n'
+    assert retriever.extract_param(
+        'aws.ec2.describe-instances', '--instance-ids') == \
+        '--instance-ids (list)\n  The instance IDs.\n\n'
+    assert retriever.extract_param(
+        'aws.ec2.describe-volumes', '--volume-ids') == \
+        '--volume-ids (list)\n  The volume IDs.\n\n'
+
+
+def test_doc_retriever_treats_undecompressable_docs_as_missing(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    compressor = docs.DocCompressor(docs.train_dictionary(DOCS))
+    d[docs.DICTIONARY_KEY] = docs.train_dictionary(['other\n'] * 2)
+    d['aws.ec2.describe-instances'] = compressor.compress(DOCS[0])
+    missing = []
+    retriever = docs.DocRetriever(d, render_missing=missing.append)
+    assert retriever.extract_description('aws.ec2.describe-instances') == ''
+    assert missing == ['aws.ec2.describe-instances']
+
+
+SECTIONED_DOCS = (
+    'Describes an instance attribute.\n\n'
+    'SYNOPSIS\n\n'
+    '   describe-instance-attribute\n'
+    '   --instance-id <value>\n\n'
+    'OPTIONS\n\n'
+    '--instance-id (string)\n\n'
+    '   The ID of the instance.\n\n'
+    '--instance-ids (list)\n\n'
+    '   The IDs of the instances. See --instance-id.\n\n'
+    '--dry-run | --no-dry-run (boolean)\n\n'
+    '   Checks whether you have the required permissions.\n\n'
+    'GLOBAL OPTIONS\n\n'
+    '--debug (boolean)\n\n'
+    'Turn on debug logging.\n\n'
+    '--dry-run (boolean)\n\n'
+    'Not the dry run option of this command.\n\n'
+    'OUTPUT\n\n'
+    'None\n'
+)
+
+
+def test_split_sections():
+    sections, global_sections = docs.split_sections(SECTIONED_DOCS)
+    assert [name for name, _ in sections] == [
+        'description', 'synopsis', '--instance-id', '--instance-ids',
+        '--dry-run', '--no-dry-run']
+    assert [name for name, _ in global_sections] == ['--debug', '--dry-run']
+    sections = dict(sections)
+    global_sections = dict(global_sections)
+    assert sections['description'] == 'Describes an instance attribute.\n\n'
+    assert sections['synopsis'] == (
+        '\n   describe-instance-attribute\n   --instance-id <value>\n\n')
+    assert sections['--instance-id'] == (
+        '--instance-id (string)\n\n   The ID of the instance.\n\n')
+    assert sections['--dry-run'] == sections['--no-dry-run']
+    assert 'required permissions' in sections['--dry-run']
+    assert global_sections['--debug'] == (
+        '--debug (boolean)\n\nTurn on debug logging.\n\n')
+
+
+def test_doc_retriever_reads_sections(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    key = 'aws.ec2.describe-instance-attribute'
+    sections, global_sections = docs.split_sections(SECTIONED_DOCS)
+    d.update_sections((key, name, text) for name, text in sections)
+    d.update_sections((docs.GLOBAL_OPTIONS_KEY, name, text)
+                      for name, text in global_sections)
+    # The full docs aren't needed for sectioned lookups.
+    retriever = docs.DocRetriever(d)
+    assert retriever.extract_description(key.encode('utf-8')) == \
+        'Describes an instance attribute.\n\n'
+    assert retriever.extract_param(key, '--instance-id') == \
+        '--instance-id (string)\n\n   The ID of the instance.\n\n'
+    assert retriever.extract_param(key, '--instance-ids').startswith(
+        '--instance-ids (list)')
+    assert retriever.extract_param(key, '--debug') == \
+        '--debug (boolean)\n\nTurn on debug logging.\n\n'
+    # The command's own --dry-run takes precedence over the global one.
+    assert 'required permissions' in retriever.extract_param(key, '--dry-run')
+    assert retriever.extract_param(key, '--unknown') == ''
+    assert retriever.extract_param('aws.ec2.unknown', '--instance-id') == ''
+
+
+def test_doc_retriever_caches_docs(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    d['aws.ec2.describe-volumes'] = DOCS[1]
+    retriever = docs.DocRetriever(d)
+    for _ in range(3):
+        retriever.extract_description(b'aws.ec2.describe-volumes')
+        retriever.extract_param('aws.ec2.describe-volumes', '--volume-ids')
+    assert retriever.cache.misses == 2
+    assert retriever.cache.hits == 4
+    # The cache doesn't read from the db.
+    d.close()
+    assert retriever.extract_param(
+        'aws.ec2.describe-volumes', '--volume-ids').startswith('--volume-ids')
+
+
+def test_doc_retriever_cache_is_bounded_by_bytes(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    d['aws.ec2.describe-instances'] = DOCS[0]
+    d['aws.ec2.describe-volumes'] = DOCS[1]
+    retriever = docs.DocRetriever(d, cache_size=40)
+    retriever.extract_description('aws.ec2.describe-instances')
+    retriever.extract_description('aws.ec2.describe-volumes')
+    assert retriever.cache.size <= 40
+    assert len(retriever.cache) == 1
+
+
+def test_doc_retriever_invalidate(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    retriever = docs.DocRetriever(d)
+    assert retriever.extract_description('aws.ec2.describe-volumes') == ''
+    d['aws.ec2.describe-volumes'] = DOCS[1]
+    # The missing docs are cached until they're invalidated.
+    assert retriever.extract_description('aws.ec2.describe-volumes') == ''
+    retriever.invalidate(['aws.ec2.describe-volumes'])
+    assert retriever.extract_description('aws.ec2.describe-volumes') == \
+        'Describes the volumes.\n\n'
+
+
+def test_doc_retriever_missing_docs_invalidated_during_lookup(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    missing = []
+    retriever = docs.DocRetriever(d, render_missing=missing.append)
+
+    def extract(dot_cmd):
+        # The doc index build writes the docs after they're looked up
+        # but before the missing docs are cached.
+        d[dot_cmd] = DOCS[1]
+        retriever.invalidate([dot_cmd])
+        raise KeyError(dot_cmd)
+
+    assert retriever._cached('aws.ec2.describe-volumes', None, extract) == ''
+    assert missing == ['aws.ec2.describe-volumes']
+    assert retriever.extract_description('aws.ec2.describe-volumes') == \
+        'Describes the volumes.\n\n'
+
+
+def test_doc_retriever_caches_missing_docs_before_rendering(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+
+    def render_missing(dot_cmd):
+        # The renderer may write the docs and invalidate them before
+        # the retriever's lookup returns.
+        d[dot_cmd] = DOCS[1]
+        retriever.invalidate([dot_cmd])
+
+    retriever = docs.DocRetriever(d, render_missing=render_missing)
+    assert retriever.extract_description('aws.ec2.describe-volumes') == ''
+    assert retriever.extract_description('aws.ec2.describe-volumes') == \
+        'Describes the volumes.\n\n'
+
+
+def test_doc_retriever_renders_missing_docs(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    d['aws.ec2.describe-volumes'] = DOCS[1]
+    missing = []
+    retriever = docs.DocRetriever(d, render_missing=missing.append)
+    assert retriever.extract_description('aws.ec2.describe-instances') == ''
+    assert retriever.extract_param(
+        b'aws.ec2.describe-instances', '--dry-run') == ''
+    # Commands that have docs aren't rendered, even if they don't
+    # document the param.
+    retriever.extract_param('aws.ec2.describe-volumes', '--unknown')
+    retriever.extract_description('aws.ec2.describe-instances')
+    assert missing == ['aws.ec2.describe-instances',
+                       'aws.ec2.describe-instances']
+
+
+def test_doc_renderer_writes_docs(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    d['aws.ec2.describe-volumes'] = 'already rendered'
+    rendered = []
+    written = []
+
+    def render_docs(dot_cmd):
+        rendered.append(dot_cmd)
+        if dot_cmd == 'aws.ec2.unknown':
+            return None
+        return DOCS[0]
+
+    renderer = docs.DocRenderer(d, on_rendered=written.extend,
+                                render_docs=render_docs)
+    renderer.render('aws.ec2.describe-instances')
+    renderer.render('aws.ec2.describe-instances')
+    renderer.render('aws.ec2.describe-volumes')
+    renderer.render('aws.ec2.unknown')
+    renderer.render('aws')
+    renderer.close()
+    assert rendered.count('aws.ec2.describe-instances') == 1
+    assert 'aws.ec2.describe-volumes' not in rendered
+    assert 'aws' not in rendered
+    # Docs that are already written are still reported, since they may
+    # have been looked up before they were written.
+    assert sorted(written) == ['aws.ec2.describe-instances',
+                               'aws.ec2.describe-volumes']
+    assert d['aws.ec2.describe-instances'] == DOCS[0]
+    assert d['aws.ec2.describe-volumes'] == 'already rendered'
+    retriever = docs.DocRetriever(d)
+    assert retriever.extract_param(
+        'aws.ec2.describe-instances', '--instance-ids').startswith(
+            '--instance-ids (list)')
+
+
+def test_search_entry():
+    assert docs.search_entry('aws.ec2.describe-volumes', DOCS[1]) == (
+        'aws.ec2.describe-volumes', 'ec2 describe-volumes',
+        'Describes the volumes.\n\n')
+
+
+def test_doc_retriever_search(tmpdir):
+    d = db.ConcurrentDBM.create(tmpdir.join('foo.db').strpath)
+    d.update_search([docs.search_entry('aws.ec2.describe-volumes', DOCS[1]),
+                     docs.search_entry('aws.ec2.describe-instances',
+                                       DOCS[0])])
+    retriever = docs.DocRetriever(d)
+    results = retriever.search(['volume'])
+    assert results == [('aws.ec2.describe-volumes',
+                        'Describes the [volumes].\n\n')]
+    assert retriever.search(['describe', 'instance']) == [
+        ('aws.ec2.describe-instances', '[Describes] the [instances].\n\n')]
+    # Search syntax is treated as text.
+    assert retriever.search(['volume"', 'OR']) == []
+    assert retriever.search([]) == []
@@ -1,5 +1,9 @@
+import random
+
 import pytest
-from awsshell.fuzzy import fuzzy_search
+from awsshell import fuzzy
+from awsshell.fuzzy import fuzzy_search, calculate_score
+from awsshell.fuzzy import FuzzyCorpus, FuzzySession, _scores
 
 
 @pytest.mark.parametrize("search,corpus,expected", [
@@ -14,3 +18,160 @@ from awsshell.fuzzy import fuzzy_search
 def test_subsequences(search, corpus, expected):
     actual = fuzzy_search(search, corpus)
     assert actual == expected
+    assert fuzzy_search(search, FuzzyCorpus(corpus)) == expected
+
+
+CORPUS = [
+    'describe-instances', 'describe-instance-attribute',
+    'describe-reserved-instances-offerings', 'run-instances',
+    'create-spot-datafeed-subscription', 'describe-regions', '--dry-run',
+    '--instance-ids', '--filters', 'ec2', 'a', '--', 'x-', '-x', 'caf\xe9',
+    'describe-instances',
+]
+
+
+def random_queries():
+    rand = random.Random(0)
+    queries = ['drio', 'descinst', 'rinstance', 'describe-instance', '--',
+               'ii', 'a', '-', 'caf\xe9', '\xe9', 'zzz']
+    for _ in range(300):
+        word = rand.choice(CORPUS)
+        # Mostly subsequences of a word, some of them not in order.
+        chars = [c for c in word if rand.random() < 0.4] or [word[0]]
+        if rand.random() < 0.2:
+            rand.shuffle(chars)
+        queries.append(''.join(chars))
+    return queries
+
+
+def test_corpus_scores_equal_calculate_score():
+    corpus = FuzzyCorpus(CORPUS)
+    for query in random_queries():
+        expected = [(word, calculate_score(query, word)) for word in CORPUS]
+        assert list(_scores(corpus._matches(query))) == [
+            (word, score) for word, score in expected if score > 0]
+
+
+def test_corpus_search_matches_fuzzy_search():
+    corpus = FuzzyCorpus(CORPUS)
+    for query in random_queries():
+        assert corpus.search(query) == fuzzy_search(query, CORPUS), query
+
+
+def test_corpus_search_limit():
+    corpus = FuzzyCorpus(CORPUS)
+    for query in random_queries():
+        expected = fuzzy_search(query, CORPUS)
+        for limit in [0, 1, 3]:
+            assert corpus.search(query, limit=limit) == expected[:limit]
+
+
+class CountingList(list):
+    def __init__(self, *args):
+        super(CountingList, self).__init__(*args)
+        self.scans = 0
+
+    def __iter__(self):
+        self.scans += 1
+        return super(CountingList, self).__iter__()
+
+
+@pytest.mark.parametrize('make_corpus', [list, FuzzyCorpus])
+def test_session_matches_fuzzy_search_as_typed(make_corpus):
+    session = FuzzySession(make_corpus(CORPUS))
+    typed = ['d', 'de', 'des', 'desc', 'descri', 'descr', 'descin',
+             'descinst', 'r', 'ri', 'rins', '-', '--', '--d', '--dr',
+             '--i', '--ii', 'drio', 'drio', 'zzz', 'zzzz', 'e']
+    for user_input in typed:
+        assert session.search(user_input) == fuzzy_search(
+            user_input, CORPUS), user_input
+    assert session.search('d', limit=2) == fuzzy_search('d', CORPUS)[:2]
+
+
+def test_session_scores_equal_calculate_score():
+    for query in random_queries():
+        session = FuzzySession(CORPUS)
+        for i in range(1, len(query) + 1):
+            session.search(query[:i])
+        expected = [(word, calculate_score(query, word)) for word in CORPUS]
+        assert list(_scores(session._last_matches)) == [
+            (word, score) for word, score in expected if score > 0]
+
+
+def test_session_only_scans_corpus_when_not_narrowing():
+    corpus = CountingList(CORPUS)
+    session = FuzzySession(corpus)
+    session.search('d')
+    session.search('de')
+    session.search('des')
+    assert corpus.scans == 1
+    # A backspace searches the whole corpus again.
+    session.search('de')
+    assert corpus.scans == 2
+    session.search('dr')
+    assert corpus.scans == 3
+
+
+@pytest.fixture
+def numpy():
+    return pytest.importorskip('numpy')
+
+
+def batch_scores(corpus, matches):
+    rows, starts, scores = matches
+    lengths = corpus._lengths[rows]
+    scores = scores * (1 - ((lengths - starts) / lengths.astype(float)))
+    return [(corpus._words[row], score)
+            for row, score in zip(rows.tolist(), scores.tolist())]
+
+
+@pytest.mark.parametrize('words', [
+    CORPUS,
+    # Characters that don't fit in a byte.
+    CORPUS + [u'\u4e2d-\u6587', u'x-\u4e2d'],
+])
+def test_batch_scores_equal_calculate_score(numpy, words):
+    corpus = fuzzy.BatchFuzzyCorpus(words)
+    for query in random_queries() + [u'\u4e2d', u'x\u4e2d', u'\u6587']:
+        expected = [(word, calculate_score(query, word)) for word in words]
+        assert batch_scores(corpus, corpus._matches(query)) == [
+            (word, score) for word, score in expected if score > 0]
+        assert corpus.search(query) == fuzzy_search(query, words), query
+        assert corpus.search(query, limit=2) == \
+            fuzzy_search(query, words)[:2]
+
+
+def test_batch_padding_never_matches(numpy):
+    corpus = fuzzy.BatchFuzzyCorpus(['a', 'abc', 'a\0'])
+    assert corpus.search('a\0') == ['a\0']
+    assert corpus.search('\xff') == []
+
+
+def test_batch_session_matches_fuzzy_search_as_typed(numpy):
+    session = FuzzySession(fuzzy.BatchFuzzyCorpus(CORPUS))
+    for user_input in ['d', 'de', 'desc', 'descinst', 'descin', 'r', 'ri',
+                       'rin', '--', '--d', 'zz', 'e']:
+        assert session.search(user_input) == fuzzy_search(
+            user_input, CORPUS), user_input
+
+
+def test_batch_corpus_of_no_words(numpy):
+    assert fuzzy.BatchFuzzyCorpus([]).search('a') == []
+
+
+def test_create_batch_corpus(numpy):
+    words = ['word-%s' % i for i in range(fuzzy.BATCH_MIN_WORDS)]
+    corpus = fuzzy.create_batch_corpus(words)
+    assert isinstance(corpus, fuzzy.BatchFuzzyCorpus)
+    assert corpus.search('w-99') == fuzzy_search('w-99', words)
+    # Fewer words are searched in pure Python.
+    fewer_words = words[1:]
+    assert fuzzy.create_batch_corpus(fewer_words) is fewer_words
+
+
+def test_create_batch_corpus_without_numpy(monkeypatch):
+    monkeypatch.setattr(fuzzy, '_numpy', False)
+    words = ['word-%s' % i for i in range(fuzzy.BATCH_MIN_WORDS)]
+    assert fuzzy.create_batch_corpus(words) is words
+    with pytest.raises(RuntimeError):
+        fuzzy.BatchFuzzyCorpus(words)
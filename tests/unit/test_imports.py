@@ -0,0 +1,81 @@
+"""Ensure expensive dependencies aren't imported before the first prompt."""
+import os
+import sys
+import json
+import textwrap
+import subprocess
+
+from awsshell import db
+from awsshell import docs
+from awsshell import utils
+from awsshell.index import packed
+
+
+# Runs aws-shell's main() up to the point where it would show the
+# first prompt and reports the modules that have been imported.
+SCRIPT = textwrap.dedent("""\
+    import sys
+    import json
+
+    from prompt_toolkit.input import PipeInput
+    from prompt_toolkit.output import DummyOutput
+
+    import awsshell
+    from awsshell import app
+
+
+    def run(self):
+        self._input = PipeInput()
+        self._output = DummyOutput()
+        # Creating the cli creates the layout and lexer that
+        # are needed to show the prompt.
+        self.cli
+        sys.stdout.write(json.dumps(sorted(sys.modules)))
+
+
+    app.AWSShell.run = run
+    sys.argv = ['aws-shell']
+    awsshell.main()
+""")
+
+DEFERRED_MODULES = [
+    'botocore',
+    'awscli.clidriver',
+    'docutils',
+    'jmespath',
+    'awsshell.makeindex',
+    'awsshell.resource.index',
+]
+
+
+def create_index_files(home_dir):
+    shell_dir = os.path.join(home_dir, '.aws', 'shell')
+    cache_dir = os.path.join(shell_dir, 'cache')
+    os.makedirs(cache_dir)
+    index_file = os.path.join(
+        cache_dir, 'completions-%s.idx' % utils.AWSCLI_VERSION)
+    with open(index_file, 'wb') as f:
+        f.write(packed.dumps({'aws': {
+            'commands': ['ec2'], 'arguments': ['--debug'],
+            'children': {'ec2': {'commands': ['describe-instances']}}}}))
+    doc_file = os.path.join(
+        shell_dir, '%s-completions.json.docs' % utils.AWSCLI_VERSION)
+    doc_db = db.ConcurrentDBM.create(doc_file)
+    doc_db['__complete__'] = 'true'
+    doc_db[docs.SEARCH_COMPLETE_KEY] = 'true'
+    doc_db.close()
+
+
+def test_modules_imported_before_first_prompt(tmpdir):
+    home_dir = tmpdir.strpath
+    create_index_files(home_dir)
+    env = os.environ.copy()
+    env['HOME'] = home_dir
+    output = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT], env=env, cwd=home_dir)
+    imported = json.loads(output.decode('utf-8'))
+    for module in DEFERRED_MODULES:
+        assert module not in imported, (
+            "%s should not be imported before the first prompt" % module)
+    # Sanity check that we actually got to the prompt.
+    assert 'awsshell.lexer' in imported
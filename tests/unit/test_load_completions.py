@@ -10,9 +10,11 @@
 # distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
+import json
 import unittest
 
 from awsshell.index.completion import CompletionIndex
+from awsshell.index import packed
 
 
 class LoadCompletionsTest(unittest.TestCase):
@@ -35,7 +37,8 @@ class LoadCompletionsTest(unittest.TestCase):
             '"children": {"bar": '
             '{"commands": [], "arguments": ["--baz"]}}}}}}'
         )
-        self.completion_index.load_index = lambda x: DATA
+        index = packed.PackedIndex(packed.dumps(json.loads(DATA)))
+        self.completion_index.load_packed_index = lambda x: index
         self.completion_index.load_completions()
 
     def test_load_completions(self):
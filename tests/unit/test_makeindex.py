@@ -1,5 +1,25 @@
 import textwrap
+
+import mock
+import pytest
+from prompt_toolkit.history import FileHistory
+
+from awsshell import db
+from awsshell import docs
 from awsshell import makeindex
+from awsshell.index import packed
+from awsshell.utils import FSLayer
+
+
+class FakeCommand(object):
+    def __init__(self, lineage_names, children=()):
+        self.lineage_names = lineage_names
+        self.help_command = mock.Mock(command_table=dict(
+            (name, FakeCommand(lineage_names + [name]))
+            for name in children))
+
+    def create_help_command(self):
+        return self.help_command
 
 def test_can_convert_rst_text():
     content = textwrap.dedent("""\
@@ -27,3 +47,273 @@ def test_can_convert_rst_text():
 
         Literal text: --foo-bar
     """)
+
+
+@pytest.fixture
+def help_command():
+    return mock.Mock(command_table={
+        'ec2': FakeCommand(['ec2'], ['describe-instances', 'run-instances']),
+        's3api': FakeCommand(['s3api'], ['list-buckets']),
+    })
+
+
+@pytest.fixture
+def doc_db(tmpdir):
+    return db.ConcurrentDBM.create(tmpdir.join('docs.db').strpath)
+
+
+def test_doc_index_marks_services_complete(help_command, doc_db):
+    with mock.patch('awsshell.makeindex.render_docs_for_cmd',
+                    return_value='docs'):
+        makeindex.write_doc_index(db=doc_db, help_command=help_command,
+                                  max_workers=1)
+    assert doc_db['aws.ec2.describe-instances'] == 'docs'
+    assert doc_db['aws.s3api.list-buckets'] == 'docs'
+    assert makeindex.service_complete_key('aws.ec2') in doc_db
+    assert makeindex.service_complete_key('aws.s3api') in doc_db
+    assert '__complete__' in doc_db
+
+
+def test_doc_index_resumes_interrupted_build(help_command, doc_db):
+    # A previous build finished ec2 and was interrupted partway
+    # through s3api.
+    doc_db['aws.ec2'] = 'old'
+    doc_db['aws.ec2.describe-instances'] = 'old'
+    doc_db['aws.ec2.run-instances'] = 'old'
+    doc_db[makeindex.service_complete_key('aws.ec2')] = 'true'
+    doc_db['aws.s3api'] = 'old'
+    rendered = []
+
+    def render_docs_for_cmd(help_command):
+        rendered.append(help_command)
+        return 'new'
+
+    with mock.patch('awsshell.makeindex.render_docs_for_cmd',
+                    render_docs_for_cmd):
+        makeindex.write_doc_index(db=doc_db, help_command=help_command,
+                                  max_workers=1)
+    assert len(rendered) == 1
+    assert doc_db['aws.s3api'] == 'old'
+    assert doc_db['aws.s3api.list-buckets'] == 'new'
+    assert doc_db['aws.ec2.run-instances'] == 'old'
+    assert makeindex.service_complete_key('aws.s3api') in doc_db
+
+
+def test_doc_index_can_be_compressed(help_command, doc_db):
+    rendered = iter(['docs %s\nshared boilerplate\n' % i for i in range(10)])
+    with mock.patch('awsshell.makeindex.render_docs_for_cmd',
+                    lambda help_command: next(rendered)), \
+            mock.patch.object(makeindex.DocIndexWriter,
+                              'TRAINING_SAMPLE_SIZE', 2):
+        makeindex.write_doc_index(db=doc_db, help_command=help_command,
+                                  max_workers=1, compress=True)
+    assert b'shared boilerplate' in doc_db[docs.DICTIONARY_KEY]
+    assert isinstance(doc_db['aws.ec2.run-instances'], bytes)
+    assert makeindex.service_complete_key('aws.s3api') in doc_db
+    retriever = docs.DocRetriever(doc_db)
+    assert retriever.extract_description('aws.s3api.list-buckets') == \
+        'docs 4\nshared boilerplate\n'
+
+
+def test_doc_index_writes_sections(help_command, doc_db):
+    with mock.patch('awsshell.makeindex.render_docs_for_cmd',
+                    return_value='Description\nSYNOPSIS\nfoo\n'
+                                 'GLOBAL OPTIONS\n--debug (boolean)\n'):
+        makeindex.write_doc_index(db=doc_db, help_command=help_command,
+                                  max_workers=1)
+    assert doc_db.get_section('aws.ec2.run-instances', 'synopsis') == 'foo\n'
+    assert doc_db.get_section('aws', '--debug') == '--debug (boolean)\n'
+    assert doc_db.get_section(
+        'aws.s3api.list-buckets', 'description') == 'Description\n'
+
+
+def test_doc_index_reports_written_docs(help_command, doc_db):
+    written = []
+    with mock.patch('awsshell.makeindex.render_docs_for_cmd',
+                    return_value='docs'):
+        makeindex.write_doc_index(db=doc_db, help_command=help_command,
+                                  max_workers=1, on_write=written.append)
+    assert sorted(written) == [
+        ['aws.ec2', 'aws.ec2.describe-instances', 'aws.ec2.run-instances'],
+        ['aws.s3api', 'aws.s3api.list-buckets'],
+    ]
+
+
+def test_doc_index_skips_docs_rendered_during_build(help_command, doc_db):
+    rendered = []
+
+    def render_docs_for_cmd(help_command):
+        rendered.append(help_command)
+        if len(rendered) == 1:
+            # The help pane renders a command the build hasn't
+            # reached yet.
+            doc_db['aws.ec2.run-instances'] = 'on demand'
+        return 'docs'
+
+    with mock.patch('awsshell.makeindex.render_docs_for_cmd',
+                    render_docs_for_cmd):
+        makeindex.write_doc_index(db=doc_db, help_command=help_command,
+                                  max_workers=1)
+    assert len(rendered) == 4
+    assert doc_db['aws.ec2.run-instances'] == 'on demand'
+    assert doc_db['aws.ec2.describe-instances'] == 'docs'
+
+
+def test_doc_writers_share_the_first_dictionary(doc_db):
+    # Two shells building the same doc index each train a dictionary.
+    first = makeindex.DocIndexWriter(doc_db, compress=True)
+    second = makeindex.DocIndexWriter(doc_db, compress=True)
+    first.write_service('aws.ec2', [
+        ('aws.ec2.describe-instances', 'Describes\nec2 boilerplate\n'),
+        ('aws.ec2.run-instances', 'Runs\nec2 boilerplate\n')])
+    first.flush()
+    second.write_service('aws.s3api', [
+        ('aws.s3api.list-buckets', 'Lists\ns3api boilerplate\n'),
+        ('aws.s3api.list-objects', 'Lists\ns3api boilerplate\n')])
+    second.flush()
+    assert b'ec2 boilerplate' in doc_db[docs.DICTIONARY_KEY]
+    retriever = docs.DocRetriever(doc_db)
+    assert retriever.extract_description('aws.ec2.describe-instances') == \
+        'Describes\nec2 boilerplate\n'
+    assert retriever.extract_description('aws.s3api.list-buckets') == \
+        'Lists\ns3api boilerplate\n'
+
+
+def test_doc_writer_writes_single_command(doc_db):
+    doc_db[docs.DICTIONARY_KEY] = docs.train_dictionary(['shared\n'] * 2)
+    written = []
+    writer = makeindex.DocIndexWriter(doc_db, compress=True,
+                                      on_write=written.append)
+    writer.write_command('aws.ec2.run-instances', 'Runs\nSYNOPSIS\nfoo\n')
+    assert written == [['aws.ec2.run-instances']]
+    assert isinstance(doc_db['aws.ec2.run-instances'], bytes)
+    assert makeindex.service_complete_key('aws.ec2') not in doc_db
+    retriever = docs.DocRetriever(doc_db)
+    assert retriever.extract_description('aws.ec2.run-instances') == 'Runs\n'
+
+
+def test_doc_writer_writes_commands_before_dictionary(doc_db):
+    written = []
+    writer = makeindex.DocIndexWriter(doc_db, compress=True,
+                                      on_write=written.append)
+    writer.write_commands([('aws.ec2.run-instances', 'Runs\nshared\n')])
+    assert written == [['aws.ec2.run-instances']]
+    assert doc_db['aws.ec2.run-instances'] == 'Runs\nshared\n'
+    assert docs.DICTIONARY_KEY not in doc_db
+    # Whole services are still held back to train the dictionary.
+    writer.write_service('aws.s3api', [
+        ('aws.s3api', 'S3\nshared\n'),
+        ('aws.s3api.list-buckets', 'Lists\nshared\n')])
+    assert 'aws.s3api' not in doc_db
+    writer.flush()
+    assert b'shared' in doc_db[docs.DICTIONARY_KEY]
+    assert isinstance(doc_db['aws.s3api.list-buckets'], bytes)
+    retriever = docs.DocRetriever(doc_db)
+    assert retriever.extract_description('aws.ec2.run-instances') == \
+        'Runs\nshared\n'
+    assert retriever.extract_description('aws.s3api.list-buckets') == \
+        'Lists\nshared\n'
+
+
+def test_load_command_usage(tmpdir):
+    filename = tmpdir.join('history').strpath
+    history = FileHistory(filename)
+    for text in ['ec2 describe-instances --instance-ids i-1',
+                 'ec2 describe-instances', 'aws s3api list-buckets',
+                 'ec2 --help', '.edit', '!ls', '']:
+        history.append(text)
+    usage = makeindex.load_command_usage(filename)
+    assert usage == {
+        ('ec2',): 3, ('ec2', 'describe-instances'): 2,
+        ('s3api',): 1, ('s3api', 'list-buckets'): 1,
+    }
+
+
+def test_load_command_usage_without_history(tmpdir):
+    assert not makeindex.load_command_usage(tmpdir.join('history').strpath)
+
+
+def test_doc_index_renders_most_used_docs_first(help_command, doc_db):
+    names = {}
+    for service in help_command.command_table.values():
+        names[service.help_command] = 'aws.' + service.lineage_names[0]
+        for name, operation in service.help_command.command_table.items():
+            names[operation.help_command] = '.'.join(
+                ['aws'] + operation.lineage_names)
+    rendered = []
+
+    def render_docs_for_cmd(help_command):
+        rendered.append(names[help_command])
+        return 'docs'
+
+    usage = {('s3api',): 2, ('s3api', 'list-buckets'): 2,
+             ('ec2',): 1, ('ec2', 'run-instances'): 1}
+    with mock.patch('awsshell.makeindex.render_docs_for_cmd',
+                    render_docs_for_cmd):
+        makeindex.write_doc_index(db=doc_db, help_command=help_command,
+                                  max_workers=1, command_usage=usage)
+    assert rendered == [
+        'aws.s3api.list-buckets', 'aws.ec2.run-instances',
+        'aws.s3api', 'aws.ec2', 'aws.ec2.describe-instances',
+    ]
+    assert doc_db['aws.ec2.run-instances'] == 'docs'
+    assert makeindex.service_complete_key('aws.ec2') in doc_db
+    assert makeindex.service_complete_key('aws.s3api') in doc_db
+
+
+def test_doc_index_writes_search_entries(help_command, doc_db):
+    with mock.patch('awsshell.makeindex.render_docs_for_cmd',
+                    return_value='Lists things.\nSYNOPSIS\n'):
+        makeindex.write_doc_index(db=doc_db, help_command=help_command,
+                                  max_workers=1)
+    assert doc_db.search('"buckets"')[0][0] == 'aws.s3api.list-buckets'
+    assert doc_db.keys_without_search_entries() == []
+    assert docs.SEARCH_COMPLETE_KEY in doc_db
+
+
+def test_doc_index_adds_search_entries_to_existing_docs(help_command,
+                                                         doc_db):
+    # A doc index that was completed before search was added.
+    compressor = docs.DocCompressor()
+    for key in ['aws.ec2', 'aws.ec2.describe-instances',
+                'aws.ec2.run-instances', 'aws.s3api',
+                'aws.s3api.list-buckets']:
+        doc_db[key] = compressor.compress('Old docs.\nSYNOPSIS\n')
+    for service in ['aws.ec2', 'aws.s3api']:
+        doc_db[makeindex.service_complete_key(service)] = 'true'
+    doc_db['__complete__'] = 'true'
+    with mock.patch('awsshell.makeindex.render_docs_for_cmd') as render:
+        makeindex.write_doc_index(db=doc_db, help_command=help_command,
+                                  max_workers=1, compress=True)
+    assert not render.called
+    assert doc_db.keys_without_search_entries() == []
+    assert doc_db.search('"old"', limit=10)[0][1] == '[Old] docs.\n'
+    assert docs.SEARCH_COMPLETE_KEY in doc_db
+
+
+def test_write_file_atomically_keeps_mapped_file_readable(tmpdir):
+    filename = str(tmpdir.join('completions-1.0.idx'))
+    old_index = {'aws': {'arguments': [], 'commands': ['ec2'],
+                         'children': {'ec2': {'arguments': ['--old'],
+                                              'commands': []}}}}
+    makeindex.write_file_atomically(filename, packed.dumps(old_index))
+    index = packed.PackedIndex(FSLayer().map_file(filename))
+    new_index = {'aws': {'arguments': [], 'commands': ['s3'],
+                         'children': {}}}
+    makeindex.write_file_atomically(filename, packed.dumps(new_index))
+    # The mapped index still reads the file it was loaded from.
+    assert index['aws']['children']['ec2']['arguments'] == ['--old']
+    index.close()
+    new = packed.PackedIndex(FSLayer().map_file(filename))
+    assert new['aws']['commands'] == ['s3']
+    new.close()
+    assert tmpdir.listdir() == [tmpdir.join('completions-1.0.idx')]
+
+
+def test_write_file_atomically_removes_temp_file_on_error(tmpdir):
+    filename = str(tmpdir.join('completions-1.0.idx'))
+    with mock.patch('awsshell.compat.replace_file',
+                    side_effect=OSError('replace failed')):
+        with pytest.raises(OSError):
+            makeindex.write_file_atomically(filename, b'contents')
+    assert tmpdir.listdir() == []
@@ -0,0 +1,163 @@
+import mock
+
+from prompt_toolkit.document import Document
+
+from awsshell.autocomplete import AWSCLIModelCompleter
+from awsshell.index.completion import CompletionIndex, IndexProvider
+from awsshell.shellcomplete import AWSShellCompleter
+
+
+def get_completions(completer, text):
+    document = Document(text, cursor_position=len(text))
+    return [c.text for c in completer.get_completions(document, None)]
+
+
+def test_no_completions_while_index_is_loading():
+    provider = mock.Mock(spec=IndexProvider)
+    provider.is_loading.return_value = True
+    provider.load_index.return_value = {'aws': {
+        'arguments': [], 'argument_metadata': {},
+        'commands': ['ec2', 'ecs'], 'children': {}}}
+    completer = AWSShellCompleter(AWSCLIModelCompleter(),
+                                  index_provider=provider)
+    assert get_completions(completer, 'ec') == []
+    assert not provider.load_index.called
+
+    provider.is_loading.return_value = False
+    assert get_completions(completer, 'ec') == ['ec2', 'ecs']
+    get_completions(completer, 'ec')
+    assert provider.load_index.call_count == 1
+
+
+def test_index_not_used_when_background_load_fails():
+    provider = IndexProvider(mock.Mock(spec=CompletionIndex))
+    provider._completion_index.load_packed_index.return_value = \
+        create_index()
+    provider.lexer = mock.Mock(side_effect=ValueError('bad index'))
+    provider.load_in_background().join()
+    model_completer = AWSCLIModelCompleter()
+    completer = AWSShellCompleter(model_completer, index_provider=provider)
+    assert get_completions(completer, 'ec') == []
+    assert model_completer.autocomplete('e') == []
+
+
+def create_index():
+    return {'aws': {
+        'arguments': ['--debug'],
+        'argument_metadata': {'--debug': {
+            'required': False, 'type_name': 'boolean', 'minidoc': 'Debug'}},
+        'commands': ['ec2', 'ecs'],
+        'children': {
+            'ec2': {
+                'arguments': [],
+                'argument_metadata': {},
+                'commands': ['describe-instances', 'describe-regions'],
+                'children': {
+                    'describe-instances': {
+                        'arguments': ['--dry-run'],
+                        'argument_metadata': {'--dry-run': {
+                            'required': True, 'type_name': 'boolean',
+                            'minidoc': 'Dry run'}},
+                        'commands': [],
+                        'children': {},
+                    },
+                },
+            },
+        },
+    }}
+
+
+def test_completions_cached_by_completion_state():
+    completer = AWSShellCompleter(AWSCLIModelCompleter(create_index()))
+    assert get_completions(completer, 'ec2 descr') == [
+        'describe-regions', 'describe-instances']
+    assert completer.cache_stats() == {'hits': 0, 'misses': 1}
+    # The same state is reached with different text.
+    assert get_completions(completer, 'ec2  descr') == [
+        'describe-regions', 'describe-instances']
+    assert completer.cache_stats() == {'hits': 1, 'misses': 1}
+    get_completions(completer, 'ec2 descri')
+    assert get_completions(completer, 'ec2 descr') == [
+        'describe-regions', 'describe-instances']
+    assert completer.cache_stats() == {'hits': 2, 'misses': 2}
+
+
+def test_cached_completions_keep_completion_state():
+    completer = AWSShellCompleter(AWSCLIModelCompleter(create_index()))
+    get_completions(completer, 'ec2 describe-instances --')
+    get_completions(completer, 'ec')
+    document = Document('ec2 describe-instances --',
+                        cursor_position=len('ec2 describe-instances --'))
+    completions = list(completer.get_completions(document, None))
+    assert completer.cache_stats()['hits'] == 1
+    assert [c.display for c in completions] == [
+        '--debug', '--dry-run (required)']
+    assert [c.start_position for c in completions] == [-2, -2]
+    assert completer.current_command == 'aws ec2 describe-instances'
+
+
+def test_trailing_space_cached_separately():
+    completer = AWSShellCompleter(AWSCLIModelCompleter(create_index()))
+    assert get_completions(completer, 'ec2') == ['ec2']
+    assert get_completions(completer, 'ec2 ') == [
+        'describe-instances', 'describe-regions']
+    assert completer.cache_stats()['hits'] == 0
+
+
+def test_cache_invalidated_when_match_fuzzy_changes():
+    model_completer = AWSCLIModelCompleter(create_index())
+    completer = AWSShellCompleter(model_completer)
+    assert get_completions(completer, 'ec2 desc') == [
+        'describe-regions', 'describe-instances']
+    model_completer.match_fuzzy = False
+    completer.invalidate_cache()
+    assert get_completions(completer, 'ec2 desc') == [
+        'describe-instances', 'describe-regions']
+    assert completer.cache_stats()['hits'] == 0
+
+
+def test_cache_invalidated_when_index_loaded():
+    provider = mock.Mock(spec=IndexProvider)
+    provider.is_loading.return_value = False
+    provider.load_index.return_value = create_index()
+    completer = AWSShellCompleter(AWSCLIModelCompleter(create_index()))
+    get_completions(completer, 'ec')
+    completer._index_provider = provider
+    get_completions(completer, 'ec')
+    assert completer.cache_stats()['hits'] == 0
+
+
+def test_cache_is_bounded():
+    completer = AWSShellCompleter(AWSCLIModelCompleter(create_index()),
+                                  cache_size=4)
+    for text in ['e', 'ec', 'ec2', 'ec2 ', 'ec2 d']:
+        get_completions(completer, text)
+    assert completer._cache.size <= 4
+
+
+def test_server_side_results_searched_as_typed():
+    index = create_index()
+    operation = index['aws']['children']['ec2']['children'][
+        'describe-instances']
+    operation['arguments'].append('--instance-ids')
+    operation['argument_metadata']['--instance-ids'] = {
+        'required': False, 'type_name': 'list', 'minidoc': '',
+        'api_name': 'InstanceIds', 'example': ''}
+    instance_ids = ['i-0abc', 'i-1abc', 'i-1def']
+    server_side_completer = mock.Mock()
+    server_side_completer.retrieve_candidate_values.side_effect = \
+        lambda *args: list(instance_ids)
+    completer = AWSShellCompleter(AWSCLIModelCompleter(index),
+                                  server_side_completer)
+    line = 'ec2 describe-instances --instance-ids '
+    assert get_completions(completer, line) == instance_ids
+    assert get_completions(completer, line + 'i-1') == ['i-1abc', 'i-1def']
+    session = completer._server_side_search
+    assert get_completions(completer, line + 'i-1d') == ['i-1def']
+    assert completer._server_side_search is session
+    # New results are searched with a new session.
+    instance_ids.append('i-1dee')
+    assert get_completions(completer, line + 'i-1d') == ['i-1def', 'i-1dee']
+    assert completer._server_side_search is not session
+    server_side_completer.retrieve_candidate_values.assert_called_with(
+        'ec2', 'describe-instances', 'InstanceIds')
@@ -0,0 +1,83 @@
+import json
+
+from awsshell.startup import StartupProfiler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_phases_are_not_recorded_when_disabled():
+    clock = FakeClock()
+    profiler = StartupProfiler(clock=clock)
+    with profiler.phase('index_read'):
+        clock.now += 1
+    assert profiler.report()['phases'] == []
+
+
+def test_phases_are_recorded_in_order_and_accumulated():
+    clock = FakeClock()
+    profiler = StartupProfiler(clock=clock)
+    profiler.enabled = True
+    with profiler.phase('index_read'):
+        clock.now += 1
+    with profiler.phase('index_parse'):
+        clock.now += 2
+    with profiler.phase('index_read'):
+        clock.now += 3
+    report = profiler.report()
+    assert report['phases'] == [
+        {'name': 'index_read', 'seconds': 4, 'calls': 2},
+        {'name': 'index_parse', 'seconds': 2, 'calls': 1},
+    ]
+    assert report['total_seconds'] == 6
+
+
+def test_phase_is_recorded_when_exception_raised():
+    clock = FakeClock()
+    profiler = StartupProfiler(clock=clock)
+    profiler.enabled = True
+    try:
+        with profiler.phase('index_read'):
+            clock.now += 1
+            raise ValueError()
+    except ValueError:
+        pass
+    assert profiler.report()['phases'][0]['seconds'] == 1
+
+
+def test_record_since_start():
+    clock = FakeClock()
+    profiler = StartupProfiler(clock=clock)
+    clock.now += 5
+    profiler.record_since_start('imports')
+    assert profiler.report()['phases'] == [
+        {'name': 'imports', 'seconds': 5, 'calls': 1}]
+
+
+def test_format_json_report():
+    clock = FakeClock()
+    profiler = StartupProfiler(clock=clock)
+    profiler.record('imports', 0.5)
+    clock.now += 1
+    report = json.loads(profiler.format_report(
+        'json', extra={'awscli_version': '1.9.1'}))
+    assert report == {
+        'phases': [{'name': 'imports', 'seconds': 0.5, 'calls': 1}],
+        'total_seconds': 1,
+        'awscli_version': '1.9.1',
+    }
+
+
+def test_format_text_report():
+    clock = FakeClock()
+    profiler = StartupProfiler(clock=clock)
+    profiler.record('imports', 0.5)
+    clock.now += 1
+    lines = profiler.format_report('text').splitlines()
+    assert lines[1].split() == ['imports', '500.0', '1']
+    assert lines[-1].split() == ['total', '1000.0']
@@ -12,7 +12,7 @@
 # language governing permissions and limitations under the License.
 import pytest
 
-from awsshell.substring import substring_search
+from awsshell.substring import substring_search, PrefixIndex
 
 
 @pytest.mark.parametrize("search,corpus,expected", [
@@ -23,3 +23,22 @@ from awsshell.substring import substring_search
 def test_subsequences(search, corpus, expected):
     actual = substring_search(search, corpus)
     assert actual == expected
+
+
+@pytest.mark.parametrize("search,expected", [
+    ('', ['bar', 'foo', 'foobar', 'foobaz', 'fop']),
+    ('foo', ['foo', 'foobar', 'foobaz']),
+    ('foob', ['foobar', 'foobaz']),
+    ('fop', ['fop']),
+    ('fopp', []),
+    ('a', []),
+    ('z', []),
+])
+def test_prefix_index(search, expected):
+    index = PrefixIndex(['foobaz', 'fop', 'foo', 'bar', 'foobar'])
+    assert index.search(search) == expected
+    assert substring_search(search, index) == expected
+
+
+def test_prefix_index_keeps_duplicates():
+    assert PrefixIndex(['a', 'b', 'a']).search('a') == ['a', 'a']
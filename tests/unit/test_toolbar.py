@@ -27,7 +27,9 @@ class ToolbarTest(unittest.TestCase):
             lambda: self.aws_shell.model_completer.match_fuzzy,
             lambda: self.aws_shell.enable_vi_bindings,
             lambda: self.aws_shell.show_completion_columns,
-            lambda: self.aws_shell.show_help)
+            lambda: self.aws_shell.show_help,
+            lambda: self.index_status)
+        self.index_status = ''
 
     def test_toolbar_on(self):
         self.aws_shell.model_completer.match_fuzzy = True
@@ -57,3 +59,13 @@ class ToolbarTest(unittest.TestCase):
             (Token.Toolbar, ' [F9] Focus: cli '),
             (Token.Toolbar, ' [F10] Exit ')]
         assert expected == self.toolbar.handler(self.cli)
+
+    def test_toolbar_shows_index_status(self):
+        self.aws_shell.model_completer.match_fuzzy = True
+        self.aws_shell.enable_vi_bindings = True
+        self.aws_shell.show_completion_columns = True
+        self.aws_shell.show_help = True
+        self.index_status = 'Indexing services 1/2...'
+        items = self.toolbar.handler(self.cli)
+        self.assertEqual(
+            items[-1], (Token.Toolbar.Loading, ' Indexing services 1/2... '))
@@ -7,6 +7,7 @@ from awsshell.utils import FSLayer
 from awsshell.utils import InMemoryFSLayer
 from awsshell.utils import FileReadError
 from awsshell.utils import temporary_file
+from awsshell.utils import LRUCache
 
 
 class TestFSLayer(unittest.TestCase):
@@ -93,3 +94,65 @@ class TestTemporaryFile(unittest.TestCase):
             f.seek(0)
             assert f.read() == "foobar"
         self.assertFalse(os.path.isfile(filename))
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_bounded_by_size_of_values(self):
+        cache = LRUCache(10, get_size=len)
+        cache.put('a', 'x' * 4)
+        cache.put('b', 'x' * 4)
+        self.assertEqual(cache.size, 8)
+        cache.put('c', 'x' * 4)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size, 8)
+        self.assertNotIn('a', cache)
+
+    def test_replacing_value_updates_size(self):
+        cache = LRUCache(10, get_size=len)
+        cache.put('a', 'x' * 4)
+        cache.put('a', 'x' * 6)
+        self.assertEqual(cache.size, 6)
+        self.assertEqual(len(cache), 1)
+
+    def test_values_larger_than_cache_are_not_cached(self):
+        cache = LRUCache(10, get_size=len)
+        cache.put('a', 'x')
+        cache.put('b', 'x' * 11)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache(10)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 1)
+
+    def test_remove_if(self):
+        cache = LRUCache(10, get_size=len)
+        cache.put(('foo', 1), 'xx')
+        cache.put(('foo', 2), 'xx')
+        cache.put(('bar', 1), 'xx')
+        cache.remove_if(lambda key: key[0] == 'foo')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, 2)
+        self.assertIn(('bar', 1), cache)
+
+    def test_clear(self):
+        cache = LRUCache(10)
+        cache.put('a', 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)